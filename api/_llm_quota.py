@@ -0,0 +1,137 @@
+"""
+Shared Gemini quota debit for the api/ handlers
+
+Live traffic shares the Gemini key with backlog jobs (shared/llm_quota.py,
+migrations/016_llm_quota.sql), in the same two classes:
+
+- interactive (QuotaDebit): single extractions and intent calls. Never
+  waits and is never refused - the call is recorded, possibly pushing the
+  bucket into debt, and batch callers back off from what is left
+- batch (acquire_batch_quota): the voice-extract `transcripts` backfill. Takes
+  only above LLM_QUOTA_BATCH_RESERVE, waits for refill up to
+  LLM_QUOTA_BATCH_MAX_WAIT seconds, then gives up so the handler can answer
+  429 instead of running out its own time limit
+
+Vercel deploys each handler on its own, so they can't import shared/; the
+leading underscore keeps this module from becoming a function itself.
+
+The interactive debit runs on a thread alongside the LLM call it wraps and
+is joined when the call returns, so a cold connect overlaps the model's
+latency instead of adding to it. The join is bounded by LLM_QUOTA_TIMEOUT_MS;
+a debit still running then may be frozen with the instance and finish on
+its next request. It uses a connection kept for the life of the warm
+instance.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+LLM_QUOTA_ENABLED = os.environ.get('LLM_QUOTA_BACKEND', 'postgres') == 'postgres' and bool(os.environ.get('DATABASE_URL'))
+LLM_QUOTA_BUCKET = os.environ.get('LLM_QUOTA_BUCKET', 'gemini')
+LLM_QUOTA_TIMEOUT_MS = int(os.environ.get('LLM_QUOTA_TIMEOUT_MS', '250'))
+LLM_QUOTA_BATCH_RESERVE = float(os.environ.get('LLM_QUOTA_BATCH_RESERVE', '0.3'))
+LLM_QUOTA_BATCH_MAX_WAIT = float(os.environ.get('LLM_QUOTA_BATCH_MAX_WAIT', '20'))
+
+# Longest single sleep before asking again, as in shared/llm_quota.py
+MAX_WAIT_SLICE = 5.0
+
+_conn = None
+# One connection, so concurrent debits (hedged or batched calls) take turns
+_lock = threading.Lock()
+
+
+def _connection():
+    global _conn
+    if _conn is None or _conn.closed:
+        import psycopg2
+
+        _conn = psycopg2.connect(
+            os.environ['DATABASE_URL'],
+            connect_timeout=2,
+            options=f'-c statement_timeout={LLM_QUOTA_TIMEOUT_MS}'
+        )
+        _conn.autocommit = True
+    return _conn
+
+
+def _take(cost: float, floor: float) -> float:
+    """llm_quota_take: 0 once debited, else seconds until floor allows it"""
+    global _conn
+    with _lock:
+        try:
+            with _connection().cursor() as cur:
+                cur.execute("SELECT llm_quota_take(%s, %s, %s)", (LLM_QUOTA_BUCKET, cost, floor))
+                return cur.fetchone()[0]
+        except Exception as e:
+            logger.warning('LLM quota debit failed: %s', e)
+            # Reconnect next time rather than reuse a connection in an unknown state
+            if _conn is not None:
+                _conn.close()
+                _conn = None
+            # An unreachable limiter mustn't stop the caller
+            return 0
+
+
+def debit_llm_quota(cost: float = 1):
+    """Interactive debit of the shared Gemini bucket; a failed debit is logged, never raised"""
+    if LLM_QUOTA_ENABLED:
+        _take(cost, -1)
+
+
+class QuotaDebit:
+    """
+    Interactive debit alongside the call it wraps:
+
+        with QuotaDebit():
+            result = agent.run_sync(prompt)
+
+        async with QuotaDebit():
+            result = await agent.run(prompt)
+    """
+
+    def __init__(self, cost: float = 1):
+        self.cost = cost
+        self.thread = None
+
+    def __enter__(self):
+        if LLM_QUOTA_ENABLED:
+            self.thread = threading.Thread(target=debit_llm_quota, args=(self.cost,), daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.thread is not None:
+            self.thread.join(LLM_QUOTA_TIMEOUT_MS / 1000)
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        if self.thread is not None:
+            await asyncio.to_thread(self.thread.join, LLM_QUOTA_TIMEOUT_MS / 1000)
+
+
+async def acquire_batch_quota(cost: float = 1) -> float:
+    """
+    Batch debit: wait while the bucket is below LLM_QUOTA_BATCH_RESERVE.
+    Returns 0 once debited, or the seconds still to wait if that would pass
+    LLM_QUOTA_BATCH_MAX_WAIT - nothing has been debited then.
+    """
+    if not LLM_QUOTA_ENABLED:
+        return 0
+    deadline = time.monotonic() + LLM_QUOTA_BATCH_MAX_WAIT
+    while True:
+        wait = await asyncio.to_thread(_take, cost, LLM_QUOTA_BATCH_RESERVE)
+        if wait <= 0:
+            return 0
+        remaining = deadline - time.monotonic()
+        if wait > remaining:
+            return wait
+        # Jittered so callers released by the same refill don't all ask at once
+        await asyncio.sleep(min(wait * random.uniform(1.0, 1.2), MAX_WAIT_SLICE, remaining))
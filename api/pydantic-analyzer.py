@@ -4,14 +4,27 @@ Python serverless function using actual Pydantic AI framework
 """
 
 import os
-import json
+import sys
+import logging
 from typing import Optional, Literal
 from pydantic import BaseModel, Field
+from pydantic_core import from_json, to_json
 from pydantic_ai import Agent
 from pydantic_ai.models.gemini import GeminiModel
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+# Serverless: no background writer thread (the instance is frozen between
+# requests), so records are written inline - formatted only when enabled, and
+# transcripts only at DEBUG
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format='[Pydantic AI] %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+# Live traffic shares the Gemini key with backlog jobs: it only records its
+# calls, and batch callers back off from what is left (see _llm_quota.py)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _llm_quota import QuotaDebit
+
 
 class JobSearchIntent(BaseModel):
     """Structured intent extraction using Pydantic"""
@@ -126,7 +139,7 @@ def query_jobs(role_type: Optional[str], location: Optional[str]) -> list[dict]:
         return [dict(job) for job in jobs]
 
     except Exception as e:
-        print(f'[Pydantic AI] DB error: {e}')
+        logger.error('DB error: %s', e)
         return []
 
 
@@ -147,12 +160,12 @@ def handler(request):
 
     try:
         # Parse request body
-        body = json.loads(request.body) if hasattr(request, 'body') else json.loads(request)
+        body = from_json(request.body) if hasattr(request, 'body') else from_json(request)
 
         transcript = body.get('transcript', '')
         user_id = body.get('userId')
 
-        print(f'[Pydantic AI] Analyzing: {transcript[:100]}')
+        logger.debug('Analyzing: %s', transcript[:100])
 
         if not transcript or len(transcript) < 10:
             return {
@@ -161,7 +174,7 @@ def handler(request):
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({
+                'body': to_json({
                     'status': 'no_action',
                     'method': 'pydantic_ai',
                     'intent': {
@@ -169,14 +182,15 @@ def handler(request):
                         'confidence': 0,
                         'reasoning': 'Transcript too short'
                     }
-                })
+                }).decode()
             }
 
         # Use Pydantic AI Agent for intent extraction
-        result = agent.run_sync(f'Analyze this transcript: "{transcript}"')
+        with QuotaDebit():
+            result = agent.run_sync(f'Analyze this transcript: "{transcript}"')
         intent = result.data
 
-        print(f'[Pydantic AI] Intent: {intent.model_dump()}')
+        logger.info('Intent: %s (confidence %.2f)', intent.action, intent.confidence)
 
         # If search_jobs, query database
         if intent.action == 'search_jobs':
@@ -188,10 +202,10 @@ def handler(request):
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({
+                'body': to_json({
                     'status': 'success',
                     'method': 'pydantic_ai',
-                    'intent': intent.model_dump(),
+                    'intent': intent,
                     'data': {
                         'type': 'job_results',
                         'source': 'pydantic_ai',
@@ -206,7 +220,7 @@ def handler(request):
                             'currency': j.get('salary_currency', 'GBP')
                         } for j in jobs]
                     }
-                })
+                }).decode()
             }
 
         # If confirm_preference, return confirmation request
@@ -217,17 +231,17 @@ def handler(request):
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({
+                'body': to_json({
                     'status': 'success',
                     'method': 'pydantic_ai',
-                    'intent': intent.model_dump(),
+                    'intent': intent,
                     'data': {
                         'type': 'confirmation',
                         'source': 'pydantic_ai',
                         'preference_type': intent.preference_type,
                         'values': intent.values
                     }
-                })
+                }).decode()
             }
 
         # Unknown intent
@@ -237,17 +251,15 @@ def handler(request):
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({
+            'body': to_json({
                 'status': 'no_action',
                 'method': 'pydantic_ai',
-                'intent': intent.model_dump()
-            })
+                'intent': intent
+            }).decode()
         }
 
     except Exception as e:
-        print(f'[Pydantic AI] Error: {e}')
-        import traceback
-        traceback.print_exc()
+        logger.exception('Analysis failed: %s', e)
 
         return {
             'statusCode': 500,
@@ -255,8 +267,8 @@ def handler(request):
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({
+            'body': to_json({
                 'error': 'Pydantic AI analysis failed',
                 'details': str(e)
-            })
+            }).decode()
         }
@@ -2,18 +2,36 @@
 Pydantic AI extraction for Fractional.Quest
 Vercel Serverless Function
 
-Tries models in order:
+Routes across every provider with a key set:
 1. OpenAI (if OPENAI_API_KEY set)
 2. Anthropic (if ANTHROPIC_API_KEY set)
 3. Google (if GOOGLE_API_KEY set)
+
+The fastest provider (latency EWMA) is tried first. If it hasn't answered
+by its own p95 latency a hedged request goes to the next provider and the
+first answer wins; errors fail over straight away.
 """
 from http.server import BaseHTTPRequestHandler
-import json
+from collections import deque
 import os
+import sys
+import logging
+import time
 import asyncio
+import contextlib
 from pydantic import BaseModel, Field
+from pydantic_core import from_json, to_json
 from pydantic_ai import Agent
 
+# Written inline: a writer thread would be frozen with the instance between requests
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format='[Pydantic AI] %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+# The google provider shares its key with the backlog classifier - calls are
+# recorded in the shared quota so batch jobs yield (see _llm_quota.py)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _llm_quota import QuotaDebit
+
 
 # Pydantic models for structured output
 class ExtractedPreference(BaseModel):
@@ -29,11 +47,6 @@ class ExtractionResult(BaseModel):
     should_confirm: bool = Field(default=False)
 
 
-# Use Anthropic Claude (user has credit)
-def get_model():
-    return "anthropic:claude-3-haiku-20240307"
-
-
 SYSTEM_PROMPT = """You are a career preference extraction agent for Fractional.Quest.
 
 Extract career preferences from conversation transcripts.
@@ -54,62 +67,237 @@ Set requires_hard_validation=false for:
 
 Only extract EXPLICIT preferences. Set should_confirm=true if any hard validations exist."""
 
-# Create agent lazily to allow environment to be set
-extraction_agent = None
+# Provider order doubles as the tie-break before we have latency samples
+PROVIDERS = [
+    ("openai", "OPENAI_API_KEY", os.environ.get("EXTRACT_OPENAI_MODEL", "openai:gpt-4o-mini")),
+    ("anthropic", "ANTHROPIC_API_KEY", os.environ.get("EXTRACT_ANTHROPIC_MODEL", "anthropic:claude-3-haiku-20240307")),
+    ("google", "GOOGLE_API_KEY", os.environ.get("EXTRACT_GOOGLE_MODEL", "google-gla:gemini-2.0-flash")),
+]
 
-def get_agent():
-    global extraction_agent
-    if extraction_agent is None:
-        model = get_model()
-        print(f"[Pydantic AI] Using model: {model}")
-        extraction_agent = Agent(
-            model=model,
-            output_type=ExtractionResult,
-            system_prompt=SYSTEM_PROMPT
+EWMA_ALPHA = 0.2
+# Hedge deadline before a provider has enough samples for a p95
+DEFAULT_HEDGE_DEADLINE = float(os.environ.get("EXTRACT_HEDGE_DEADLINE", "2.5"))
+MIN_HEDGE_DEADLINE = 0.3
+MAX_HEDGE_DEADLINE = 10.0
+MIN_SAMPLES_FOR_P95 = 10
+MAX_HEDGES = 1
+# A provider that keeps failing sits at the back of the queue for a while
+FAILURE_COOLDOWN = 30.0
+FAILURES_BEFORE_COOLDOWN = 3
+
+
+class ProviderStats:
+    """Latency EWMA, recent samples for p95, and failure streak for one provider"""
+
+    def __init__(self):
+        self.ewma = None
+        self.samples = deque(maxlen=100)
+        self.successes = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.failure_streak = 0
+        self.last_failure = 0.0
+
+    def record_latency(self, seconds: float):
+        self.ewma = seconds if self.ewma is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.ewma
+        self.samples.append(seconds)
+
+    def record_success(self, seconds: float):
+        self.record_latency(seconds)
+        self.successes += 1
+        self.failure_streak = 0
+
+    def record_cancelled(self, seconds: float):
+        """Lost a hedge race - it took at least this long, which still has to count against it"""
+        self.record_latency(seconds)
+        self.cancelled += 1
+
+    def record_failure(self):
+        self.failures += 1
+        self.failure_streak += 1
+        self.last_failure = time.monotonic()
+
+    def cooling_down(self) -> bool:
+        return (
+            self.failure_streak >= FAILURES_BEFORE_COOLDOWN
+            and time.monotonic() - self.last_failure < FAILURE_COOLDOWN
         )
-    return extraction_agent
 
+    def hedge_deadline(self) -> float:
+        if len(self.samples) < MIN_SAMPLES_FOR_P95:
+            return DEFAULT_HEDGE_DEADLINE
+        ordered = sorted(self.samples)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        return min(max(p95, MIN_HEDGE_DEADLINE), MAX_HEDGE_DEADLINE)
+
+    def to_dict(self) -> dict:
+        return {
+            "ewma_ms": round(self.ewma * 1000) if self.ewma is not None else None,
+            "hedge_deadline_ms": round(self.hedge_deadline() * 1000),
+            "successes": self.successes,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+            "cooling_down": self.cooling_down(),
+        }
+
+
+class ModelRouter:
+    """
+    Picks the primary provider by latency EWMA, hedges past its p95 and
+    fails over on errors. Stats live for the life of the (warm) instance.
+    """
+
+    def __init__(self):
+        self.agents: dict[str, Agent] = {}
+        self.stats = {name: ProviderStats() for name, _, _ in PROVIDERS}
+
+    def available(self) -> list[tuple[str, str]]:
+        return [(name, model) for name, env_key, model in PROVIDERS if os.environ.get(env_key)]
+
+    def ranked(self) -> list[tuple[str, str]]:
+        providers = self.available()
+        order = {name: i for i, (name, _) in enumerate(providers)}
+
+        def sort_key(provider):
+            stats = self.stats[provider[0]]
+            # Unmeasured providers keep the documented order, ahead of slow measured ones
+            ewma = stats.ewma if stats.ewma is not None else DEFAULT_HEDGE_DEADLINE / 2
+            return (stats.cooling_down(), ewma, order[provider[0]])
+
+        return sorted(providers, key=sort_key)
+
+    def agent_for(self, name: str, model: str) -> Agent:
+        if name not in self.agents:
+            logger.info("Creating agent for %s", model)
+            self.agents[name] = Agent(
+                model=model,
+                output_type=ExtractionResult,
+                system_prompt=SYSTEM_PROMPT
+            )
+        return self.agents[name]
 
-async def do_extraction(transcript: str) -> dict:
+    async def _run_on(self, name: str, model: str, prompt: str):
+        started = time.monotonic()
+        try:
+            async with QuotaDebit() if name == 'google' else contextlib.nullcontext():
+                result = await self.agent_for(name, model).run(prompt)
+        except asyncio.CancelledError:
+            self.stats[name].record_cancelled(time.monotonic() - started)
+            raise
+        except Exception:
+            self.stats[name].record_failure()
+            raise
+        self.stats[name].record_success(time.monotonic() - started)
+        return result
+
+    async def run(self, prompt: str):
+        candidates = self.ranked()
+        if not candidates:
+            raise RuntimeError("No model provider key set (OPENAI_API_KEY, ANTHROPIC_API_KEY, GOOGLE_API_KEY)")
+
+        pending: dict[asyncio.Task, str] = {}
+        hedges = 0
+        last_error = None
+
+        def launch():
+            name, model = candidates.pop(0)
+            pending[asyncio.ensure_future(self._run_on(name, model, prompt))] = name
+
+        launch()
+        try:
+            while pending:
+                can_hedge = candidates and hedges < MAX_HEDGES
+                primary = next(iter(pending.values()))
+                timeout = self.stats[primary].hedge_deadline() if can_hedge else None
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedges += 1
+                    logger.info("%s past %.2fs, hedging", primary, timeout)
+                    launch()
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning("%s failed: %s", name, last_error)
+
+                if not pending and candidates:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+
+router = ModelRouter()
+
+
+def get_model():
+    """Current primary model - what the next request will try first"""
+    ranked = router.ranked()
+    return ranked[0][1] if ranked else None
+
+
+async def do_extraction(transcript: str) -> dict | BaseModel:
     """Run the extraction"""
     if not transcript.strip():
         return {"preferences": [], "should_confirm": False}
 
     try:
-        agent = get_agent()
-        result = await agent.run(f"Extract preferences from:\n\n{transcript}")
-        # Access output via .output (not .data)
-        return result.output.model_dump()
+        result = await router.run(f"Extract preferences from:\n\n{transcript}")
+        # Access output via .output (not .data); left as a model, to_json() encodes it directly
+        return result.output
     except Exception as e:
-        print(f"[Pydantic AI] Error: {e}")
+        logger.error("Error: %s", e)
         return {"preferences": [], "should_confirm": False, "error": str(e)}
 
 
+BATCH_CONCURRENCY = int(os.environ.get('EXTRACT_BATCH_CONCURRENCY', '4'))
+
+
+async def do_batch_extraction(transcripts: list[dict]) -> dict:
+    """Run extraction for many transcripts with bounded concurrency"""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_one(item: dict):
+        async with semaphore:
+            return str(item.get("id")), await do_extraction(item.get("transcript", ""))
+
+    pairs = await asyncio.gather(*(run_one(item) for item in transcripts))
+    return {"results": dict(pairs)}
+
+
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         # Read request body
         content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
+        body = self.rfile.read(content_length)
 
         try:
-            data = json.loads(body)
-            transcript = data.get("transcript", "")
+            data = from_json(body)
 
-            # Run async extraction
-            result = asyncio.run(do_extraction(transcript))
+            # Run async extraction - { "transcripts": [{id, transcript}] } for batches
+            if "transcripts" in data:
+                result = asyncio.run(do_batch_extraction(data["transcripts"]))
+            else:
+                result = asyncio.run(do_extraction(data.get("transcript", "")))
 
             # Send response
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self.wfile.write(to_json(result))
 
         except Exception as e:
             self.send_response(500)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
+            self.wfile.write(to_json({"error": str(e)}))
 
     def do_GET(self):
         self.send_response(200)
@@ -122,17 +310,18 @@ class handler(BaseHTTPRequestHandler):
         has_anthropic = bool(os.environ.get('ANTHROPIC_API_KEY'))
         has_google = bool(os.environ.get('GOOGLE_API_KEY'))
 
-        self.wfile.write(json.dumps({
+        self.wfile.write(to_json({
             "status": "ok",
             "agent": "pydantic-ai",
-            "version": "v8-output-fix",
+            "version": "v9-model-router",
             "model": model,
+            "providers": {name: stats.to_dict() for name, stats in router.stats.items()},
             "keys": {
                 "openai": has_openai,
                 "anthropic": has_anthropic,
                 "google": has_google
             }
-        }).encode())
+        }))
 
     def do_OPTIONS(self):
         self.send_response(200)
@@ -10,7 +10,13 @@ Extracts career entities from voice transcripts with:
 
 Usage:
     POST /api/pydantic-voice-extract
-    Body: { "transcript": "I'm a CFO with 15 years...", "user_type": "candidate" }
+    Body: { "transcript": "I'm a CFO with 15 years...", "user_type": "candidate",
+            "session_id": "optional - reuses the rolling context window",
+            "context": ["earlier turns..."], "known_entities": ["skills:M&A", ...],
+            "user_id": "optional", "persist": true }
+
+    With persist + user_id the entities are also written through to graph_nodes
+    in a single upsert and the response carries "persisted": <rows>.
 
 Returns:
     {
@@ -19,13 +25,36 @@ Returns:
       "conversation_intent": "building_profile",
       "should_continue": true
     }
+
+Batch (backfills):
+    POST /api/pydantic-voice-extract
+    Body: { "transcripts": [{ "id": "...", "transcript": "...", "user_type": "candidate" }, ...] }
+    Returns: { "results": { "<id>": { "entities": [...], ... } }, "failed": ["<id>", ...] }
 """
 
 from pydantic import BaseModel, Field
+from pydantic_core import from_json, to_json
 from pydantic_ai import Agent
+from collections import OrderedDict, deque
 from enum import Enum
 from typing import Literal, Optional, Any
+import os
 import re
+import json
+import logging
+import math
+import sys
+import time
+import uuid
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format='[Pydantic AI] %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+# Shared Gemini quota (see _llm_quota.py): single extractions are interactive -
+# debited, never waiting - and the transcripts backfill is batch, which waits
+# for the reserve and answers 429 when it can't get it in time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _llm_quota import QuotaDebit, acquire_batch_quota
 
 # ============================================================================
 # SCHEMAS
@@ -105,6 +134,17 @@ class VoiceExtractionResponse(BaseModel):
         description="Whether more conversation is needed"
     )
 
+class TranscriptExtraction(VoiceExtractionResponse):
+    """Extraction result for one transcript inside a packed batch call"""
+    transcript_id: str = Field(..., description="The id given for the transcript in the batch")
+
+class BatchVoiceExtractionResponse(BaseModel):
+    """Packed result for several transcripts in one structured-output call"""
+    results: list[TranscriptExtraction] = Field(
+        default_factory=list,
+        description="One result per transcript, keyed by transcript_id"
+    )
+
 # ============================================================================
 # HARD VALIDATION KEYWORDS
 # ============================================================================
@@ -135,6 +175,174 @@ def detectsHardValidation(text: str) -> bool:
             return True
     return False
 
+# ============================================================================
+# CONTEXT WINDOW
+# ============================================================================
+
+# Token budgets for the "Previous Context" block. Every prompt gets at most
+# RECENT + SUMMARY + ENTITY tokens of context no matter how long the
+# onboarding conversation runs, so per-turn latency stays flat.
+CONTEXT_RECENT_TOKENS = int(os.environ.get('VOICE_CONTEXT_RECENT_TOKENS', '400'))
+CONTEXT_SUMMARY_TOKENS = int(os.environ.get('VOICE_CONTEXT_SUMMARY_TOKENS', '200'))
+CONTEXT_ENTITY_TOKENS = int(os.environ.get('VOICE_CONTEXT_ENTITY_TOKENS', '150'))
+CONTEXT_MAX_SESSIONS = int(os.environ.get('VOICE_CONTEXT_MAX_SESSIONS', '256'))
+
+# Per evicted turn, how much survives into the rolling summary
+SUMMARY_TURN_TOKENS = 30
+
+FILLER_PATTERN = re.compile(
+    r"\b(um+|uh+|erm+|you know|i mean|like|sort of|kind of|basically|actually)\b[,]?\s*",
+    re.IGNORECASE
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token) - no tokenizer on the hot path"""
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, preferring a word boundary"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(' ', 1)[0]
+    return cut + '…'
+
+
+class ContextWindow:
+    """
+    Token-budgeted view of an onboarding conversation.
+
+    - recent: the newest turns verbatim, up to CONTEXT_RECENT_TOKENS
+    - summary: older turns, compressed and folded in as they fall out of
+      `recent`; the oldest compressed turns are dropped once over budget
+    - entities: compact "cluster:value" list of what was already extracted,
+      highest confidence first, capped at CONTEXT_ENTITY_TOKENS
+    """
+
+    def __init__(
+        self,
+        recent_tokens: int = CONTEXT_RECENT_TOKENS,
+        summary_tokens: int = CONTEXT_SUMMARY_TOKENS,
+        entity_tokens: int = CONTEXT_ENTITY_TOKENS
+    ):
+        self.recent_tokens = recent_tokens
+        self.summary_tokens = summary_tokens
+        self.entity_tokens = entity_tokens
+
+        self.recent: deque[str] = deque()
+        self._recent_size = 0
+        self.summary: deque[str] = deque()
+        self._summary_size = 0
+        self.entities: dict[tuple[str, str], tuple[float, str]] = {}
+        self.turns_seen = 0
+
+    def add_turn(self, text: str) -> None:
+        self.turns_seen += 1
+        text = ' '.join(text.split())
+        if not text:
+            return
+
+        # A single oversized turn still has to fit the recent budget
+        text = truncate_to_tokens(text, self.recent_tokens)
+        self.recent.append(text)
+        self._recent_size += estimate_tokens(text)
+
+        while self._recent_size > self.recent_tokens and len(self.recent) > 1:
+            evicted = self.recent.popleft()
+            self._recent_size -= estimate_tokens(evicted)
+            self._fold_into_summary(evicted)
+
+    def _fold_into_summary(self, text: str) -> None:
+        compressed = FILLER_PATTERN.sub('', text).strip()
+        compressed = truncate_to_tokens(compressed, SUMMARY_TURN_TOKENS)
+        if not compressed:
+            return
+        self.summary.append(compressed)
+        self._summary_size += estimate_tokens(compressed)
+
+        while self._summary_size > self.summary_tokens and self.summary:
+            dropped = self.summary.popleft()
+            self._summary_size -= estimate_tokens(dropped)
+
+    def add_entity(self, cluster: str, value: str, confidence: float = 1.0) -> None:
+        key = (cluster, value.strip().lower())
+        if not key[1]:
+            return
+        existing = self.entities.get(key)
+        if existing is None or confidence > existing[0]:
+            self.entities[key] = (confidence, value.strip())
+
+    def add_known_entity(self, label: str) -> None:
+        """Accept client-supplied "cluster:value" labels (or bare values)"""
+        cluster, sep, value = label.partition(':')
+        if not sep:
+            cluster, value = 'unknown', label
+        self.add_entity(cluster.strip(), value)
+
+    def _entity_block(self) -> str:
+        ranked = sorted(self.entities.items(), key=lambda item: -item[1][0])
+        labels = []
+        size = 0
+        for (cluster, _), (_, value) in ranked:
+            label = f"{cluster}:{value}"
+            cost = estimate_tokens(label) + 1
+            if size + cost > self.entity_tokens:
+                break
+            labels.append(label)
+            size += cost
+        return ', '.join(labels)
+
+    def render(self) -> str:
+        """Render the context block for the prompt - bounded by the budgets above"""
+        parts = []
+        if self.summary:
+            parts.append(f"Earlier (summarised): {' | '.join(self.summary)}")
+        if self.recent:
+            parts.append(f"Recent turns: {' | '.join(self.recent)}")
+        entities = self._entity_block()
+        if entities:
+            parts.append(f"Already extracted: {entities}")
+        return '\n'.join(parts) if parts else 'None'
+
+
+# Windows survive between invocations on a warm instance, so a session only
+# folds in the turns it hasn't seen yet instead of re-reading the whole history
+_context_windows: OrderedDict[str, ContextWindow] = OrderedDict()
+
+
+def get_context_window(
+    session_id: Optional[str],
+    context: list[str],
+    known_entities: list[str]
+) -> ContextWindow:
+    """Return the (possibly cached) context window for a request"""
+    window = None
+    if session_id:
+        window = _context_windows.get(session_id)
+        if window is not None:
+            _context_windows.move_to_end(session_id)
+            # Client history shorter than what we've seen means a new conversation
+            if len(context) < window.turns_seen:
+                window = None
+
+    if window is None:
+        window = ContextWindow()
+        if session_id:
+            _context_windows[session_id] = window
+            while len(_context_windows) > CONTEXT_MAX_SESSIONS:
+                _context_windows.popitem(last=False)
+
+    for turn in context[window.turns_seen:]:
+        window.add_turn(turn)
+
+    for label in known_entities:
+        window.add_known_entity(label)
+
+    return window
+
+
 # ============================================================================
 # PYDANTIC AI AGENT
 # ============================================================================
@@ -200,6 +408,225 @@ agent = Agent(
     system_prompt=EXTRACTION_PROMPT
 )
 
+# Packs several transcripts into one call for backfills
+BATCH_PROMPT = EXTRACTION_PROMPT + """
+
+Batch Mode:
+You will receive several transcripts, each introduced by "### Transcript <id>".
+Treat every transcript independently - never carry entities across transcripts.
+Return exactly one result per transcript with transcript_id set to its <id>."""
+
+batch_agent = Agent(
+    model="google-gla:gemini-2.0-flash",
+    output_type=BatchVoiceExtractionResponse,
+    system_prompt=BATCH_PROMPT
+)
+
+# ============================================================================
+# BATCH EXTRACTION
+# ============================================================================
+
+BATCH_PACK_SIZE = int(os.environ.get('VOICE_BATCH_PACK_SIZE', '8'))
+BATCH_PACK_TOKENS = int(os.environ.get('VOICE_BATCH_PACK_TOKENS', '6000'))
+BATCH_CONCURRENCY = int(os.environ.get('VOICE_BATCH_CONCURRENCY', '4'))
+
+
+def postprocess_extraction(extraction: VoiceExtractionResponse) -> VoiceExtractionResponse:
+    """Add regex hard-validation detection on top of the model's flags"""
+    for entity in extraction.entities:
+        if not entity.requires_hard_validation:
+            entity.requires_hard_validation = detectsHardValidation(entity.raw_text)
+    return extraction
+
+
+def pack_transcripts(
+    items: list[dict],
+    pack_size: int = BATCH_PACK_SIZE,
+    pack_tokens: int = BATCH_PACK_TOKENS
+) -> list[list[dict]]:
+    """Group transcripts into packs bounded by count and estimated tokens"""
+    packs: list[list[dict]] = []
+    current: list[dict] = []
+    current_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(item['transcript'])
+        if current and (len(current) >= pack_size or current_tokens + tokens > pack_tokens):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+async def extract_one(item: dict) -> VoiceExtractionResponse:
+    prompt = f"""Transcript: "{item['transcript']}"
+User Type: {item.get('user_type', 'unknown')}
+Previous Context:
+None
+
+Extract all career entities from this transcript."""
+    result = await agent.run(prompt)
+    return postprocess_extraction(result.output)
+
+
+async def extract_pack(pack: list[dict]) -> dict[str, VoiceExtractionResponse]:
+    """One structured-output call for the whole pack"""
+    sections = [
+        f"### Transcript {item['id']}\nUser Type: {item.get('user_type', 'unknown')}\n\"{item['transcript']}\""
+        for item in pack
+    ]
+    result = await batch_agent.run(
+        "Extract all career entities from each transcript below.\n\n" + '\n\n'.join(sections)
+    )
+    wanted = {item['id'] for item in pack}
+    extracted = {}
+    for packed in result.output.results:
+        if packed.transcript_id in wanted:
+            extracted[packed.transcript_id] = postprocess_extraction(
+                VoiceExtractionResponse.model_validate(packed.model_dump(exclude={'transcript_id'}))
+            )
+    return extracted
+
+
+async def extract_batch(
+    items: list[dict],
+    pack_size: int = BATCH_PACK_SIZE,
+    concurrency: int = BATCH_CONCURRENCY
+) -> tuple[dict[str, VoiceExtractionResponse], list[str]]:
+    """
+    Extract entities for many transcripts.
+
+    items: [{ "id": str, "transcript": str, "user_type": str }]
+    pack_size > 1 packs transcripts into shared calls; pack_size == 1 fans out
+    one call per transcript. Either way at most `concurrency` calls are in
+    flight. Transcripts a packed call drops or garbles are retried on their own.
+
+    Returns (results keyed by id, ids that failed).
+    """
+    import asyncio
+
+    semaphore = asyncio.Semaphore(concurrency)
+    results: dict[str, VoiceExtractionResponse] = {}
+    failed: list[str] = []
+
+    async def run_single(item: dict):
+        async with semaphore:
+            try:
+                results[item['id']] = await extract_one(item)
+            except Exception as e:
+                logger.warning("Batch item %s failed: %s", item['id'], e)
+                failed.append(item['id'])
+
+    async def run_pack(pack: list[dict]):
+        if len(pack) == 1:
+            await run_single(pack[0])
+            return
+        async with semaphore:
+            try:
+                extracted = await extract_pack(pack)
+            except Exception as e:
+                logger.warning("Packed call of %d failed, retrying singly: %s", len(pack), e)
+                extracted = {}
+        results.update(extracted)
+        await asyncio.gather(*(run_single(item) for item in pack if item['id'] not in extracted))
+
+    items = [item for item in items if item.get('transcript', '').strip()]
+    await asyncio.gather(*(run_pack(pack) for pack in pack_transcripts(items, pack_size)))
+    return results, failed
+
+# ============================================================================
+# GRAPH PERSISTENCE (write-through)
+# ============================================================================
+
+# One round-trip per response: ON CONFLICT can't touch the same row twice in a
+# statement, so entities are deduped before they get here. On conflict the
+# metadata is merged, with the higher-confidence side winning key collisions.
+GRAPH_NODES_UPSERT_SQL = """
+    INSERT INTO graph_nodes (id, user_id, label, cluster, value, metadata, validated, created_at, updated_at)
+    SELECT id, user_id, label, cluster, value, metadata::jsonb, false, NOW(), NOW()
+    FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[], %s::text[], %s::text[])
+        AS t(id, user_id, label, cluster, value, metadata)
+    ON CONFLICT (user_id, cluster, LOWER(value))
+    DO UPDATE SET
+        metadata = CASE
+            WHEN COALESCE((EXCLUDED.metadata->>'confidence')::float, 0)
+                 >= COALESCE((graph_nodes.metadata->>'confidence')::float, 0)
+            THEN graph_nodes.metadata || EXCLUDED.metadata
+            ELSE EXCLUDED.metadata || graph_nodes.metadata
+        END,
+        updated_at = NOW()
+"""
+
+
+def dedupe_entities(entities: list[ExtractedEntity]) -> list[dict]:
+    """
+    Collapse entities to one node per (cluster, lower(value)).
+
+    The max-confidence entity supplies value/rawText/confidence; metadata
+    from the others is kept where it doesn't collide.
+    """
+    nodes: dict[tuple[str, str], dict] = {}
+    for entity in entities:
+        value = entity.value.strip()
+        if not value:
+            continue
+        metadata = {
+            'entityType': entity.entity_type.value,
+            'confidence': entity.confidence,
+            'rawText': entity.raw_text,
+            **entity.metadata,
+        }
+        key = (entity.cluster.value, value.lower())
+        existing = nodes.get(key)
+        if existing is None:
+            nodes[key] = {'cluster': entity.cluster.value, 'value': value,
+                          'confidence': entity.confidence, 'metadata': metadata}
+        elif entity.confidence > existing['confidence']:
+            existing.update(value=value, confidence=entity.confidence,
+                            metadata={**existing['metadata'], **metadata})
+        else:
+            existing['metadata'] = {**metadata, **existing['metadata']}
+    return list(nodes.values())
+
+
+def graph_node_rows(user_id: str, entities: list[ExtractedEntity]) -> list[tuple]:
+    """(id, user_id, label, cluster, value, metadata) rows, ids in the app's format"""
+    now_ms = int(time.time() * 1000)
+    return [
+        (
+            f"{node['cluster']}-{'-'.join(node['value'].lower().split())}-{now_ms}-{uuid.uuid4().hex[:9]}",
+            user_id, node['value'], node['cluster'], node['value'], json.dumps(node['metadata'])
+        )
+        for node in dedupe_entities(entities)
+    ]
+
+
+def upsert_graph_nodes(conn, rows: list[tuple]) -> int:
+    """Write rows in one statement; caller commits. Rows must be unique per (user, cluster, lower(value))"""
+    if not rows:
+        return 0
+    with conn.cursor() as cur:
+        cur.execute(GRAPH_NODES_UPSERT_SQL, [list(col) for col in zip(*rows)])
+        return cur.rowcount
+
+
+def persist_extraction(user_id: str, extraction: VoiceExtractionResponse) -> int:
+    """Write-through a whole response to graph_nodes with one round-trip"""
+    import psycopg2
+
+    rows = graph_node_rows(user_id, extraction.entities)
+    if not rows:
+        return 0
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        written = upsert_graph_nodes(conn, rows)
+        conn.commit()
+        return written
+    finally:
+        conn.close()
+
 # ============================================================================
 # MAIN HANDLER
 # ============================================================================
@@ -208,55 +635,114 @@ async def handler(request):
     """
     Main Vercel serverless handler
 
-    POST body: { "transcript": str, "user_type": "candidate" | "client" | "unknown" }
+    POST body: { "transcript": str, "user_type": "candidate" | "client" | "unknown",
+                 "user_id": str, "persist": bool }
+           or  { "transcripts": [{ "id": str, "transcript": str, "user_type": str }] }
     """
-    import json
-
     # Parse request
-    body = await request.json() if hasattr(request, 'json') else json.loads(request.body)
+    body = await request.json() if hasattr(request, 'json') else from_json(request.body)
+
+    if 'transcripts' in body:
+        return await batch_handler(body)
+
     transcript = body.get('transcript', '')
     user_type = body.get('user_type', 'unknown')
     context = body.get('context', [])  # Previous conversation for context
+    session_id = body.get('session_id')
+    known_entities = body.get('known_entities', [])
 
     if not transcript or len(transcript.strip()) < 5:
         return {
             'statusCode': 400,
-            'body': json.dumps({'error': 'Transcript too short or empty'})
+            'body': to_json({'error': 'Transcript too short or empty'}).decode()
         }
 
-    # Build prompt with context
+    # Build prompt with a bounded context window
+    window = get_context_window(session_id, context, known_entities)
     prompt = f"""Transcript: "{transcript}"
 User Type: {user_type}
-Previous Context: {', '.join(context) if context else 'None'}
+Previous Context:
+{window.render()}
 
 Extract all career entities from this transcript."""
 
     try:
         # Run Pydantic AI extraction
-        result = await agent.run(prompt)
+        async with QuotaDebit():
+            result = await agent.run(prompt)
         extraction = result.output
 
         # Post-process: Add hard validation detection
+        postprocess_extraction(extraction)
         for entity in extraction.entities:
-            if not entity.requires_hard_validation:
-                entity.requires_hard_validation = detectsHardValidation(entity.raw_text)
+            window.add_entity(entity.cluster.value, entity.value, entity.confidence)
+
+        # Serialized straight from the model unless the write-through result is added
+        response = extraction
+        if body.get('persist') and body.get('user_id'):
+            response = extraction.model_dump()
+            try:
+                response['persisted'] = persist_extraction(str(body['user_id']), extraction)
+            except Exception as e:
+                # The extraction is still useful to the caller; it can fall back to its own writes
+                logger.warning("graph_nodes write-through failed: %s", e)
+                response['persisted'] = None
 
         # Return structured response
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps(extraction.model_dump())
+            'body': to_json(response).decode()
         }
 
     except Exception as e:
-        print(f"[Pydantic AI] Extraction error: {e}")
+        logger.error("Extraction error: %s", e)
         return {
             'statusCode': 500,
-            'body': json.dumps({
+            'body': to_json({
                 'error': 'Extraction failed',
                 'details': str(e)
-            })
+            }).decode()
+        }
+
+
+async def batch_handler(body: dict):
+    """Batch variant of the handler for backfills"""
+    items = [
+        {
+            'id': str(item.get('id', i)),
+            'transcript': item.get('transcript', ''),
+            'user_type': item.get('user_type', 'unknown')
         }
+        for i, item in enumerate(body.get('transcripts') or [])
+    ]
+    if not items:
+        return {
+            'statusCode': 400,
+            'body': to_json({'error': 'No transcripts provided'}).decode()
+        }
+
+    pack_size = int(body.get('pack_size', BATCH_PACK_SIZE))
+    retry_after = await acquire_batch_quota(math.ceil(len(items) / max(pack_size, 1)))
+    if retry_after:
+        return {
+            'statusCode': 429,
+            'headers': {'Retry-After': str(math.ceil(retry_after))},
+            'body': to_json({'error': 'Gemini quota reserved for live traffic, retry later'}).decode()
+        }
+    results, failed = await extract_batch(
+        items,
+        pack_size=pack_size,
+        concurrency=int(body.get('concurrency', BATCH_CONCURRENCY))
+    )
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': to_json({
+            'results': results,
+            'failed': failed
+        }).decode()
+    }
 
 # ============================================================================
 # VERCEL EXPORT
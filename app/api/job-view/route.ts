@@ -17,23 +17,8 @@ export async function POST(request: NextRequest) {
       VALUES (${jobId}, ${userId || null}, ${sessionId || null}, ${referrer || null}, ${deviceType || null})
     `
 
-    // Update aggregated counts (quick update for this job only)
-    await sql`
-      INSERT INTO job_view_counts (job_id, total_views, views_last_7_days, views_last_24_hours, last_updated)
-      SELECT
-        ${jobId},
-        COUNT(*),
-        COUNT(*) FILTER (WHERE viewed_at > NOW() - INTERVAL '7 days'),
-        COUNT(*) FILTER (WHERE viewed_at > NOW() - INTERVAL '24 hours'),
-        NOW()
-      FROM job_views
-      WHERE job_id = ${jobId}
-      ON CONFLICT (job_id) DO UPDATE SET
-        total_views = EXCLUDED.total_views,
-        views_last_7_days = EXCLUDED.views_last_7_days,
-        views_last_24_hours = EXCLUDED.views_last_24_hours,
-        last_updated = NOW()
-    `
+    // job_view_counts is maintained incrementally by services/view-rollup -
+    // recounting this job's full history on every view doesn't scale
 
     return NextResponse.json({ success: true })
   } catch (error) {
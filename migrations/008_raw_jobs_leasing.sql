@@ -0,0 +1,16 @@
+-- Migration: Lease-based claiming of raw_jobs for parallel classifier workers
+-- Date: 2026-10-19
+-- Description: classify_jobs.py workers claim pending rows with FOR UPDATE SKIP LOCKED
+-- and hold them for a lease; expired leases are returned to 'pending' by the reaper.
+
+ALTER TABLE raw_jobs ADD COLUMN IF NOT EXISTS lease_until TIMESTAMPTZ;
+ALTER TABLE raw_jobs ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+
+-- Reaper scan: only rows currently leased
+CREATE INDEX IF NOT EXISTS idx_raw_jobs_lease_until
+  ON raw_jobs(lease_until)
+  WHERE processing_status = 'in_progress';
+
+-- Comments
+COMMENT ON COLUMN raw_jobs.lease_until IS 'When an in_progress claim expires and the row may be reclaimed';
+COMMENT ON COLUMN raw_jobs.claimed_by IS 'Worker id (host:pid) holding the current lease';
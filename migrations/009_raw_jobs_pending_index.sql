@@ -0,0 +1,22 @@
+-- Migration: Partial indexes for the pending raw_jobs claim
+-- Date: 2026-10-19
+-- Description: classify_jobs.py claims rows WHERE processing_status = 'pending'
+-- [AND source = ?] ORDER BY received_at DESC. Processed rows are never deleted, so
+-- indexing only the pending slice keeps the claim cost tied to the backlog size,
+-- not to the size of raw_jobs.
+-- CONCURRENTLY avoids blocking Apify inserts while the index builds; run these
+-- statements outside a transaction.
+
+-- Claims filtered by source (--source linkedin)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_raw_jobs_pending_source_received
+  ON raw_jobs(source, received_at DESC)
+  WHERE processing_status = 'pending';
+
+-- Claims across all sources
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_raw_jobs_pending_received
+  ON raw_jobs(received_at DESC)
+  WHERE processing_status = 'pending';
+
+-- Comments
+COMMENT ON INDEX idx_raw_jobs_pending_source_received IS 'Pending-only claim index for classify_jobs.py --source';
+COMMENT ON INDEX idx_raw_jobs_pending_received IS 'Pending-only claim index for classify_jobs.py across all sources';
@@ -0,0 +1,26 @@
+-- Incremental job_view_counts rollup (services/view-rollup/worker.py)
+-- update_job_view_counts() rescans all of job_views on every run; the worker
+-- instead folds only views past a high-water mark into hourly buckets and
+-- refreshes the 7-day / 24-hour windows from those buckets.
+
+-- Hourly partial aggregates; only the last 7 days are kept
+CREATE TABLE IF NOT EXISTS job_view_buckets (
+  job_id INTEGER NOT NULL,
+  bucket TIMESTAMP WITH TIME ZONE NOT NULL,  -- date_trunc('hour', viewed_at)
+  views INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (job_id, bucket)
+);
+
+-- Window expiry and pruning scan by bucket time
+CREATE INDEX IF NOT EXISTS idx_job_view_buckets_bucket ON job_view_buckets(bucket);
+
+-- Single-row worker state; the row lock also keeps two workers from folding at once
+CREATE TABLE IF NOT EXISTS job_view_rollup_state (
+  id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+  last_view_id BIGINT NOT NULL DEFAULT 0,  -- highest job_views.id folded in
+  windows_as_of TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),  -- last window refresh
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE job_view_buckets IS 'Hourly job view counts for the last 7 days, maintained by the view rollup worker';
+COMMENT ON TABLE job_view_rollup_state IS 'High-water mark of the view rollup worker; absent until it bootstraps';
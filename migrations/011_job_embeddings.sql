@@ -0,0 +1,14 @@
+-- Job vectors for scripts/job_matching.py, written by classify_jobs.py
+-- Stored as raw float32 bytes - the index build reads them straight into a
+-- NumPy matrix, no extension needed
+CREATE TABLE IF NOT EXISTS job_embeddings (
+  job_id INTEGER PRIMARY KEY,
+  model TEXT NOT NULL,  -- embedder that produced the vector, e.g. hashing-v1-256
+  dim INTEGER NOT NULL,
+  embedding BYTEA NOT NULL,  -- dim little-endian float32s, L2-normalized
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_embeddings_model ON job_embeddings(model);
+
+COMMENT ON TABLE job_embeddings IS 'Per-job matching vectors; the in-memory index is built from the active rows';
@@ -0,0 +1,67 @@
+-- Precomputed candidate -> job matches (scripts/materialize_matches.py)
+-- Dashboards read a user's matches with one index range scan:
+--   SELECT job_id, score FROM candidate_job_matches WHERE user_id = $1 ORDER BY score DESC
+
+CREATE TABLE IF NOT EXISTS candidate_job_matches (
+  user_id TEXT NOT NULL,  -- graph_nodes.user_id
+  job_id INTEGER NOT NULL,
+  score REAL NOT NULL,
+  computed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (user_id, job_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_candidate_job_matches_user_score
+  ON candidate_job_matches(user_id, score DESC);
+
+-- Candidate vectors, kept so new jobs can be scored against every candidate
+-- without re-embedding anyone
+CREATE TABLE IF NOT EXISTS candidate_embeddings (
+  user_id TEXT PRIMARY KEY,
+  model TEXT NOT NULL,
+  dim INTEGER NOT NULL,
+  embedding BYTEA NOT NULL,  -- dim float32s, L2-normalized
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Work queues, drained with DELETE ... RETURNING in the transaction that
+-- writes the results - a crash just leaves the work queued
+CREATE TABLE IF NOT EXISTS match_user_queue (
+  user_id TEXT PRIMARY KEY,
+  queued_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS match_job_queue (
+  job_id INTEGER PRIMARY KEY,  -- filled by classify_jobs.py with each embedding
+  queued_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Any change to a user's graph queues them for a refresh
+CREATE OR REPLACE FUNCTION queue_match_refresh_graph() RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO match_user_queue (user_id)
+  VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.user_id ELSE NEW.user_id END)
+  ON CONFLICT (user_id) DO NOTHING;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_graph_nodes_match_refresh ON graph_nodes;
+CREATE TRIGGER trg_graph_nodes_match_refresh
+  AFTER INSERT OR UPDATE OF value, cluster, metadata OR DELETE ON graph_nodes
+  FOR EACH ROW EXECUTE FUNCTION queue_match_refresh_graph();
+
+CREATE OR REPLACE FUNCTION queue_match_refresh_profile() RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO match_user_queue (user_id)
+  VALUES (NEW.user_id::text)
+  ON CONFLICT (user_id) DO NOTHING;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_candidate_profiles_match_refresh ON candidate_profiles;
+CREATE TRIGGER trg_candidate_profiles_match_refresh
+  AFTER INSERT OR UPDATE OF headline, role_categories, industries, specialisms ON candidate_profiles
+  FOR EACH ROW EXECUTE FUNCTION queue_match_refresh_profile();
+
+COMMENT ON TABLE candidate_job_matches IS 'Top-N active jobs per candidate, maintained incrementally by materialize_matches.py';
@@ -0,0 +1,26 @@
+-- Near-duplicate postings across scrape sources (scripts/job_dedupe.py)
+-- classify_jobs.py fingerprints every job it claims; a job whose MinHash
+-- signature is close enough to an indexed canonical reuses its output
+-- instead of another round of LLM calls
+
+CREATE TABLE IF NOT EXISTS job_fingerprints (
+  raw_id UUID PRIMARY KEY,  -- raw_jobs.id
+  signature BYTEA NOT NULL,  -- MinHash, 64 little-endian uint32s
+  canonical_raw_id UUID,  -- NULL for canonical postings
+  similarity REAL,  -- estimated Jaccard similarity to the canonical
+  structured JSONB,  -- canonical's classification (+ editorial), reused by its duplicates
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_fingerprints_canonical
+  ON job_fingerprints(canonical_raw_id)
+  WHERE canonical_raw_id IS NOT NULL;
+
+-- LSH bands of canonical signatures: candidates are the postings sharing a band
+CREATE TABLE IF NOT EXISTS job_fingerprint_bands (
+  band_key BIGINT NOT NULL,  -- band number << 32 | crc32 of the band's rows
+  raw_id UUID NOT NULL,
+  PRIMARY KEY (band_key, raw_id)
+);
+
+COMMENT ON TABLE job_fingerprints IS 'MinHash signature per classified raw job; duplicates link to their canonical posting';
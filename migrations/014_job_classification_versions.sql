@@ -0,0 +1,14 @@
+-- Prompt/schema version stamps for classify_jobs.py
+-- CLASSIFIER_VERSION / EDITORIAL_VERSION hash each tier's system prompt and
+-- output schema; `classify_jobs.py --reclassify-stale` re-runs only the tier
+-- whose stamp is outdated
+
+CREATE TABLE IF NOT EXISTS job_classification_versions (
+  job_id INTEGER PRIMARY KEY,
+  classifier_version TEXT NOT NULL,
+  editorial_version TEXT,  -- NULL when the job was only classified
+  classification JSONB NOT NULL,  -- tier-1 fields, the input to an editorial-only refresh
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE job_classification_versions IS 'Which prompt versions produced each job''s classification and editorial columns';
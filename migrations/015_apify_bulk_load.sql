@@ -0,0 +1,34 @@
+-- Bulk ingestion of Apify datasets (services/apify-sync/bulk_load.py)
+-- Pages are COPYed (binary) into an unlogged staging table, then merged into
+-- jobs and raw_jobs by one set-based statement
+
+CREATE UNLOGGED TABLE IF NOT EXISTS apify_staging (
+  load_id UUID NOT NULL,  -- one per page; concurrent loads never see each other's rows
+  source TEXT NOT NULL,
+  source_id TEXT NOT NULL,
+  source_url TEXT,
+  title TEXT,
+  company_name TEXT,
+  location TEXT,
+  is_remote BOOLEAN,
+  compensation TEXT,
+  posted_date TIMESTAMPTZ,
+  description TEXT,
+  raw_data JSONB NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_apify_staging_load ON apify_staging(load_id);
+
+-- Merge targets. Both fail to build if duplicates already exist - dedupe
+-- those rows first (keep the newest). To find them:
+--   SELECT source, source_id, COUNT(*) FROM raw_jobs GROUP BY 1, 2 HAVING COUNT(*) > 1;
+--   SELECT source_url, COUNT(*) FROM jobs WHERE source_url IS NOT NULL GROUP BY 1 HAVING COUNT(*) > 1;
+-- apify-sync only uses the bulk path once APIFY_BULK_LOAD=true is set
+CREATE UNIQUE INDEX IF NOT EXISTS idx_raw_jobs_source_source_id
+  ON raw_jobs(source, source_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_source_url
+  ON jobs(source_url)
+  WHERE source_url IS NOT NULL;
+
+COMMENT ON TABLE apify_staging IS 'Transient COPY target for apify-sync bulk loads; rows are deleted by the merge that consumes them';
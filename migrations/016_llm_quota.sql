@@ -0,0 +1,56 @@
+-- Shared LLM rate limiting (shared/llm_quota.py)
+-- One token bucket per provider key; classify_jobs, the voice backfill,
+-- repo-agent and the api/ handlers all draw from it, interactive callers
+-- ahead of batch ones
+
+CREATE TABLE IF NOT EXISTS llm_quota_buckets (
+  bucket TEXT PRIMARY KEY,
+  capacity DOUBLE PRECISION NOT NULL,  -- burst size, in requests
+  refill_per_second DOUBLE PRECISION NOT NULL,  -- sustained rate the key allows
+  tokens DOUBLE PRECISION NOT NULL,  -- level at updated_at; negative while interactive traffic is in debt
+  updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT clock_timestamp()
+);
+
+-- ~1000 RPM on the shared Gemini key; lower refill_per_second to match the key's tier
+INSERT INTO llm_quota_buckets (bucket, capacity, refill_per_second, tokens)
+VALUES ('gemini', 100, 16, 100)
+ON CONFLICT (bucket) DO NOTHING;
+
+-- Debit p_cost if the bucket stays at or above p_floor * capacity; returns 0
+-- when taken, else the seconds until it could be. Unknown buckets are unlimited
+CREATE OR REPLACE FUNCTION llm_quota_take(p_bucket TEXT, p_cost DOUBLE PRECISION, p_floor DOUBLE PRECISION)
+RETURNS DOUBLE PRECISION AS $$
+DECLARE
+  b llm_quota_buckets%ROWTYPE;
+  level DOUBLE PRECISION;
+BEGIN
+  SELECT * INTO b FROM llm_quota_buckets WHERE bucket = p_bucket FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN 0;
+  END IF;
+
+  level := LEAST(b.capacity, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * b.refill_per_second);
+  IF level - p_cost < p_floor * b.capacity THEN
+    RETURN (p_floor * b.capacity + p_cost - level) / b.refill_per_second;
+  END IF;
+
+  UPDATE llm_quota_buckets
+  SET tokens = level - p_cost, updated_at = clock_timestamp()
+  WHERE bucket = p_bucket;
+  RETURN 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- After a 429: at most -(p_seconds of refill), so batch callers wait it out
+CREATE OR REPLACE FUNCTION llm_quota_penalize(p_bucket TEXT, p_seconds DOUBLE PRECISION)
+RETURNS VOID AS $$
+  UPDATE llm_quota_buckets
+  SET tokens = LEAST(
+        LEAST(capacity, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * refill_per_second),
+        -p_seconds * refill_per_second
+      ),
+      updated_at = clock_timestamp()
+  WHERE bucket = p_bucket;
+$$ LANGUAGE sql;
+
+COMMENT ON TABLE llm_quota_buckets IS 'Token buckets shared by every process calling an LLM provider key; see shared/llm_quota.py';
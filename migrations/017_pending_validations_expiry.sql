@@ -0,0 +1,14 @@
+-- Expiry of pending validations (repo-agent/validation_expiry.py)
+-- repo-agent writes its validation requests with an expires_at and flips
+-- them to 'expired' from an in-process timer wheel, in batched updates
+
+ALTER TABLE pending_validations ADD COLUMN IF NOT EXISTS expires_at TIMESTAMPTZ;  -- NULL: never expires
+
+ALTER TABLE pending_validations DROP CONSTRAINT IF EXISTS pending_validations_status_check;
+ALTER TABLE pending_validations ADD CONSTRAINT pending_validations_status_check
+  CHECK (status IN ('pending', 'confirmed', 'rejected', 'expired'));
+
+-- Startup recovery only looks at pending rows that can expire
+CREATE INDEX IF NOT EXISTS idx_pending_validations_expires
+  ON pending_validations(expires_at)
+  WHERE status = 'pending' AND expires_at IS NOT NULL;
@@ -5,17 +5,37 @@ Deploy on Railway:
 1. Connect this repo-agent folder to Railway
 2. Set environment variables: GOOGLE_API_KEY, DATABASE_URL
 3. Railway auto-detects Python and runs uvicorn
+4. The build needs the repo-root shared/ package alongside this folder
+5. Run exactly one process: one replica, one uvicorn worker (no --workers,
+   no gunicorn). Live validation requests - their expiry timers and the
+   GET /validations/{user_id} index - live in that process's memory
+   (validation_expiry.py), so a confirmation handled by another worker
+   would neither cancel the timer nor leave that worker's index
+
+Prometheus metrics are served at GET /metrics.
 """
+import asyncio
+import logging
 import os
+import sys
 import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic_ai import Agent
 from dotenv import load_dotenv
 
+# shared/ lives at the repo root, next to this folder
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from shared.fast_json import FastJSONResponse, use_fast_json
+from shared.instrumentation import instrument_agent, instrument_app
+from shared.llm_quota import limit_agent
+from shared.structured_logging import configure_logging
+
 from models import (
     ExtractedPreference,
     ExtractionRequest,
@@ -25,14 +45,38 @@ from models import (
     ValidationRequest,
     ValidationType,
 )
+from validation_expiry import close_pool, recover, run_expiry, save_validations, tracker
 
 load_dotenv()
 
+configure_logging("repo-agent")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Expire validation requests for the life of the app (validation_expiry.py)"""
+    expiry = None
+    if os.environ.get("DATABASE_URL"):
+        try:
+            await recover()
+        except Exception as e:
+            logger.warning("Validation recovery failed: %s", e)
+        expiry = asyncio.create_task(run_expiry())
+    yield
+    if expiry:
+        expiry.cancel()
+    await close_pool()
+
+
 app = FastAPI(
     title="Repo Agent",
     description="Pydantic AI agent for career preference extraction",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+instrument_app(app, service="repo-agent")
+use_fast_json(app)
 
 # CORS
 app.add_middleware(
@@ -76,6 +120,8 @@ Only extract EXPLICIT preferences, not inferred ones.
 Return empty list if nothing clear.
 """
 )
+instrument_agent(extraction_agent, "extraction")
+limit_agent(extraction_agent, "interactive")
 
 
 def create_validation_request(pref: ExtractedPreference) -> ValidationRequest:
@@ -102,15 +148,17 @@ def create_validation_request(pref: ExtractedPreference) -> ValidationRequest:
     )
 
 
-@app.post("/extract", response_model=ExtractionResponse)
-async def extract_preferences(request: ExtractionRequest):
+# response_model=None: the model is encoded once by FastJSONResponse rather than
+# re-validated and dumped by FastAPI; responses= keeps it in the OpenAPI schema
+@app.post("/extract", response_model=None, responses={200: {"model": ExtractionResponse}})
+async def extract_preferences(request: ExtractionRequest, background_tasks: BackgroundTasks) -> FastJSONResponse:
     """Extract career preferences using Pydantic AI + Gemini"""
     if not request.transcript or not request.transcript.strip():
-        return ExtractionResponse(
+        return FastJSONResponse(ExtractionResponse(
             preferences=[],
             validation_requests=[],
             should_confirm=False
-        )
+        ))
 
     try:
         context_str = ""
@@ -124,20 +172,22 @@ async def extract_preferences(request: ExtractionRequest):
         preferences = result.data
         validation_requests = [create_validation_request(p) for p in preferences]
         should_confirm = any(v.validation_type == ValidationType.HARD for v in validation_requests)
+        if request.user_id and validation_requests and os.environ.get("DATABASE_URL"):
+            background_tasks.add_task(save_validations, request.user_id, validation_requests)
 
-        return ExtractionResponse(
+        return FastJSONResponse(ExtractionResponse(
             preferences=preferences,
             validation_requests=validation_requests,
             should_confirm=should_confirm
-        )
+        ))
 
     except Exception as e:
-        print(f"[Repo Agent] Error: {e}")
-        return ExtractionResponse(
+        logger.error("Extraction error: %s", e)
+        return FastJSONResponse(ExtractionResponse(
             preferences=[],
             validation_requests=[],
             should_confirm=False
-        )
+        ))
 
 
 @app.post("/validate")
@@ -163,6 +213,13 @@ async def validate_preference(request: SavePreferenceRequest):
 
         internal_user_id = user_row["id"]
 
+        if request.validation_id:
+            tracker.resolve(request.validation_id)
+            await conn.execute("""
+                UPDATE pending_validations SET status = 'confirmed', completed_at = NOW()
+                WHERE id = $1 AND status = 'pending'
+            """, request.validation_id)
+
         await conn.execute("""
             CREATE TABLE IF NOT EXISTS user_repo_preferences (
                 id SERIAL PRIMARY KEY,
@@ -197,10 +254,16 @@ async def validate_preference(request: SavePreferenceRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Repo Agent] Validate error: {e}")
+        logger.error("Validate error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/validations/{user_id}")
+async def live_validations(user_id: str):
+    """A user's unexpired, unanswered validation requests - served from memory"""
+    return {"validations": tracker.live_for(user_id)}
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok", "agent": "repo", "model": "gemini-2.0-flash"}
@@ -54,3 +54,4 @@ class SavePreferenceRequest(BaseModel):
     values: list[str]
     validation_type: ValidationType
     raw_text: Optional[str] = None
+    validation_id: Optional[str] = None  # the ValidationRequest being confirmed, if any
@@ -0,0 +1,262 @@
+"""
+Expiry of outstanding validation requests
+
+create_validation_request gives every ValidationRequest an expires_at (30s
+soft, 120s hard). The requests of a known user are written to
+pending_validations and tracked here on a hierarchical timer wheel:
+scheduling and cancelling are O(1), and each tick only touches the slot
+that is due. Expired ids are flushed to pending_validations in one batched
+UPDATE per FLUSH_SECONDS - nothing ever polls the table.
+
+The tracker doubles as the in-memory index of each user's live
+confirmations (GET /validations/{user_id}).
+
+At startup, overdue rows left by the previous process are expired with one
+UPDATE and the still-live ones are re-scheduled. They expire on time but
+aren't in the live index, since only their ids are reloaded.
+
+Wheel and index are per process, so the service runs as a single worker
+(see the deploy notes in main.py).
+
+Needs migrations/017_pending_validations_expiry.sql.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from datetime import datetime
+from typing import Any, Hashable, Optional
+
+import asyncpg
+
+from models import ValidationRequest
+
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = 1.0
+FLUSH_SECONDS = float(os.environ.get("VALIDATION_FLUSH_SECONDS", "2"))
+FLUSH_BATCH = 500
+
+EXPIRE_SQL = """
+    UPDATE pending_validations
+    SET status = 'expired', completed_at = NOW()
+    WHERE id = ANY($1::text[]) AND status = 'pending'
+"""
+
+INSERT_SQL = """
+    INSERT INTO pending_validations (
+        id, user_id, entity_id, cluster, value, confidence, reasoning,
+        validation_type, status, expires_at
+    )
+    SELECT id, $2, entity_id, 'preferences', value, confidence, reasoning, validation_type, 'pending', expires_at
+    FROM unnest($1::text[], $3::text[], $4::text[], $5::float8[], $6::text[], $7::text[], $8::timestamptz[])
+        AS t(id, entity_id, value, confidence, reasoning, validation_type, expires_at)
+    ON CONFLICT (id) DO NOTHING
+"""
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel - `levels` wheels of `slots` slots, each slot
+    of level L covering slots**L ticks. A timer sits at the lowest level whose
+    slot can tell its deadline apart from now, and moves down a level
+    (cascades) when the clock enters its slot.
+    """
+
+    def __init__(self, tick: float = TICK_SECONDS, slots: int = 64, levels: int = 3, start: Optional[float] = None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.origin = time.monotonic() if start is None else start
+        self.current = 0
+        self.wheels: list[list[dict[Hashable, tuple[int, Any]]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        # Past the top wheel's range - re-placed each time the top wheel wraps
+        self.overflow: dict[Hashable, tuple[int, Any]] = {}
+        self.where: dict[Hashable, dict] = {}
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def _place(self, key, deadline: int, value):
+        bucket = self.overflow
+        for level in range(self.levels):
+            if deadline // self.slots ** (level + 1) == self.current // self.slots ** (level + 1):
+                bucket = self.wheels[level][deadline // self.slots ** level % self.slots]
+                break
+        bucket[key] = (deadline, value)
+        self.where[key] = bucket
+
+    def schedule(self, key: Hashable, delay: float, value=None, now: Optional[float] = None):
+        """Fire `key` after `delay` seconds (rounded up to a tick); replaces an existing timer"""
+        self.cancel(key)
+        now = time.monotonic() if now is None else now
+        deadline = max(math.ceil((now + delay - self.origin) / self.tick), self.current + 1)
+        self._place(key, deadline, value)
+
+    def cancel(self, key: Hashable):
+        """Drop a timer; returns its value, or None if it wasn't scheduled"""
+        bucket = self.where.pop(key, None)
+        if bucket is None:
+            return None
+        return bucket.pop(key)[1]
+
+    def advance(self, now: Optional[float] = None) -> list[tuple[Hashable, Any]]:
+        """Move the clock to `now`; returns the (key, value) of every timer that fired"""
+        now = time.monotonic() if now is None else now
+        target = int((now - self.origin) / self.tick)
+        fired = []
+        while self.current < target:
+            self.current += 1
+            if self.current % self.slots ** self.levels == 0:
+                self._cascade(self.overflow)
+            # Highest level first - its timers may land in a lower slot cascading this tick
+            for level in range(self.levels - 1, 0, -1):
+                if self.current % self.slots ** level == 0:
+                    self._cascade(self.wheels[level][self.current // self.slots ** level % self.slots])
+            slot = self.wheels[0][self.current % self.slots]
+            for key, (_, value) in slot.items():
+                del self.where[key]
+                fired.append((key, value))
+            slot.clear()
+        return fired
+
+    def _cascade(self, bucket: dict):
+        entries = list(bucket.items())
+        bucket.clear()
+        for key, (deadline, value) in entries:
+            self._place(key, deadline, value)
+
+
+class ValidationTracker:
+    """Live validation requests by user, expired off a TimerWheel"""
+
+    def __init__(self, wheel: Optional[TimerWheel] = None):
+        self.wheel = wheel if wheel is not None else TimerWheel()
+        self.live: dict[str, dict[str, ValidationRequest]] = {}
+
+    def track(self, user_id: str, request: ValidationRequest, ttl_seconds: float):
+        self.live.setdefault(user_id, {})[request.id] = request
+        self.wheel.schedule(request.id, ttl_seconds, user_id)
+
+    def track_id(self, request_id: str, ttl_seconds: float):
+        """Expiry only - for rows reloaded at startup"""
+        self.wheel.schedule(request_id, ttl_seconds)
+
+    def resolve(self, request_id: str) -> bool:
+        """Confirmed or rejected before expiry; False if it wasn't live"""
+        if request_id not in self.wheel:
+            return False
+        self._forget(request_id, self.wheel.cancel(request_id))
+        return True
+
+    def live_for(self, user_id: str) -> list[ValidationRequest]:
+        return list(self.live.get(user_id, {}).values())
+
+    def expire_due(self, now: Optional[float] = None) -> list[str]:
+        expired = []
+        for request_id, user_id in self.wheel.advance(now):
+            self._forget(request_id, user_id)
+            expired.append(request_id)
+        return expired
+
+    def _forget(self, request_id: str, user_id: Optional[str]):
+        requests = self.live.get(user_id)
+        if requests is not None:
+            requests.pop(request_id, None)
+            if not requests:
+                del self.live[user_id]
+
+
+tracker = ValidationTracker()
+
+_pool: Optional[asyncpg.Pool] = None
+
+
+async def get_pool() -> asyncpg.Pool:
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(os.environ["DATABASE_URL"], min_size=1, max_size=2)
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def save_validations(user_id: str, requests: list[ValidationRequest]):
+    """Write a response's validation requests with one statement, then start their timers"""
+    requests = [r for r in requests if r.expires_at is not None]
+    if not requests:
+        return
+    now = datetime.now().astimezone()
+    ids, entity_ids, values, confidences, reasons, types, expires = (list(col) for col in zip(*(
+        (
+            r.id,
+            f"{r.preference.type.value}:{'|'.join(r.preference.values)}",
+            ', '.join(r.preference.values),
+            round(r.preference.confidence, 2),
+            r.preference.reason or r.prompt,
+            r.validation_type.value,
+            r.expires_at.astimezone(),
+        )
+        for r in requests
+    )))
+    # Tracked even if the write fails - the live index doesn't depend on it
+    for r, expires_at in zip(requests, expires):
+        tracker.track(user_id, r, (expires_at - now).total_seconds())
+    try:
+        pool = await get_pool()
+        await pool.execute(INSERT_SQL, ids, user_id, entity_ids, values, confidences, reasons, types, expires)
+    except Exception as e:
+        logger.warning("Saving %d validation requests failed: %s", len(requests), e)
+
+
+async def flush_expired(ids: list[str]):
+    pool = await get_pool()
+    for i in range(0, len(ids), FLUSH_BATCH):
+        await pool.execute(EXPIRE_SQL, ids[i:i + FLUSH_BATCH])
+
+
+async def recover():
+    """Expire what went overdue while no process was running; re-schedule the rest"""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE pending_validations SET status = 'expired', completed_at = NOW()
+            WHERE status = 'pending' AND expires_at <= NOW()
+        """)
+        rows = await conn.fetch("""
+            SELECT id, EXTRACT(EPOCH FROM expires_at - NOW()) AS ttl
+            FROM pending_validations
+            WHERE status = 'pending' AND expires_at > NOW()
+        """)
+    for row in rows:
+        tracker.track_id(row['id'], float(row['ttl']))
+
+
+async def run_expiry():
+    """Tick the wheel and flush expirations in batches; runs for the life of the app"""
+    pending: list[str] = []
+    last_flush = time.monotonic()
+    while True:
+        await asyncio.sleep(TICK_SECONDS)
+        pending.extend(tracker.expire_due())
+        if not pending or time.monotonic() - last_flush < FLUSH_SECONDS:
+            continue
+        try:
+            await flush_expired(pending)
+            logger.info("Expired %d validation requests", len(pending), extra={"event": "validations.expired"})
+            pending = []
+        except Exception as e:
+            # Kept for the next flush; the status guard makes a repeat harmless
+            logger.warning("Expiring %d validation requests failed: %s", len(pending), e)
+        last_flush = time.monotonic()
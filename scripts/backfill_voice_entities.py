@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Voice Entity Backfill Script
+
+Batch pipeline:
+1. Read stored transcripts (onboarding_sessions or a JSONL file)
+2. Extract entities with the voice extraction agent, several transcripts per call
+3. Bulk upsert graph_nodes and user_preferences - one statement per chunk
+
+Usage:
+    python scripts/backfill_voice_entities.py --limit 500
+    python scripts/backfill_voice_entities.py --input transcripts.jsonl --pack-size 1 --concurrency 8
+
+JSONL input lines: {"user_id": "...", "transcript": "...", "user_type": "candidate"}
+Sessions are read from onboarding_sessions.collected_data->>'transcript' -
+the only key read. Sessions without it (or with it blank) are skipped, and
+the run prints how many there are, so a transcript stored under another key
+shows up as a large skipped count rather than a quiet no-op.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# The serverless module name has a hyphen, so load it by path
+_VOICE_EXTRACT_PATH = Path(__file__).resolve().parent.parent / 'api' / 'pydantic-voice-extract.py'
+_spec = importlib.util.spec_from_file_location('pydantic_voice_extract', _VOICE_EXTRACT_PATH)
+voice_extract = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(voice_extract)
+
+# shared/ lives at the repo root, one level up
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from shared.llm_quota import limit_agent
+
+# The backfill is batch work on the key the live voice endpoint uses
+limit_agent(voice_extract.agent, 'batch')
+limit_agent(voice_extract.batch_agent, 'batch')
+
+# Voice entity types that map onto a user_preferences.preference_type
+PREFERENCE_TYPES = {
+    'role': 'role',
+    'location': 'location',
+    'day_rate': 'day_rate',
+    'availability': 'work_type',
+    'industry': 'industry',
+}
+
+
+def get_db_connection():
+    """Get database connection"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        raise ValueError("DATABASE_URL environment variable not set")
+    return psycopg2.connect(database_url)
+
+
+def count_sessions_without_transcript(conn) -> int:
+    """Sessions iter_session_transcripts skips - no collected_data->>'transcript', or a blank one"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*) FROM onboarding_sessions
+            WHERE COALESCE(btrim(collected_data->>'transcript'), '') = ''
+        """)
+        return cur.fetchone()[0]
+
+
+def iter_session_transcripts(conn, chunk_size: int, limit: int):
+    """Yield chunks of stored onboarding transcripts using keyset pagination"""
+    last_id = None
+    remaining = limit
+    while remaining > 0:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT id, user_id, COALESCE(user_type, 'unknown') as user_type,
+                       collected_data->>'transcript' as transcript
+                FROM onboarding_sessions
+                WHERE COALESCE(btrim(collected_data->>'transcript'), '') <> ''
+                AND (%s::uuid IS NULL OR id > %s::uuid)
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, last_id, min(chunk_size, remaining)))
+            rows = cur.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        remaining -= len(rows)
+        yield [
+            {'id': str(row['id']), 'user_id': row['user_id'],
+             'user_type': row['user_type'], 'transcript': row['transcript'] or ''}
+            for row in rows
+        ]
+
+
+def iter_file_transcripts(path: str, chunk_size: int, limit: int):
+    """Yield chunks of transcripts from a JSONL file"""
+    chunk = []
+    with open(path) as f:
+        for i, line in enumerate(f):
+            if i >= limit:
+                break
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            chunk.append({
+                'id': str(row.get('id', i)),
+                'user_id': row['user_id'],
+                'user_type': row.get('user_type', 'unknown'),
+                'transcript': row.get('transcript', ''),
+            })
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_rows(items: list[dict], results: dict) -> tuple[list[tuple], dict]:
+    """Flatten extraction results into graph_nodes rows and merged preferences"""
+    entities_by_user: dict[str, list] = {}
+    preferences: dict[tuple[str, str], list[str]] = {}
+
+    for item in items:
+        extraction = results.get(item['id'])
+        if extraction is None:
+            continue
+        user_id = item['user_id']
+        entities_by_user.setdefault(user_id, []).extend(extraction.entities)
+        for entity in extraction.entities:
+            preference_type = PREFERENCE_TYPES.get(entity.entity_type.value)
+            if preference_type and entity.cluster.value in ('preferences', 'career_interests'):
+                values = preferences.setdefault((user_id, preference_type), [])
+                if entity.value not in values:
+                    values.append(entity.value)
+
+    # Deduped per user, so one chunk never hits the same row twice
+    node_rows = [
+        row
+        for user_id, entities in entities_by_user.items()
+        for row in voice_extract.graph_node_rows(user_id, entities)
+    ]
+    return node_rows, preferences
+
+
+def bulk_upsert_preferences(conn, preferences: dict) -> int:
+    """Merge preference values for a chunk in one statement"""
+    if not preferences:
+        return 0
+    user_ids = [user_id for user_id, _ in preferences]
+    types = [preference_type for _, preference_type in preferences]
+    values = [json.dumps(v) for v in preferences.values()]
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO user_preferences (user_id, preference_type, values)
+            SELECT user_id, preference_type, values::jsonb
+            FROM unnest(%s::text[], %s::text[], %s::text[]) AS t(user_id, preference_type, values)
+            ON CONFLICT (user_id, preference_type)
+            DO UPDATE SET values = (
+                SELECT jsonb_agg(DISTINCT v)
+                FROM jsonb_array_elements(user_preferences.values || EXCLUDED.values) v
+            )
+        """, (user_ids, types, values))
+        return cur.rowcount
+
+
+async def backfill(
+    input_path: str = None,
+    limit: int = 1000,
+    chunk_size: int = 200,
+    pack_size: int = voice_extract.BATCH_PACK_SIZE,
+    concurrency: int = voice_extract.BATCH_CONCURRENCY,
+    dry_run: bool = False
+):
+    """Main backfill loop"""
+    conn = get_db_connection()
+
+    try:
+        print(f"\n{'='*60}")
+        print("VOICE ENTITY BACKFILL")
+        print(f"{'='*60}")
+        print(f"Pack size: {pack_size}, Concurrency: {concurrency}, Chunk: {chunk_size}")
+        if not input_path:
+            print(f"Sessions without collected_data->>'transcript' (skipped): "
+                  f"{count_sessions_without_transcript(conn)}")
+        print(f"{'='*60}\n")
+
+        chunks = (
+            iter_file_transcripts(input_path, chunk_size, limit)
+            if input_path else iter_session_transcripts(conn, chunk_size, limit)
+        )
+
+        total = failed_total = nodes_total = prefs_total = 0
+        started = time.monotonic()
+
+        for chunk in chunks:
+            results, failed = await voice_extract.extract_batch(
+                chunk, pack_size=pack_size, concurrency=concurrency
+            )
+            node_rows, preferences = build_rows(chunk, results)
+
+            if not dry_run:
+                nodes_total += voice_extract.upsert_graph_nodes(conn, node_rows)
+                prefs_total += bulk_upsert_preferences(conn, preferences)
+                conn.commit()
+
+            total += len(chunk)
+            failed_total += len(failed)
+            elapsed = time.monotonic() - started
+            print(f"  {total} transcripts, {len(node_rows)} nodes in chunk, "
+                  f"{failed_total} failed ({total / elapsed:.1f}/s)")
+
+        print(f"\n{'='*60}")
+        print(f"COMPLETE: {total} transcripts, {nodes_total} graph_nodes, "
+              f"{prefs_total} preferences, {failed_total} failed")
+        print(f"{'='*60}\n")
+
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Backfill graph_nodes and user_preferences from stored transcripts')
+    parser.add_argument('--input', type=str, help='JSONL file of transcripts (default: onboarding_sessions)')
+    parser.add_argument('--limit', type=int, default=1000, help='Max transcripts to process')
+    parser.add_argument('--chunk-size', type=int, default=200, help='Transcripts per DB write')
+    parser.add_argument('--pack-size', type=int, default=voice_extract.BATCH_PACK_SIZE,
+                        help='Transcripts per LLM call (1 = fan out one call each)')
+    parser.add_argument('--concurrency', type=int, default=voice_extract.BATCH_CONCURRENCY,
+                        help='Max LLM calls in flight')
+    parser.add_argument('--dry-run', action='store_true', help='Extract but do not write')
+
+    args = parser.parse_args()
+
+    asyncio.run(backfill(
+        input_path=args.input,
+        limit=args.limit,
+        chunk_size=args.chunk_size,
+        pack_size=args.pack_size,
+        concurrency=args.concurrency,
+        dry_run=args.dry_run,
+    ))
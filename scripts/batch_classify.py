@@ -0,0 +1,355 @@
+"""
+Offline batch mode for classify_jobs.py (--batch)
+
+Nightly backlogs don't need interactive latency, so instead of one call per
+job the whole claim goes through a provider batch API (llm_batch.py), one
+batch per cascade step:
+
+1. classify every claimed job on BATCH_CLASSIFIER_MODEL
+2. re-classify the low-confidence ones on BATCH_ESCALATION_MODEL
+3. editorial rewrite for the jobs that need it on BATCH_EDITORIAL_MODEL
+
+Results are saved exactly as the interactive path saves them (save_job, then
+the ZEP sync). Claims are leased for BATCH_LEASE_SECONDS and the lease is
+renewed before each step, so every step gets a full completion window. A job
+the batch returns nothing usable for is marked 'error' like any other failed
+classification; a batch that fails as a whole ends the run and its claims go
+back to pending.
+
+Each run keeps a manifest.json in its run directory (claimed raw ids, worker,
+provider and every submitted batch id). After a crash, --batch-resume picks
+the run up again: it takes back the claims still free and waits on the
+batches already paid for instead of submitting them again.
+
+Usage:
+    python scripts/classify_jobs.py --all --batch
+    python scripts/classify_jobs.py --all --batch --batch-provider openai
+    python scripts/classify_jobs.py --batch --batch-resume scripts/.batches/<run>
+    LOCAL_BATCH_MODEL=test python scripts/classify_jobs.py --limit 20 --batch
+"""
+
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from pydantic import BaseModel, ValidationError
+
+from classify_jobs import (
+    CLASSIFIER_MODEL,
+    CLASSIFIER_PROMPT,
+    CLASSIFY_CONCURRENCY,
+    EDITORIAL_MODEL,
+    EDITORIAL_PROMPT,
+    ESCALATION_CONFIDENCE,
+    ESCALATION_MODEL,
+    EditorialContent,
+    JobClassification,
+    StructuredJob,
+    attach_duplicates,
+    boilerplate_filter,
+    build_job_context,
+    classify_prompt,
+    editorial_prompt,
+    needs_editorial,
+    run_materialize,
+    save_duplicate,
+    save_job,
+    sync_job_to_zep,
+)
+from job_dedupe import DEDUPE_ENABLED, minhash, posting_text
+from llm_batch import BATCH_DIR, FAILED, PENDING, BatchProvider, get_provider, write_jsonl
+from materialize_matches import MATCH_MATERIALIZE_ENABLED
+from pipeline_metrics import PipelineMetrics
+from raw_jobs_queue import (
+    claim_pending_raw_jobs,
+    create_pool,
+    default_worker_id,
+    mark_raw_job_processed,
+    reap_expired_leases,
+    reclaim_raw_jobs,
+    release_leases,
+    renew_leases,
+)
+
+BATCH_PROVIDER = os.environ.get('BATCH_PROVIDER', 'local')
+BATCH_CLASSIFIER_MODEL = os.environ.get('BATCH_CLASSIFIER_MODEL', CLASSIFIER_MODEL)
+BATCH_ESCALATION_MODEL = os.environ.get('BATCH_ESCALATION_MODEL', ESCALATION_MODEL)
+BATCH_EDITORIAL_MODEL = os.environ.get('BATCH_EDITORIAL_MODEL', EDITORIAL_MODEL)
+BATCH_POLL_SECONDS = int(os.environ.get('BATCH_POLL_SECONDS', '60'))
+# Per step - renewed before each one - so a 24h completion window plus ingestion
+BATCH_LEASE_SECONDS = int(os.environ.get('BATCH_LEASE_SECONDS', str(26 * 3600)))
+# Jobs claimed per round trip while filling the batch
+BATCH_CLAIM_SIZE = int(os.environ.get('BATCH_CLAIM_SIZE', '500'))
+
+OUTPUT_TYPES = {model.__name__: model for model in (JobClassification, EditorialContent)}
+
+logger = logging.getLogger(__name__)
+
+
+def load_manifest(run_dir: Path) -> dict:
+    with open(run_dir / 'manifest.json') as f:
+        return json.load(f)
+
+
+def save_manifest(run_dir: Path, manifest: dict):
+    run_dir.mkdir(parents=True, exist_ok=True)
+    tmp = run_dir / 'manifest.json.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, run_dir / 'manifest.json')
+
+
+class BatchFailed(RuntimeError):
+    """A whole batch failed - nothing in it says anything about its jobs"""
+
+
+def batch_request(job: dict, model: str, system: str, prompt: str, output_type: type[BaseModel]) -> dict:
+    return {
+        'custom_id': str(job['raw_id']),
+        'model': model,
+        'system': system,
+        'prompt': prompt,
+        'output_name': output_type.__name__,
+        'output_schema': output_type.model_json_schema(),
+    }
+
+
+async def run_step(
+    provider: BatchProvider,
+    run_dir: Path,
+    step: str,
+    requests: list[dict],
+    output_type: type[BaseModel],
+    metrics: PipelineMetrics,
+    poll_seconds: int,
+    manifest: dict
+) -> dict[str, BaseModel]:
+    """Submit one batch (or pick up the one in the manifest), wait for it and return the valid outputs by custom_id"""
+    if not requests:
+        return {}
+
+    batch_id = manifest['batches'].get(step)
+    if batch_id:
+        print(f"  {step}: resuming {provider.name} batch {batch_id}")
+    else:
+        path = write_jsonl(run_dir / f'{step}.jsonl', requests)
+        with metrics.stage(f'batch_{step}_submit'):
+            batch_id = await provider.submit(path)
+        manifest['batches'][step] = batch_id
+        save_manifest(run_dir, manifest)
+        print(f"  {step}: submitted {len(requests)} requests as {provider.name} batch {batch_id}")
+
+    with metrics.stage(f'batch_{step}_wait'):
+        while (state := await provider.status(batch_id)) == PENDING:
+            await asyncio.sleep(poll_seconds)
+    if state == FAILED:
+        # Forgotten so a resumed run submits this step again
+        del manifest['batches'][step]
+        save_manifest(run_dir, manifest)
+        raise BatchFailed(f"{step}: {provider.name} batch {batch_id} failed")
+
+    outputs = {}
+    invalid = 0
+    async for result in provider.results(batch_id):
+        usage = result.get('usage')
+        if usage:
+            metrics.add_tokens(f'{step}_batch', usage['input_tokens'], usage['output_tokens'])
+        if result.get('output') is None:
+            invalid += 1
+            continue
+        try:
+            outputs[result['custom_id']] = output_type.model_validate(result['output'])
+        except ValidationError:
+            invalid += 1
+    print(f"  {step}: {len(outputs)}/{len(requests)} results"
+          f"{f', {invalid} errors or invalid' if invalid else ''}")
+    return outputs
+
+
+async def save_batch_job(pool, job: dict, structured, metrics: PipelineMetrics, semaphore) -> bool:
+    async with semaphore:
+        record = metrics.start_job(job['raw_id'])
+        try:
+            duplicate_of = job.get('duplicate_of')
+            with metrics.stage('db_update', record):
+                if duplicate_of:
+                    await save_duplicate(pool, job, structured, duplicate_of[0], duplicate_of[1])
+                else:
+                    await save_job(pool, job, structured)
+            if job['job_id'] and not duplicate_of:
+                title = job.get('title') or job.get('raw_data', {}).get('job_title', 'Unknown')
+                company = job.get('company_name') or job.get('raw_data', {}).get('company_name', 'Unknown')
+                with metrics.stage('zep_sync', record):
+                    await sync_job_to_zep(
+                        job['job_id'], structured, title, company,
+                        structured.city or job.get('location', 'UK')
+                    )
+            metrics.end_job(record, 'processed', editorial=isinstance(structured, StructuredJob))
+            return True
+        except Exception as e:
+            logger.warning("Job %s failed: %s", job['raw_id'], e, extra={'event': 'classify.job', 'raw_id': str(job['raw_id'])})
+            await mark_raw_job_processed(pool, job['raw_id'], 'error', str(e))
+            metrics.end_job(record, 'error', error=str(e)[:200])
+            return False
+
+
+async def process_jobs_batch(
+    limit: int = 1000,
+    source: str = None,
+    editorial_all: bool = False,
+    metrics_jsonl: str = None,
+    metrics_prom: str = None,
+    worker_id: str = None,
+    provider_name: str = BATCH_PROVIDER,
+    poll_seconds: int = BATCH_POLL_SECONDS,
+    resume_dir: str = None
+):
+    """
+    Claim up to limit jobs and run the classification cascade through a batch
+    provider - or, with resume_dir, finish an interrupted run
+    """
+    metrics = PipelineMetrics(jsonl_path=metrics_jsonl)
+    worker_id = worker_id or default_worker_id()
+    if resume_dir:
+        run_dir = Path(resume_dir)
+        manifest = load_manifest(run_dir)
+        provider_name = manifest['provider']
+    else:
+        run_dir = BATCH_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{worker_id.replace(':', '-')}"
+        manifest = {'worker_id': worker_id, 'provider': provider_name, 'raw_ids': [], 'batches': {}}
+    provider = get_provider(provider_name, OUTPUT_TYPES)
+    pool = await create_pool()
+
+    async def step(name: str, requests: list[dict], output_type: type[BaseModel]) -> dict[str, BaseModel]:
+        with metrics.stage('db_renew'):
+            await renew_leases(pool, worker_id, BATCH_LEASE_SECONDS)
+        return await run_step(provider, run_dir, name, requests, output_type, metrics, poll_seconds, manifest)
+
+    try:
+        if resume_dir:
+            with metrics.stage('db_claim'):
+                jobs = await reclaim_raw_jobs(
+                    pool, manifest['raw_ids'], worker_id, manifest['worker_id'], BATCH_LEASE_SECONDS
+                )
+            manifest['worker_id'] = worker_id
+        else:
+            with metrics.stage('db_reap'):
+                await reap_expired_leases(pool)
+
+            jobs = []
+            while len(jobs) < limit:
+                with metrics.stage('db_claim'):
+                    claimed = await claim_pending_raw_jobs(
+                        pool, min(BATCH_CLAIM_SIZE, limit - len(jobs)), source, worker_id, BATCH_LEASE_SECONDS
+                    )
+                if not claimed:
+                    break
+                jobs.extend(claimed)
+            manifest['raw_ids'] = [str(job['raw_id']) for job in jobs]
+        if jobs:
+            save_manifest(run_dir, manifest)
+
+        print(f"\n{'='*60}")
+        print(f"BATCH JOB CLASSIFICATION ({provider.name})")
+        print(f"{'='*60}")
+        print(f"Worker: {worker_id}, Jobs: {len(jobs)}, Files: {run_dir}")
+        print(f"{'='*60}\n")
+        if not jobs:
+            return
+
+        contexts = {}
+        for job in jobs:
+            try:
+                with metrics.stage('prepare'):
+                    contexts[str(job['raw_id'])] = build_job_context(job)
+            except Exception as e:
+                await mark_raw_job_processed(pool, job['raw_id'], 'error', str(e))
+                continue
+            if DEDUPE_ENABLED:
+                job['signature'] = minhash(posting_text(job))
+        jobs = [job for job in jobs if str(job['raw_id']) in contexts]
+
+        # Postings already classified under another source never enter the batch
+        semaphore = asyncio.Semaphore(CLASSIFY_CONCURRENCY)
+        duplicates = []
+        if DEDUPE_ENABLED and await attach_duplicates(pool, jobs, editorial_all, metrics):
+            duplicates = [job for job in jobs if 'duplicate_of' in job]
+            jobs = [job for job in jobs if 'duplicate_of' not in job]
+            print(f"  dedupe: {len(duplicates)} jobs reuse an earlier posting's output")
+
+        classifications = await step('classify', [
+            batch_request(job, BATCH_CLASSIFIER_MODEL, CLASSIFIER_PROMPT,
+                          classify_prompt(contexts[str(job['raw_id'])]), JobClassification)
+            for job in jobs
+        ], JobClassification)
+
+        if BATCH_ESCALATION_MODEL != BATCH_CLASSIFIER_MODEL:
+            classifications.update(await step('escalate', [
+                batch_request(job, BATCH_ESCALATION_MODEL, CLASSIFIER_PROMPT,
+                              classify_prompt(contexts[str(job['raw_id'])]), JobClassification)
+                for job in jobs
+                if str(job['raw_id']) in classifications
+                and classifications[str(job['raw_id'])].confidence < ESCALATION_CONFIDENCE
+            ], JobClassification))
+
+        editorial_jobs = [
+            job for job in jobs
+            if str(job['raw_id']) in classifications
+            and (editorial_all or needs_editorial(classifications[str(job['raw_id'])]))
+        ]
+        wants_editorial = {str(job['raw_id']) for job in editorial_jobs}
+        editorials = await step('editorial', [
+            batch_request(job, BATCH_EDITORIAL_MODEL, EDITORIAL_PROMPT,
+                          editorial_prompt(contexts[str(job['raw_id'])], classifications[str(job['raw_id'])]),
+                          EditorialContent)
+            for job in editorial_jobs
+        ], EditorialContent)
+
+        saves = [save_batch_job(pool, job, job['duplicate_of'][2], metrics, semaphore) for job in duplicates]
+        for job in jobs:
+            raw_id = str(job['raw_id'])
+            classification = classifications.get(raw_id)
+            if classification is None or (raw_id in wants_editorial and raw_id not in editorials):
+                await mark_raw_job_processed(pool, job['raw_id'], 'error', 'No valid batch result')
+                continue
+            structured = classification
+            if raw_id in editorials:
+                structured = StructuredJob(
+                    **classification.model_dump(exclude={'confidence'}),
+                    **editorials[raw_id].model_dump()
+                )
+            saves.append(save_batch_job(pool, job, structured, metrics, semaphore))
+        saved = sum(await asyncio.gather(*saves))
+
+        print(f"\n{'='*60}")
+        print(f"COMPLETE: {saved} processed ({len(editorials)} with editorial), "
+              f"{len(jobs) + len(duplicates) - saved} errors")
+        print(f"{'='*60}")
+        metrics.print_summary()
+        print(f"{'='*60}\n")
+
+        if MATCH_MATERIALIZE_ENABLED and saved:
+            try:
+                with metrics.stage('match_materialize'):
+                    stats = await asyncio.to_thread(run_materialize)
+                print(f"Matches: {stats['jobs']} jobs merged into {stats['candidates_merged']} candidates, "
+                      f"{stats['users']} users refreshed")
+            except Exception as e:
+                print(f"⚠ Match materialization failed: {str(e)[:100]}")
+
+    except BatchFailed as e:
+        # Nothing was saved; the finally below hands every claim back
+        print(f"\n⚠ {e} - resume with --batch-resume {run_dir}")
+
+    finally:
+        released = await release_leases(pool, worker_id)
+        if released:
+            print(f"Released {released} unfinished claims")
+        boilerplate_filter.save()
+        await pool.close()
+        metrics.close()
+        if metrics_prom:
+            metrics.write_prometheus(metrics_prom)
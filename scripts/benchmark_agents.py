@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the pydantic-ai agents
+
+Every Agent is swapped for a stub model, so no Gemini/Anthropic keys are
+needed and results only move when our code does:
+- default: TestModel (schema-valid output) behind a simulated latency
+- fixtures with recorded output: FunctionModel replaying that output
+
+Targets:
+    classify        scripts/classify_jobs.py classify_job()
+    pipeline        classify_jobs.process_jobs() against a LOCAL Postgres
+                    (BENCH_DATABASE_URL) with the ZEP endpoint stubbed
+    extract         api/pydantic-extract.py do_extraction()
+    analyzer        api/pydantic-analyzer.py handler(), DB query stubbed
+    voice           api/pydantic-voice-extract.py handler()
+    repo-agent      repo-agent/main.py extract_preferences()
+
+Usage:
+    python scripts/benchmark_agents.py
+    python scripts/benchmark_agents.py --targets classify voice --requests 500 --concurrency 20
+    python scripts/benchmark_agents.py --latency-ms 800 --jitter 0.5 --json bench.json
+
+Reports requests/sec, p50/p99 latency and peak Python heap / RSS per target.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import resource
+import tracemalloc
+import importlib.util
+import contextlib
+from itertools import cycle
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURES = Path(__file__).resolve().parent / 'bench_fixtures'
+
+# Agents build their providers at import time and want a key to exist;
+# the stub models never use them
+for key in ('GEMINI_API_KEY', 'GOOGLE_API_KEY', 'ANTHROPIC_API_KEY', 'OPENAI_API_KEY'):
+    os.environ.setdefault(key, 'bench-offline')
+os.environ.setdefault('ZEP_SYNC_ENABLED', 'false')
+os.environ.setdefault('MATCH_MATERIALIZE_ENABLED', 'false')
+# The pipeline fixtures repeat, so dedupe would skip most of the LLM work
+# being measured - DEDUPE_ENABLED=true benchmarks the dedupe path instead
+os.environ.setdefault('DEDUPE_ENABLED', 'false')
+# Stub models spend no real quota
+os.environ.setdefault('LLM_QUOTA_BACKEND', 'off')
+
+from pydantic_ai.models.test import TestModel
+from pydantic_ai.models.function import FunctionModel
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+
+from pipeline_metrics import percentile
+
+
+# ============================================================================
+# STUB MODELS
+# ============================================================================
+
+class Latency:
+    """Simulated model latency: base ± jitter, plus an occasional slow tail"""
+
+    def __init__(self, base_ms: float, jitter: float, tail_ratio: float = 0.01, tail_factor: float = 5.0):
+        self.base = base_ms / 1000
+        self.jitter = jitter
+        self.tail_ratio = tail_ratio
+        self.tail_factor = tail_factor
+
+    def sample(self) -> float:
+        delay = self.base * random.uniform(1 - self.jitter, 1 + self.jitter)
+        if random.random() < self.tail_ratio:
+            delay *= self.tail_factor
+        return max(delay, 0.0)
+
+
+class LatencyTestModel(TestModel):
+    """TestModel that takes as long as a real provider call"""
+
+    def __init__(self, latency: Latency, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    async def request(self, *args, **kwargs):
+        await asyncio.sleep(self.latency.sample())
+        return await super().request(*args, **kwargs)
+
+
+def replay_model(latency: Latency, outputs: list[dict]) -> FunctionModel:
+    """FunctionModel that answers with recorded outputs in turn"""
+    recorded = cycle(outputs)
+
+    async def respond(messages, info):
+        await asyncio.sleep(latency.sample())
+        tools = getattr(info, 'output_tools', None) or getattr(info, 'result_tools', None)
+        return ModelResponse(parts=[ToolCallPart(tools[0].name, next(recorded))])
+
+    return FunctionModel(respond)
+
+
+def stub_model(latency: Latency, outputs: list[dict] = None):
+    return replay_model(latency, outputs) if outputs else LatencyTestModel(latency)
+
+
+# ============================================================================
+# FIXTURES AND MODULE LOADING
+# ============================================================================
+
+def load_jsonl(name: str) -> list[dict]:
+    with open(FIXTURES / name) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_module(name: str, path: Path):
+    """Import a file by path - the serverless handlers have hyphenated names"""
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeRequest:
+    """Just enough of a Vercel request for the handlers"""
+
+    def __init__(self, body: dict, method: str = 'POST'):
+        self.method = method
+        self.body = json.dumps(body)
+
+    async def json(self):
+        return json.loads(self.body)
+
+
+# ============================================================================
+# TARGETS
+# ============================================================================
+# Each target returns (async callable run_one(i), cleanup context manager)
+
+def target_classify(latency: Latency, args):
+    classify_jobs = load_module('classify_jobs', ROOT / 'scripts' / 'classify_jobs.py')
+    jobs = load_jsonl('jobs.jsonl')
+    outputs = {key: [j[key] for j in jobs if key in j] for key in ('classification', 'editorial')}
+
+    stack = contextlib.ExitStack()
+    stack.enter_context(classify_jobs.classifier_agent.override(model=stub_model(latency, outputs['classification'])))
+    stack.enter_context(classify_jobs.agent.override(model=stub_model(latency, outputs['editorial'])))
+    # Learned boilerplate must not leak into the real fingerprint file
+    classify_jobs.boilerplate_filter.path = None
+
+    async def run_one(i):
+        job = dict(jobs[i % len(jobs)], raw_id=f'bench-{i}', job_id=None)
+        await classify_jobs.classify_job(job, editorial_all=args.editorial_all)
+
+    return run_one, stack
+
+
+def target_pipeline(latency: Latency, args):
+    """End-to-end process_jobs() against a scratch schema on a local Postgres"""
+    import httpx
+    import psycopg2
+    from check_pending_fetch_plan import setup_pipeline_schema
+
+    database_url = os.environ.get('BENCH_DATABASE_URL')
+    if not database_url:
+        raise RuntimeError('BENCH_DATABASE_URL not set - point it at a local, disposable Postgres')
+
+    classify_jobs = load_module('classify_jobs', ROOT / 'scripts' / 'classify_jobs.py')
+    jobs = load_jsonl('jobs.jsonl')
+
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    setup_pipeline_schema(conn, 'bench')
+    with conn.cursor() as cur:
+        for i in range(args.requests):
+            job = jobs[i % len(jobs)]
+            cur.execute("""
+                WITH j AS (
+                    INSERT INTO jobs (title, company_name, location, full_description,
+                                      employment_type, seniority_level, compensation)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
+                )
+                INSERT INTO raw_jobs (source, source_id, raw_data, job_id)
+                SELECT %s, %s, %s, id FROM j
+            """, (job['title'], job['company_name'], job['location'], job['full_description'],
+                  job['employment_type'], job['seniority_level'], job['compensation'],
+                  job['source'], f'bench-{i}', json.dumps(job.get('raw_data', {}))))
+    conn.close()
+
+    separator = '&' if '?' in database_url else '?'
+    # asyncpg passes unknown DSN params through as server settings
+    os.environ['DATABASE_URL'] = f"{database_url}{separator}search_path=bench"
+
+    # ZEP sync goes to an in-process stub with its own latency
+    async def zep_stub(request):
+        await asyncio.sleep(latency.sample() / 10)
+        return httpx.Response(200, json={'success': True})
+
+    classify_jobs.ZEP_SYNC_ENABLED = True
+    classify_jobs.httpx = SimpleNamespace(
+        AsyncClient=lambda **kw: httpx.AsyncClient(transport=httpx.MockTransport(zep_stub), **kw)
+    )
+    classify_jobs.boilerplate_filter.path = None
+
+    stack = contextlib.ExitStack()
+    stack.enter_context(classify_jobs.classifier_agent.override(model=stub_model(latency)))
+    stack.enter_context(classify_jobs.agent.override(model=stub_model(latency)))
+
+    # One "request" is the whole run; report per-job numbers from its metrics instead
+    async def run_one(i):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            await classify_jobs.process_jobs(limit=args.requests, editorial_all=args.editorial_all)
+        # process_jobs records per-job failures and carries on - a run that
+        # didn't process every job measured something else
+        conn = psycopg2.connect(database_url)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT processing_status, COUNT(*), MIN(processing_error)
+                    FROM bench.raw_jobs GROUP BY 1
+                """)
+                statuses = {status: (count, error) for status, count, error in cur.fetchall()}
+        finally:
+            conn.close()
+        unprocessed = {status: count for status, (count, _) in statuses.items() if status != 'processed'}
+        if unprocessed:
+            error = next((e for _, e in statuses.values() if e), None)
+            raise RuntimeError(f"Jobs not processed: {unprocessed}{f' - {error}' if error else ''}")
+
+    return run_one, stack
+
+
+def target_extract(latency: Latency, args):
+    module = load_module('pydantic_extract', ROOT / 'api' / 'pydantic-extract.py')
+    transcripts = load_jsonl('transcripts.jsonl')
+    outputs = [t['preferences'] for t in transcripts if 'preferences' in t]
+
+    from pydantic_ai import Agent
+    # Same stub behind every provider so the router's hedging shows up in p99;
+    # all of them stay routable whatever keys the shell happens to have
+    for name, _, _ in module.PROVIDERS:
+        module.router.agents[name] = Agent(
+            stub_model(latency, outputs),
+            output_type=module.ExtractionResult,
+            system_prompt=module.SYSTEM_PROMPT
+        )
+    module.router.available = lambda: [(name, model) for name, _, model in module.PROVIDERS]
+
+    async def run_one(i):
+        # do_extraction turns errors into {"error": ...}; a benchmark must not time those
+        result = await module.do_extraction(transcripts[i % len(transcripts)]['transcript'])
+        if isinstance(result, dict) and 'error' in result:
+            raise RuntimeError(f"Extraction failed: {result['error']}")
+
+    return run_one, contextlib.nullcontext()
+
+
+def target_analyzer(latency: Latency, args):
+    module = load_module('pydantic_analyzer', ROOT / 'api' / 'pydantic-analyzer.py')
+    transcripts = load_jsonl('transcripts.jsonl')
+    jobs = load_jsonl('jobs.jsonl')
+
+    # The analyzer is sync (run_sync) and hits Neon directly; stub the query
+    # with a DB-shaped delay and run each request in a worker thread
+    rows = [
+        {'id': i, 'slug': f'bench-{i}', 'title': j['title'], 'company_name': j['company_name'],
+         'location': j['location'], 'is_remote': False, 'salary_min': None, 'salary_currency': 'GBP'}
+        for i, j in enumerate(jobs)
+    ]
+
+    def query_jobs(role_type, location):
+        time.sleep(latency.sample() / 20)
+        return rows[:5]
+
+    module.query_jobs = query_jobs
+    stack = contextlib.ExitStack()
+    stack.enter_context(module.agent.override(model=stub_model(latency)))
+
+    async def run_one(i):
+        request = FakeRequest({'transcript': transcripts[i % len(transcripts)]['transcript']})
+        await asyncio.to_thread(module.handler, request)
+
+    return run_one, stack
+
+
+def target_voice(latency: Latency, args):
+    module = load_module('pydantic_voice_extract', ROOT / 'api' / 'pydantic-voice-extract.py')
+    transcripts = load_jsonl('transcripts.jsonl')
+    outputs = [t['extraction'] for t in transcripts if 'extraction' in t]
+
+    stack = contextlib.ExitStack()
+    stack.enter_context(module.agent.override(model=stub_model(latency, outputs)))
+    stack.enter_context(module.batch_agent.override(model=stub_model(latency)))
+
+    async def run_one(i):
+        item = transcripts[i % len(transcripts)]
+        # Sessions grow over the run so the context window is exercised too
+        history = [t['transcript'] for t in transcripts[:i % len(transcripts)]]
+        await module.handler(FakeRequest({
+            'transcript': item['transcript'],
+            'user_type': item['user_type'],
+            'session_id': item['user_id'],
+            'context': history,
+        }))
+
+    return run_one, stack
+
+
+def target_repo_agent(latency: Latency, args):
+    module = load_module('repo_agent_main', ROOT / 'repo-agent' / 'main.py')
+    transcripts = load_jsonl('transcripts.jsonl')
+
+    stack = contextlib.ExitStack()
+    stack.enter_context(module.extraction_agent.override(model=stub_model(latency)))
+
+    async def run_one(i):
+        item = transcripts[i % len(transcripts)]
+        await module.extract_preferences(module.ExtractionRequest(
+            transcript=item['transcript'], user_id=item['user_id']
+        ))
+
+    return run_one, stack
+
+
+TARGETS = {
+    'classify': target_classify,
+    'pipeline': target_pipeline,
+    'extract': target_extract,
+    'analyzer': target_analyzer,
+    'voice': target_voice,
+    'repo-agent': target_repo_agent,
+}
+DEFAULT_TARGETS = ['classify', 'extract', 'analyzer', 'voice', 'repo-agent']
+
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+async def run_target(name: str, latency: Latency, args) -> dict:
+    run_one, cleanup = TARGETS[name](latency, args)
+    requests = 1 if name == 'pipeline' else args.requests
+    semaphore = asyncio.Semaphore(args.concurrency)
+    timings: list[float] = []
+    errors = 0
+
+    async def timed(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await run_one(i)
+            except Exception as e:
+                errors += 1
+                if errors <= 3:
+                    print(f"    ✗ {name} request {i}: {str(e)[:120]}")
+            timings.append(time.perf_counter() - start)
+
+    with cleanup:
+        # Warm-up outside the measurement (imports, schema building, caches)
+        if name != 'pipeline':
+            await run_one(-1)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(timed(i) for i in range(requests)))
+        wall = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    timings.sort()
+    completed = args.requests if name == 'pipeline' else requests
+    return {
+        'target': name,
+        'requests': completed,
+        'errors': errors,
+        'wall_seconds': wall,
+        'rps': completed / wall if wall else 0.0,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'peak_heap_mb': peak / 1e6,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+async def main(args):
+    latency = Latency(args.latency_ms, args.jitter)
+    random.seed(args.seed)
+
+    print(f"\n{'='*60}")
+    print("OFFLINE AGENT BENCHMARK")
+    print(f"{'='*60}")
+    print(f"Requests: {args.requests}, Concurrency: {args.concurrency}, "
+          f"Latency: {args.latency_ms}ms ±{args.jitter:.0%}")
+    print(f"{'='*60}\n")
+
+    results = []
+    for name in args.targets:
+        try:
+            results.append(await run_target(name, latency, args))
+        except Exception as e:
+            print(f"  ✗ {name}: {e}")
+
+    print(f"{'target':<12}{'reqs':>7}{'err':>5}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'heap MB':>9}{'rss MB':>8}")
+    for r in results:
+        print(f"{r['target']:<12}{r['requests']:>7}{r['errors']:>5}{r['rps']:>9.1f}"
+              f"{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['peak_heap_mb']:>9.1f}{r['max_rss_mb']:>8.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark pydantic-ai agents offline with stub models')
+    parser.add_argument('--targets', nargs='+', choices=sorted(TARGETS), default=DEFAULT_TARGETS)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per target (jobs for pipeline)')
+    parser.add_argument('--concurrency', type=int, default=10, help='Requests in flight per target')
+    parser.add_argument('--latency-ms', type=float, default=300, help='Simulated model latency')
+    parser.add_argument('--jitter', type=float, default=0.3, help='Latency jitter as a fraction of --latency-ms')
+    parser.add_argument('--editorial-all', action='store_true', help='classify/pipeline: editorial for every job')
+    parser.add_argument('--seed', type=int, default=7, help='Random seed for latency sampling')
+    parser.add_argument('--json', type=str, help='Write results as JSON')
+
+    asyncio.run(main(parser.parse_args()))
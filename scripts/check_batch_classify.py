@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+End-to-end check for classify_jobs.py --batch (batch_classify.py)
+
+Runs against a LOCAL Postgres (never production), on the local batch
+provider with LOCAL_BATCH_MODEL=test - no API keys, no network:
+1. Creates a scratch schema and seeds --jobs pending raw_jobs
+2. Runs process_jobs_batch() and asserts every job is processed and the
+   run's manifest.json names the claimed raw ids and submitted batches
+3. Seeds --jobs more, starts a run on a provider that never answers and
+   stops it once its classify batch is submitted, leaving the claims
+   leased to that worker as a crash would
+4. Resumes that run with --batch-resume's code path under a new worker and
+   asserts it takes the claims back, waits on the batch already submitted
+   instead of submitting it again, and processes every job
+
+Usage:
+    BATCH_CHECK_DATABASE_URL=postgresql://localhost/postgres python scripts/check_batch_classify.py
+    python scripts/check_batch_classify.py --jobs 50 --keep
+
+Exits non-zero if any check fails.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import shutil
+import contextlib
+import tempfile
+from pathlib import Path
+
+# Read at import time by the modules below - stub models, scratch files and
+# none of the side systems a classify run would otherwise talk to
+BATCH_DIR = Path(tempfile.mkdtemp(prefix='batch-check-'))
+os.environ['BATCH_DIR'] = str(BATCH_DIR)
+os.environ['LOCAL_BATCH_MODEL'] = 'test'
+for key in ('GOOGLE_API_KEY', 'OPENAI_API_KEY', 'ANTHROPIC_API_KEY'):
+    os.environ.setdefault(key, 'batch-check-offline')
+os.environ['ZEP_SYNC_ENABLED'] = 'false'
+os.environ['MATCH_MATERIALIZE_ENABLED'] = 'false'
+os.environ['DEDUPE_ENABLED'] = 'false'
+os.environ['LLM_QUOTA_BACKEND'] = 'off'
+
+import psycopg2
+
+import batch_classify
+from check_pending_fetch_plan import setup_pipeline_schema
+from llm_batch import LocalFileBatchProvider
+
+SCHEMA = 'batch_check'
+FIXTURES = Path(__file__).resolve().parent / 'bench_fixtures' / 'jobs.jsonl'
+
+
+def seed_jobs(conn, count: int, offset: int = 0):
+    """Insert count jobs with pending raw_jobs from the benchmark fixtures"""
+    with open(FIXTURES) as f:
+        fixtures = [json.loads(line) for line in f if line.strip()]
+    with conn.cursor() as cur:
+        for i in range(offset, offset + count):
+            job = fixtures[i % len(fixtures)]
+            cur.execute(f"""
+                WITH j AS (
+                    INSERT INTO {SCHEMA}.jobs (title, company_name, location, full_description,
+                                               employment_type, seniority_level, compensation)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
+                )
+                INSERT INTO {SCHEMA}.raw_jobs (source, source_id, raw_data, job_id)
+                SELECT %s, %s, %s, id FROM j
+            """, (job['title'], job['company_name'], job['location'], job['full_description'],
+                  job['employment_type'], job['seniority_level'], job['compensation'],
+                  job['source'], f'batch-check-{i}', json.dumps(job.get('raw_data', {}))))
+
+
+def statuses(conn, raw_ids: list[str]) -> dict[str, int]:
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT processing_status, COUNT(*) FROM {SCHEMA}.raw_jobs
+            WHERE id::text = ANY(%s) GROUP BY 1
+        """, (raw_ids,))
+        return dict(cur.fetchall())
+
+
+def find_manifest(worker_id: str) -> Path:
+    return next(BATCH_DIR.glob(f'*-{worker_id}/manifest.json'))
+
+
+def check(ok: bool, label: str) -> int:
+    print(f"  [{'PASS' if ok else 'FAIL'}] {label}")
+    return not ok
+
+
+async def crashed_run(count: int) -> dict:
+    """Start a run whose batches never complete and stop it after the classify submit"""
+    original = batch_classify.get_provider
+    batch_classify.get_provider = lambda name, output_types=None: LocalFileBatchProvider()
+    run = asyncio.create_task(batch_classify.process_jobs_batch(
+        limit=count, worker_id='check-crashed', poll_seconds=0.05
+    ))
+    try:
+        while True:
+            await asyncio.sleep(0.05)
+            manifests = list(BATCH_DIR.glob('*-check-crashed/manifest.json'))
+            if manifests and 'classify' in json.loads(manifests[0].read_text())['batches']:
+                break
+            if run.done():
+                run.result()
+                raise RuntimeError('Run ended before submitting its classify batch')
+        run.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await run
+    finally:
+        batch_classify.get_provider = original
+    return json.loads(find_manifest('check-crashed').read_text())
+
+
+def main(count: int, keep: bool) -> int:
+    database_url = os.environ.get('BATCH_CHECK_DATABASE_URL')
+    if not database_url:
+        print("BATCH_CHECK_DATABASE_URL not set - point it at a local, disposable Postgres")
+        return 2
+
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    separator = '&' if '?' in database_url else '?'
+    # asyncpg passes unknown DSN params through as server settings
+    os.environ['DATABASE_URL'] = f"{database_url}{separator}search_path={SCHEMA}"
+    batch_classify.boilerplate_filter.path = None
+    failures = 0
+
+    try:
+        setup_pipeline_schema(conn, SCHEMA)
+
+        print(f"Fresh run over {count} jobs...")
+        seed_jobs(conn, count)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            asyncio.run(batch_classify.process_jobs_batch(limit=count, worker_id='check-fresh', poll_seconds=0))
+        manifest = json.loads(find_manifest('check-fresh').read_text())
+        failures += check(manifest['worker_id'] == 'check-fresh' and manifest['provider'] == 'local',
+                          f"manifest worker/provider: {manifest['worker_id']}/{manifest['provider']}")
+        failures += check(len(set(manifest['raw_ids'])) == count, f"manifest raw ids: {len(manifest['raw_ids'])}")
+        failures += check('classify' in manifest['batches'], f"manifest batches: {sorted(manifest['batches'])}")
+        done = statuses(conn, manifest['raw_ids'])
+        failures += check(done == {'processed': count}, f"statuses: {done}")
+
+        print(f"\nCrashed run over {count} more jobs, then resume...")
+        seed_jobs(conn, count, offset=count)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            crashed = asyncio.run(crashed_run(count))
+        # The finally block handed the claims back; a crash would have left them leased
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {SCHEMA}.raw_jobs
+                SET processing_status = 'in_progress', claimed_by = 'check-crashed',
+                    lease_until = NOW() + INTERVAL '1 hour'
+                WHERE id::text = ANY(%s)
+            """, (crashed['raw_ids'],))
+        submitted = crashed['batches']['classify']
+
+        run_dir = find_manifest('check-crashed').parent
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            asyncio.run(batch_classify.process_jobs_batch(
+                worker_id='check-resume', poll_seconds=0, resume_dir=str(run_dir)
+            ))
+        resumed = json.loads((run_dir / 'manifest.json').read_text())
+        failures += check(resumed['worker_id'] == 'check-resume', f"resumed manifest worker: {resumed['worker_id']}")
+        failures += check(resumed['raw_ids'] == crashed['raw_ids'], "resumed manifest raw ids unchanged")
+        failures += check(resumed['batches']['classify'] == submitted,
+                          f"classify batch reused: {submitted} -> {resumed['batches']['classify']}")
+        local_batches = len(list((BATCH_DIR / 'local').iterdir()))
+        failures += check(local_batches == len(manifest['batches']) + len(resumed['batches']),
+                          f"local batches submitted: {local_batches}")
+        done = statuses(conn, resumed['raw_ids'])
+        failures += check(done == {'processed': count}, f"resumed statuses: {done}")
+
+    finally:
+        if not keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            shutil.rmtree(BATCH_DIR, ignore_errors=True)
+        conn.close()
+
+    print(f"\n{'FAILED' if failures else 'OK'}: {failures} check(s) failed"
+          f"{f' - batch files in {BATCH_DIR}' if keep else ''}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check batch classification and its resume path end to end')
+    parser.add_argument('--jobs', type=int, default=20, help='Jobs per run')
+    parser.add_argument('--keep', action='store_true', help=f'Keep the {SCHEMA} schema and batch files')
+
+    args = parser.parse_args()
+    sys.exit(main(args.jobs, args.keep))
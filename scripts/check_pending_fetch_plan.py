@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Query plan regression check for the pending raw_jobs claim
+
+Runs against a LOCAL Postgres (never production):
+1. Creates a scratch schema with raw_jobs/jobs and applies migrations 008 + 009
+2. Seeds --rows raw_jobs (default 1,000,000), almost all already processed
+3. Asserts the claim query, prepared the way asyncpg runs it, plans as an
+   index scan on a pending partial index - custom and generic plans both
+4. Seeds the same number of processed rows again and asserts claim time
+   did not grow with them
+
+Usage:
+    PLAN_CHECK_DATABASE_URL=postgresql://localhost/postgres python scripts/check_pending_fetch_plan.py
+    python scripts/check_pending_fetch_plan.py --rows 200000 --keep
+
+Exits non-zero if any check fails.
+"""
+
+import os
+import sys
+import time
+import json
+import statistics
+from pathlib import Path
+
+import psycopg2
+
+from raw_jobs_queue import CLAIM_SQL_ANY_SOURCE, CLAIM_SQL_BY_SOURCE
+
+from dotenv import load_dotenv
+load_dotenv()
+
+SCHEMA = 'plan_check'
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / 'migrations'
+MIGRATIONS = ['008_raw_jobs_leasing.sql', '009_raw_jobs_pending_index.sql']
+PENDING_INDEXES = {'idx_raw_jobs_pending_source_received', 'idx_raw_jobs_pending_received'}
+SOURCES = ['linkedin', 'ashby', 'greenhouse', 'lever', 'workable']
+
+
+def migration_statements(sql: str) -> list[str]:
+    """
+    Split a migration into statements. `--` comments are dropped first - they
+    may contain semicolons - and a `;` inside a quoted string or a $$ body
+    doesn't end a statement.
+    """
+    statements, current = [], []
+    i, quote = 0, None
+    while i < len(sql):
+        if quote:
+            # '' inside a string closes it and opens the next one - same result
+            end = sql.find(quote, i)
+            end = len(sql) if end < 0 else end + len(quote)
+            current.append(sql[i:end])
+            i, quote = end, None
+        elif sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = len(sql) if end < 0 else end
+        elif sql[i] == "'" or sql.startswith('$$', i):
+            quote = "'" if sql[i] == "'" else '$$'
+            current.append(quote)
+            i += len(quote)
+        elif sql[i] == ';':
+            statements.append(''.join(current))
+            current = []
+            i += 1
+        else:
+            current.append(sql[i])
+            i += 1
+    statements.append(''.join(current))
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def setup_schema(conn, schema: str = SCHEMA):
+    """Scratch copy of the columns the claim touches (autocommit connection)"""
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cur.execute(f"CREATE SCHEMA {schema}")
+        cur.execute(f"SET search_path TO {schema}")
+        cur.execute("""
+            CREATE TABLE jobs (
+                id SERIAL PRIMARY KEY,
+                title TEXT, company_name TEXT, location TEXT, full_description TEXT,
+                employment_type TEXT, seniority_level TEXT, compensation TEXT
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE raw_jobs (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                source TEXT NOT NULL,
+                source_id TEXT,
+                raw_data JSONB DEFAULT '{}',
+                job_id INTEGER,
+                processing_status TEXT NOT NULL DEFAULT 'pending',
+                processing_error TEXT,
+                received_at TIMESTAMPTZ DEFAULT NOW(),
+                processed_at TIMESTAMPTZ
+            )
+        """)
+        for name in MIGRATIONS:
+            # Each statement on its own - CREATE INDEX CONCURRENTLY can't share a transaction
+            for statement in migration_statements((MIGRATIONS_DIR / name).read_text()):
+                cur.execute(statement)
+
+
+
+def setup_pipeline_schema(conn, schema: str):
+    """setup_schema plus everything process_jobs() writes to when saving a job"""
+    setup_schema(conn, schema)
+    with conn.cursor() as cur:
+        cur.execute("""
+            ALTER TABLE jobs
+                ADD COLUMN is_fractional BOOLEAN, ADD COLUMN hours_per_week TEXT,
+                ADD COLUMN is_remote BOOLEAN, ADD COLUMN role_category TEXT,
+                ADD COLUMN salary_min INTEGER, ADD COLUMN salary_max INTEGER,
+                ADD COLUMN salary_currency TEXT, ADD COLUMN description_snippet TEXT,
+                ADD COLUMN responsibilities TEXT[], ADD COLUMN requirements TEXT[],
+                ADD COLUMN benefits TEXT[], ADD COLUMN skills_required TEXT[],
+                ADD COLUMN about_company TEXT, ADD COLUMN company_domain TEXT,
+                ADD COLUMN classification_confidence REAL, ADD COLUMN classification_reasoning TEXT,
+                ADD COLUMN updated_date TIMESTAMPTZ
+        """)
+        for name in ['011_job_embeddings.sql', '013_job_fingerprints.sql', '014_job_classification_versions.sql']:
+            cur.execute((MIGRATIONS_DIR / name).read_text())
+
+def seed(conn, rows: int, pending_ratio: float, offset: int = 0):
+    """Insert rows raw_jobs, pending_ratio of them still pending"""
+    with conn.cursor() as cur:
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        cur.execute("""
+            INSERT INTO raw_jobs (source, source_id, job_id, processing_status, received_at, processed_at)
+            SELECT
+                (%s::text[])[1 + (g %% %s)],
+                'src-' || g,
+                NULL,
+                CASE WHEN random() < %s THEN 'pending' ELSE 'processed' END,
+                NOW() - (g || ' seconds')::interval,
+                NOW()
+            FROM generate_series(%s, %s) g
+        """, (SOURCES, len(SOURCES), pending_ratio, offset + 1, offset + rows))
+        cur.execute("ANALYZE raw_jobs")
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def prepared(cur, sql: str, args: list) -> str:
+    """PREPARE the claim like asyncpg does and return the matching EXECUTE"""
+    cur.execute("DEALLOCATE ALL")
+    cur.execute(f"PREPARE claim AS {sql}")
+    return "EXECUTE claim(" + ", ".join(["%s"] * len(args)) + ")"
+
+
+def check_plan(conn, sql: str, args: list, generic: bool = False) -> tuple[bool, str]:
+    """True if raw_jobs is reached through a pending partial index and never seq scanned"""
+    with conn.cursor() as cur:
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        # asyncpg reuses prepared statements, and after a few executions
+        # Postgres may settle on a generic plan - that one has to hold up too
+        cur.execute(f"SET plan_cache_mode = {'force_generic_plan' if generic else 'auto'}")
+        execute = prepared(cur, sql, args)
+        cur.execute("EXPLAIN (FORMAT JSON) " + execute, args)
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        cur.execute("RESET plan_cache_mode")
+    conn.rollback()
+
+    nodes = list(plan_nodes(plan[0]['Plan']))
+    seq_scans = [n for n in nodes if n['Node Type'] == 'Seq Scan' and n.get('Relation Name') == 'raw_jobs']
+    index_scans = [n for n in nodes if n.get('Index Name') in PENDING_INDEXES]
+    used = ', '.join(sorted({f"{n['Node Type']} using {n['Index Name']}" for n in index_scans})) or 'none'
+    return bool(index_scans) and not seq_scans, used
+
+
+def time_claim(conn, sql: str, args: list, repeats: int = 15) -> float:
+    """Median claim time in ms - each claim is rolled back so the backlog stays put"""
+    timings = []
+    with conn.cursor() as cur:
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        execute = prepared(cur, sql, args)
+        conn.commit()
+        for _ in range(repeats):
+            start = time.perf_counter()
+            cur.execute(execute, args)
+            cur.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+            conn.rollback()
+    return statistics.median(timings)
+
+
+def main(rows: int, pending_ratio: float, keep: bool) -> int:
+    database_url = os.environ.get('PLAN_CHECK_DATABASE_URL')
+    if not database_url:
+        print("PLAN_CHECK_DATABASE_URL not set - point it at a local, disposable Postgres")
+        return 2
+
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    failures = 0
+
+    try:
+        print(f"Seeding {rows:,} raw_jobs ({pending_ratio:.1%} pending)...")
+        setup_schema(conn)
+        seed(conn, rows, pending_ratio)
+        conn.autocommit = False
+
+        cases = [
+            ('any source', CLAIM_SQL_ANY_SOURCE, [600, 'plan-check', 10]),
+            ('by source', CLAIM_SQL_BY_SOURCE, [600, 'plan-check', 10, 'ashby']),
+        ]
+
+        baseline = {}
+        for name, sql, args in cases:
+            for generic in (False, True):
+                ok, used = check_plan(conn, sql, args, generic)
+                print(f"  [{'PASS' if ok else 'FAIL'}] plan ({name}, {'generic' if generic else 'custom'}): {used}")
+                failures += not ok
+            baseline[name] = time_claim(conn, sql, args)
+            print(f"         claim median: {baseline[name]:.2f} ms")
+
+        # Double the processed history - claim time must not follow it
+        print(f"\nAdding {rows:,} more processed rows...")
+        conn.autocommit = True
+        seed(conn, rows, 0.0, offset=rows)
+        conn.autocommit = False
+
+        for name, sql, args in cases:
+            after = time_claim(conn, sql, args)
+            # Generous bound - timing noise on a laptop, but a seq scan would blow well past it
+            ok = after <= max(baseline[name] * 2, baseline[name] + 5)
+            print(f"  [{'PASS' if ok else 'FAIL'}] claim ({name}) with 2x history: "
+                  f"{baseline[name]:.2f} → {after:.2f} ms")
+            failures += not ok
+
+    finally:
+        if not keep:
+            conn.rollback()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+
+    print(f"\n{'FAILED' if failures else 'OK'}: {failures} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check the pending raw_jobs claim uses its partial index')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='raw_jobs rows to seed')
+    parser.add_argument('--pending-ratio', type=float, default=0.01, help='Fraction of seeded rows left pending')
+    parser.add_argument('--keep', action='store_true', help=f'Keep the {SCHEMA} schema for inspection')
+
+    args = parser.parse_args()
+    sys.exit(main(args.rows, args.pending_ratio, args.keep))
@@ -4,37 +4,67 @@ Pydantic AI Job Classification Script
 
 ETL Pipeline:
 1. Read from raw_jobs table (staging)
-2. Process with Pydantic AI to extract and structure
-3. Update structured jobs table
-4. Mark raw_jobs as processed
+2. Classify with a cheap, short-prompt model (escalating low-confidence results)
+3. Editorial rewrite only for jobs worth featuring (fractional + UK by default)
+4. Update structured jobs table and the job's matching embedding
+5. Mark raw_jobs as processed
 
-Every job gets the full Condé Nast editorial treatment.
+Jobs that pass the editorial filter get the full Condé Nast editorial treatment.
 """
 
 import os
+import sys
 import json
 import asyncio
+import logging
+import hashlib
 import httpx
 from datetime import datetime
-from typing import Optional
+from pathlib import Path
+from typing import Annotated, Any, Optional
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError, WithJsonSchema, create_model
 from pydantic_ai import Agent
 
+from job_dedupe import DEDUPE_ENABLED, find_canonicals, minhash, posting_text, record_fingerprint, split_batch
+from job_matching import embed_job, upsert_job_embedding
+from job_text import BoilerplateFilter, estimate_tokens, prepare_description
+from materialize_matches import MATCH_MATERIALIZE_ENABLED, materialize, queue_job
+from pipeline_metrics import PipelineMetrics
+from raw_jobs_queue import (
+    CLAIM_BATCH_SIZE,
+    claim_pending_raw_jobs,
+    create_pool,
+    default_worker_id,
+    mark_raw_job_processed,
+    reap_expired_leases,
+    release_leases,
+)
+
 # ZEP sync configuration
 ZEP_SYNC_ENABLED = os.environ.get('ZEP_SYNC_ENABLED', 'true').lower() == 'true'
 API_BASE_URL = os.environ.get('API_BASE_URL', 'https://fractional.quest')
 REVALIDATE_SECRET = os.environ.get('REVALIDATE_SECRET', '')
 
+# Jobs in flight at once; DB writes share a small asyncpg pool so they never
+# block the event loop under the model calls
+CLASSIFY_CONCURRENCY = int(os.environ.get('CLASSIFY_CONCURRENCY', '4'))
+
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
 
+# shared/ lives at the repo root, one level up
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from shared.llm_quota import limit_agent
+from shared.structured_logging import configure_logging
 
-class StructuredJob(BaseModel):
-    """Structured job data extracted and enhanced by AI"""
+logger = logging.getLogger(__name__)
+
+
+class JobClassificationFields(BaseModel):
+    """Classification fields - cheap to extract, needed for every job"""
 
     # Classification
     employment_type: str = Field(description="One of: full-time, part-time, fractional, contract, interim")
@@ -60,7 +90,16 @@ class StructuredJob(BaseModel):
     salary_currency: str = Field(default="GBP", description="Currency code: GBP, USD, EUR")
     salary_type: str = Field(default="daily", description="One of: daily, annual, hourly")
 
-    # Editorial Content
+
+class JobClassification(JobClassificationFields):
+    """Output of the cheap classification pass"""
+
+    confidence: float = Field(ge=0.0, le=1.0, description="How confident you are in this classification, 0-1. Use below 0.7 when the posting is ambiguous or missing key details.")
+
+
+class EditorialContent(BaseModel):
+    """Editorial rewrite - only produced for jobs that pass the editorial filter"""
+
     summary: str = Field(description="""
         Compelling 2-3 sentence summary that sells the opportunity.
         Editorial voice - sophisticated, exciting but professional.
@@ -151,34 +190,28 @@ class StructuredJob(BaseModel):
     """)
 
 
-# Create the Pydantic AI agent using Google Gemini
-# Set GEMINI_API_KEY or GOOGLE_API_KEY in environment
-agent = Agent(
-    'google-gla:gemini-2.0-flash',
-    output_type=StructuredJob,
-    system_prompt="""You are the senior content editor for Fractional.Quest, the UK's premier platform for fractional executive opportunities.
+class StructuredJob(JobClassificationFields, EditorialContent):
+    """Structured job data extracted and enhanced by AI"""
 
-Your role is to transform raw job postings into beautifully crafted, editorially polished listings that attract top-tier fractional talent.
 
-## Editorial Style Guide
+# Models for the cascade - set GEMINI_API_KEY or GOOGLE_API_KEY in environment
+CLASSIFIER_MODEL = os.environ.get('CLASSIFIER_MODEL', 'google-gla:gemini-2.0-flash-lite')
+ESCALATION_MODEL = os.environ.get('ESCALATION_MODEL', 'google-gla:gemini-2.0-flash')
+EDITORIAL_MODEL = os.environ.get('EDITORIAL_MODEL', 'google-gla:gemini-2.0-flash')
+# Classifications below this confidence are re-run on ESCALATION_MODEL
+ESCALATION_CONFIDENCE = float(os.environ.get('ESCALATION_CONFIDENCE', '0.7'))
 
-**Voice & Tone:**
-- Condé Nast meets Bloomberg - sophisticated, authoritative, yet accessible
-- Confident and aspirational without being hyperbolic
-- Professional but never stuffy or corporate
-- British English spelling and conventions
+# --pack: jobs whose cleaned description is at most PACK_JOB_MAX_TOKENS are
+# grouped, up to PACK_MAX_JOBS / PACK_TOKEN_BUDGET, into one call per tier
+PACK_JOB_MAX_TOKENS = int(os.environ.get('PACK_JOB_MAX_TOKENS', '600'))
+PACK_TOKEN_BUDGET = int(os.environ.get('PACK_TOKEN_BUDGET', '4000'))
+PACK_MAX_JOBS = int(os.environ.get('PACK_MAX_JOBS', '6'))
 
-**Content Principles:**
-- Frame every role as an exciting opportunity, not just a job
-- Emphasize strategic impact and meaningful work
-- For fractional roles, highlight flexibility as a feature, not a limitation
-- Be specific and concrete - avoid vague corporate speak
-- Use active voice and dynamic verbs
+UK_COUNTRIES = {'united kingdom', 'uk', 'england', 'scotland', 'wales', 'northern ireland'}
 
-**When Extracting Data:**
+CLASSIFICATION_RULES = """**When Extracting Data:**
 - Parse compensation carefully: look for £, $, €, "per day", "daily", "p/d", "per annum", "pa", etc.
 - Fractional indicators: "fractional", "part-time", "2-3 days", "days per week", "portfolio", etc.
-- Extract skills throughout the description, not just from requirements
 - Normalize locations properly (London, not "London, England, United Kingdom")
 - Identify the true seniority - "Fractional CFO" is Executive level
 
@@ -206,6 +239,36 @@ seniority_level MUST be exactly one of: Executive, Director, Manager, Senior, Mi
 - Mid: Mid-level individual contributors (no senior/junior prefix)
 - Junior: Entry-level, Associates, Junior titles
 - Intern: Interns, Apprentices, Graduate schemes
+"""
+
+CLASSIFIER_PROMPT = f"""You classify job postings for Fractional.Quest, a UK platform for fractional executive roles.
+
+Extract the classification fields only. Be precise and literal - do not rewrite any content.
+
+{CLASSIFICATION_RULES}"""
+
+EDITORIAL_PROMPT = """You are the senior content editor for Fractional.Quest, the UK's premier platform for fractional executive opportunities.
+
+Your role is to transform raw job postings into beautifully crafted, editorially polished listings that attract top-tier fractional talent.
+
+## Editorial Style Guide
+
+**Voice & Tone:**
+- Condé Nast meets Bloomberg - sophisticated, authoritative, yet accessible
+- Confident and aspirational without being hyperbolic
+- Professional but never stuffy or corporate
+- British English spelling and conventions
+
+**Content Principles:**
+- Frame every role as an exciting opportunity, not just a job
+- Emphasize strategic impact and meaningful work
+- For fractional roles, highlight flexibility as a feature, not a limitation
+- Be specific and concrete - avoid vague corporate speak
+- Use active voice and dynamic verbs
+
+**When Writing:**
+- Extract skills throughout the description, not just from requirements
+- The job has already been classified - use the classification you are given to prioritise links
 
 **Quality Standards:**
 - Every listing should read like it belongs in a premium publication
@@ -232,8 +295,87 @@ CRITICAL RULES:
 
 Remember: You're not just extracting data - you're crafting content that represents our brand.
 """
+
+PACKED_PROMPT_SUFFIX = """
+
+## Several Jobs Per Request
+
+You will be given several job postings, each under a "### Job <raw_id>" heading.
+Handle each one independently, exactly as if it were the only job, and return
+one item per job with raw_id copied exactly from its heading."""
+
+# Tier 1: short prompt, cheap model, classification fields only
+classifier_agent = Agent(
+    CLASSIFIER_MODEL,
+    output_type=JobClassification,
+    system_prompt=CLASSIFIER_PROMPT
+)
+
+# Tier 2: the full editorial rewrite
+agent = Agent(
+    EDITORIAL_MODEL,
+    output_type=EditorialContent,
+    system_prompt=EDITORIAL_PROMPT
+)
+
+
+class PackedJobClassification(JobClassification):
+    raw_id: str = Field(description="The raw_id from the job's heading, copied exactly")
+
+
+class PackedEditorialContent(EditorialContent):
+    raw_id: str = Field(description="The raw_id from the job's heading, copied exactly")
+
+
+def packed_output(item_model: type[BaseModel]) -> type[BaseModel]:
+    """
+    Output type for a packed call.
+
+    The model sees the full item schema, but items are validated one at a
+    time afterwards - a single malformed job then only costs its own
+    single-job retry instead of failing (and re-running) the whole pack.
+    """
+    items = Annotated[
+        list[dict[str, Any]],
+        WithJsonSchema({'type': 'array', 'items': item_model.model_json_schema()})
+    ]
+    return create_model(
+        f'Packed{item_model.__name__}List',
+        __doc__=f'One {item_model.__name__} per job in the request',
+        jobs=(items, Field(description="One entry per job, each with its raw_id")),
+    )
+
+
+def prompt_version(prompt: str, output_type: type[BaseModel]) -> str:
+    """Short hash of a tier's system prompt and output schema, stamped on every job it writes"""
+    schema = json.dumps(output_type.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(f"{prompt}\n{schema}".encode()).hexdigest()[:12]
+
+
+# Editing a tier's prompt or field descriptions changes its version, and
+# --reclassify-stale re-runs just that tier for the jobs stamped with the old one
+CLASSIFIER_VERSION = prompt_version(CLASSIFIER_PROMPT, JobClassification)
+EDITORIAL_VERSION = prompt_version(EDITORIAL_PROMPT, EditorialContent)
+
+
+# Short postings share one call (and one copy of the system prompt and schema)
+packed_classifier_agent = Agent(
+    CLASSIFIER_MODEL,
+    output_type=packed_output(PackedJobClassification),
+    system_prompt=CLASSIFIER_PROMPT + PACKED_PROMPT_SUFFIX
+)
+
+packed_editorial_agent = Agent(
+    EDITORIAL_MODEL,
+    output_type=packed_output(PackedEditorialContent),
+    system_prompt=EDITORIAL_PROMPT + PACKED_PROMPT_SUFFIX
 )
 
+# Backlog runs share the Gemini key with live voice traffic - every call waits
+# for batch-class quota, leaving LLM_QUOTA_BATCH_RESERVE to interactive callers
+for _agent in (classifier_agent, agent, packed_classifier_agent, packed_editorial_agent):
+    limit_agent(_agent, 'batch')
+
 
 def get_db_connection():
     """Get database connection"""
@@ -243,44 +385,32 @@ def get_db_connection():
     return psycopg2.connect(database_url)
 
 
-def fetch_pending_raw_jobs(conn, limit: int = 10, source: str = None) -> list[dict]:
-    """Fetch raw jobs pending classification"""
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        if source:
-            cur.execute("""
-                SELECT r.id as raw_id, r.source, r.source_id, r.raw_data, r.job_id,
-                       j.title, j.company_name, j.location, j.full_description,
-                       j.employment_type, j.seniority_level, j.compensation
-                FROM raw_jobs r
-                LEFT JOIN jobs j ON r.job_id = j.id
-                WHERE r.processing_status = 'pending'
-                AND r.source = %s
-                ORDER BY r.received_at DESC
-                LIMIT %s
-            """, (source, limit))
-        else:
-            cur.execute("""
-                SELECT r.id as raw_id, r.source, r.source_id, r.raw_data, r.job_id,
-                       j.title, j.company_name, j.location, j.full_description,
-                       j.employment_type, j.seniority_level, j.compensation
-                FROM raw_jobs r
-                LEFT JOIN jobs j ON r.job_id = j.id
-                WHERE r.processing_status = 'pending'
-                ORDER BY r.received_at DESC
-                LIMIT %s
-            """, (limit,))
-        return [dict(row) for row in cur.fetchall()]
-
-
-async def classify_job(raw_job: dict) -> StructuredJob:
-    """Classify a single job using Pydantic AI"""
+# Learned boilerplate fingerprints, persisted at the end of each run
+boilerplate_filter = BoilerplateFilter.load()
+
+
+def build_job_context(raw_job: dict) -> str:
+    """
+    Render a raw job into the prompt context shared by both tiers.
+
+    The description is cleaned and capped first; the token accounting is
+    left on raw_job['description_stats'] for the run summary.
+    """
 
     raw_data = raw_job.get('raw_data', {})
     if isinstance(raw_data, str):
         raw_data = json.loads(raw_data)
 
+    description, stats = prepare_description(
+        raw_job.get('full_description') or raw_data.get('job_description') or '',
+        company=raw_job.get('company_name') or raw_data.get('company_name', ''),
+        boilerplate=boilerplate_filter
+    )
+    raw_job['description_stats'] = stats
+    raw_job['clean_description'] = description
+
     # Build comprehensive context
-    context = f"""
+    return f"""
 ## Job Details
 
 **Title:** {raw_job.get('title') or raw_data.get('job_title', 'Unknown')}
@@ -293,7 +423,7 @@ async def classify_job(raw_job: dict) -> StructuredJob:
 
 ## Full Job Description
 
-{raw_job.get('full_description') or raw_data.get('job_description', 'No description available')}
+{description or 'No description available'}
 
 ## Additional Context
 
@@ -303,69 +433,432 @@ async def classify_job(raw_job: dict) -> StructuredJob:
 - Source: {raw_job.get('source', 'Unknown')}
 """
 
-    result = await agent.run(f"Please analyze and structure this job posting into our editorial format:\n\n{context}")
+
+def needs_editorial(classification: JobClassificationFields) -> bool:
+    """Only fractional UK roles get the expensive editorial rewrite"""
+    return classification.is_fractional and (classification.country or '').strip().lower() in UK_COUNTRIES
+
+
+async def classify_fields(
+    context: str,
+    metrics: PipelineMetrics,
+    record: dict = None,
+    packed: Optional[JobClassification] = None
+) -> JobClassification:
+    """Tier 1: cheap classification (or a packed result), escalated to a stronger model when unsure"""
+    prompt = classify_prompt(context)
+    if packed is not None:
+        classification = packed
+    else:
+        with metrics.stage('llm_classify', record):
+            result = await classifier_agent.run(prompt)
+        metrics.record_usage('classifier', result, record)
+        classification = result.output
+
+    if classification.confidence < ESCALATION_CONFIDENCE and ESCALATION_MODEL != CLASSIFIER_MODEL:
+        with metrics.stage('llm_escalate', record):
+            result = await classifier_agent.run(prompt, model=ESCALATION_MODEL)
+        metrics.record_usage('escalation', result, record)
+        classification = result.output
+
+    return classification
+
+
+async def write_editorial(
+    context: str,
+    classification: JobClassificationFields,
+    metrics: PipelineMetrics,
+    record: dict = None
+) -> EditorialContent:
+    """Tier 2: full editorial rewrite"""
+    with metrics.stage('llm_editorial', record):
+        result = await agent.run(editorial_prompt(context, classification))
+    metrics.record_usage('editorial', result, record)
     return result.output
 
 
-def update_structured_job(conn, job_id: str, structured: StructuredJob):
-    """Update the jobs table with AI-structured data"""
-    with conn.cursor() as cur:
-        cur.execute("""
-            UPDATE jobs SET
-                employment_type = %s,
-                is_fractional = %s,
-                hours_per_week = %s,
-                is_remote = %s,
-                seniority_level = %s,
-                role_category = %s,
-                salary_min = %s,
-                salary_max = %s,
-                salary_currency = %s,
-                description_snippet = %s,
-                full_description = %s,
-                responsibilities = %s,
-                requirements = %s,
-                benefits = %s,
-                skills_required = %s,
-                about_company = %s,
-                company_domain = %s,
-                classification_confidence = 1.0,
-                classification_reasoning = %s,
-                updated_date = NOW()
-            WHERE id = %s
-        """, (
-            structured.employment_type,
-            structured.is_fractional,
-            structured.days_per_week,
-            structured.is_remote,
-            structured.seniority_level,
-            structured.role_category,
-            structured.salary_min,
-            structured.salary_max,
-            structured.salary_currency,
-            structured.summary,
-            structured.opportunity_description,
-            structured.responsibilities,
-            structured.requirements,
-            structured.benefits,
-            structured.skills_required,
-            structured.about_company,
-            structured.company_domain,
-            f"Pydantic AI - Vertical: {structured.vertical}, City: {structured.city}, Country: {structured.country}",
-            job_id
-        ))
+def classify_prompt(context: str) -> str:
+    return f"Classify this job posting:\n\n{context}"
+
+
+def editorial_prompt(context: str, classification: JobClassificationFields) -> str:
+    return "Please write our editorial content for this job posting.\n\n" + editorial_brief(context, classification)
+
+
+def editorial_brief(context: str, classification: JobClassificationFields) -> str:
+    return (
+        f"## Classification\n\n"
+        f"- Role Category: {classification.role_category}\n"
+        f"- Seniority: {classification.seniority_level}\n"
+        f"- Employment Type: {classification.employment_type}"
+        f"{' (fractional, ' + classification.days_per_week + ')' if classification.days_per_week else ''}\n"
+        f"- Location: {classification.city or 'Unknown'}, {classification.country}\n"
+        f"{context}"
+    )
+
+
+# ============================================================================
+# PACKING
+# ============================================================================
+
+def pack_jobs(jobs: list[dict]) -> list[list[dict]]:
+    """Group small jobs into packs bounded by count and estimated tokens; big jobs stay single"""
+    packs: list[list[dict]] = []
+    current: list[dict] = []
+    current_tokens = 0
+    for job in jobs:
+        stats = job.get('description_stats')
+        if stats is None or stats.clean_tokens > PACK_JOB_MAX_TOKENS:
+            continue
+        tokens = estimate_tokens(job['context'])
+        if current and (len(current) >= PACK_MAX_JOBS or current_tokens + tokens > PACK_TOKEN_BUDGET):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(job)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    # A pack of one saves nothing
+    return [pack for pack in packs if len(pack) > 1]
+
+
+def unpack(pack: list[dict], items, item_model: type[BaseModel], result_model: type[BaseModel]) -> dict:
+    """Validate packed items one by one; missing, duplicated or invalid ones are left out"""
+    wanted = {str(job['raw_id']) for job in pack}
+    by_id: dict[str, list] = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            parsed = item_model.model_validate(item)
+        except ValidationError:
+            continue
+        if parsed.raw_id in wanted:
+            by_id.setdefault(parsed.raw_id, []).append(parsed)
+    return {
+        raw_id: result_model.model_validate(parsed[0].model_dump(exclude={'raw_id'}))
+        for raw_id, parsed in by_id.items()
+        if len(parsed) == 1
+    }
+
+
+async def classify_pack(pack: list[dict], metrics: PipelineMetrics) -> dict[str, JobClassification]:
+    sections = [f"### Job {job['raw_id']}\n{job['context']}" for job in pack]
+    with metrics.stage('llm_classify_packed'):
+        result = await packed_classifier_agent.run(
+            "Classify each of these job postings:\n\n" + '\n\n'.join(sections)
+        )
+    metrics.record_usage('classifier_packed', result)
+    return unpack(pack, result.output.jobs, PackedJobClassification, JobClassification)
+
+
+async def write_editorial_pack(pack: list[dict], metrics: PipelineMetrics) -> dict[str, EditorialContent]:
+    sections = [
+        f"### Job {job['raw_id']}\n{editorial_brief(job['context'], job['packed_classification'])}"
+        for job in pack
+    ]
+    with metrics.stage('llm_editorial_packed'):
+        result = await packed_editorial_agent.run(
+            "Please write our editorial content for each of these job postings.\n\n" + '\n\n'.join(sections)
+        )
+    metrics.record_usage('editorial_packed', result)
+    return unpack(pack, result.output.jobs, PackedEditorialContent, EditorialContent)
+
+
+def prepare_batch(jobs: list[dict], metrics: PipelineMetrics):
+    """Build each claimed job's prompt context and near-duplicate signature up front"""
+    with metrics.stage('prepare'):
+        for job in jobs:
+            try:
+                job['context'] = build_job_context(job)
+            except Exception:
+                # Left for classify_job to fail on, inside process_job's error handling
+                continue
+            if DEDUPE_ENABLED:
+                job['signature'] = minhash(posting_text(job))
 
 
-def mark_raw_job_processed(conn, raw_id: str, status: str = 'processed', error: str = None):
-    """Update raw_jobs status after processing"""
-    with conn.cursor() as cur:
-        cur.execute("""
-            UPDATE raw_jobs SET
-                processing_status = %s,
-                processed_at = NOW(),
-                processing_error = %s
-            WHERE id = %s
-        """, (status, error, raw_id))
+def reusable_output(structured: Optional[dict], editorial_all: bool) -> JobClassification | StructuredJob | None:
+    """A canonical's stored output, if it covers what this run would produce"""
+    if not structured or structured.get('classifier_version') != CLASSIFIER_VERSION:
+        return None
+    if 'summary' in structured and structured.get('editorial_version') != EDITORIAL_VERSION:
+        return None
+    try:
+        if 'summary' in structured:
+            return StructuredJob.model_validate(structured)
+        if editorial_all:
+            return None
+        return JobClassification.model_validate(structured)
+    except ValidationError:
+        return None
+
+
+async def attach_duplicates(pool, jobs: list[dict], editorial_all: bool, metrics: PipelineMetrics) -> int:
+    """Point jobs that match an indexed canonical at its output (job['duplicate_of'])"""
+    signatures = {job['raw_id']: job['signature'] for job in jobs if job.get('signature') is not None}
+    if not signatures:
+        return 0
+    with metrics.stage('db_dedupe'):
+        async with pool.acquire() as conn:
+            found = await find_canonicals(conn, signatures)
+    attached = 0
+    for job in jobs:
+        if job['raw_id'] not in found:
+            continue
+        canonical, score, structured = found[job['raw_id']]
+        reused = reusable_output(structured, editorial_all)
+        if reused is not None:
+            job['duplicate_of'] = (canonical, score, reused)
+            attached += 1
+    return attached
+
+
+async def prefill_packed(jobs: list[dict], editorial_all: bool, metrics: PipelineMetrics, limit) -> int:
+    """
+    Run the packed calls for a claimed batch and leave results on each job
+    (packed_classification / packed_editorial) for classify_job to pick up.
+
+    Anything a pack drops, garbles or fails on simply goes through the
+    normal per-job calls. Returns the number of jobs served from packs.
+    """
+    async def run_pack(call, pack):
+        async with limit:
+            try:
+                return await call(pack, metrics)
+            except Exception as e:
+                logger.warning("Packed call of %d jobs failed, falling back to single calls: %s", len(pack), e)
+                return {}
+
+    packs = pack_jobs([job for job in jobs if 'context' in job])
+    for results in await asyncio.gather(*(run_pack(classify_pack, pack) for pack in packs)):
+        for job in jobs:
+            if str(job['raw_id']) in results:
+                job['packed_classification'] = results[str(job['raw_id'])]
+
+    # Only confident classifications go on to a packed editorial - anything
+    # escalated may change, so its editorial is written after the escalation
+    editorial_jobs = [
+        job for job in jobs
+        if job.get('packed_classification') is not None
+        and job['packed_classification'].confidence >= ESCALATION_CONFIDENCE
+        and (editorial_all or needs_editorial(job['packed_classification']))
+    ]
+    packs = pack_jobs(editorial_jobs)
+    for results in await asyncio.gather(*(run_pack(write_editorial_pack, pack) for pack in packs)):
+        for job in editorial_jobs:
+            if str(job['raw_id']) in results:
+                job['packed_editorial'] = results[str(job['raw_id'])]
+
+    return sum('packed_classification' in job for job in jobs)
+
+
+async def classify_job(
+    raw_job: dict,
+    editorial_all: bool = False,
+    metrics: PipelineMetrics = None,
+    record: dict = None
+) -> JobClassification | StructuredJob:
+    """
+    Classify a single job using Pydantic AI.
+
+    Returns a StructuredJob when the job got the editorial rewrite, otherwise
+    just the JobClassification.
+    """
+    metrics = metrics or PipelineMetrics()
+    context = raw_job.get('context')
+    if context is None:
+        with metrics.stage('prepare', record):
+            context = build_job_context(raw_job)
+    classification = await classify_fields(context, metrics, record, raw_job.get('packed_classification'))
+
+    if not (editorial_all or needs_editorial(classification)):
+        return classification
+
+    editorial = raw_job.get('packed_editorial') or await write_editorial(context, classification, metrics, record)
+    return StructuredJob(
+        **classification.model_dump(exclude={'confidence'}),
+        **editorial.model_dump()
+    )
+
+
+async def update_job_classification(conn, job_id: int, classification: JobClassification):
+    """Update only the classification columns - editorial content is left alone"""
+    await conn.execute("""
+        UPDATE jobs SET
+            employment_type = $1,
+            is_fractional = $2,
+            hours_per_week = $3,
+            is_remote = $4,
+            seniority_level = $5,
+            role_category = $6,
+            salary_min = $7,
+            salary_max = $8,
+            salary_currency = $9,
+            company_domain = $10,
+            classification_confidence = $11,
+            classification_reasoning = $12,
+            updated_date = NOW()
+        WHERE id = $13
+    """,
+        classification.employment_type,
+        classification.is_fractional,
+        classification.days_per_week,
+        classification.is_remote,
+        classification.seniority_level,
+        classification.role_category,
+        classification.salary_min,
+        classification.salary_max,
+        classification.salary_currency,
+        classification.company_domain,
+        classification.confidence,
+        f"Pydantic AI - Vertical: {classification.vertical}, City: {classification.city}, Country: {classification.country}",
+        job_id
+    )
+
+
+async def update_structured_job(conn, job_id: int, structured: StructuredJob):
+    """Update the jobs table with AI-structured data"""
+    await conn.execute("""
+        UPDATE jobs SET
+            employment_type = $1,
+            is_fractional = $2,
+            hours_per_week = $3,
+            is_remote = $4,
+            seniority_level = $5,
+            role_category = $6,
+            salary_min = $7,
+            salary_max = $8,
+            salary_currency = $9,
+            description_snippet = $10,
+            full_description = $11,
+            responsibilities = $12,
+            requirements = $13,
+            benefits = $14,
+            skills_required = $15,
+            about_company = $16,
+            company_domain = $17,
+            classification_confidence = 1.0,
+            classification_reasoning = $18,
+            updated_date = NOW()
+        WHERE id = $19
+    """,
+        structured.employment_type,
+        structured.is_fractional,
+        structured.days_per_week,
+        structured.is_remote,
+        structured.seniority_level,
+        structured.role_category,
+        structured.salary_min,
+        structured.salary_max,
+        structured.salary_currency,
+        structured.summary,
+        structured.opportunity_description,
+        structured.responsibilities,
+        structured.requirements,
+        structured.benefits,
+        structured.skills_required,
+        structured.about_company,
+        structured.company_domain,
+        f"Pydantic AI - Vertical: {structured.vertical}, City: {structured.city}, Country: {structured.country}",
+        job_id
+    )
+
+
+async def update_job_editorial(conn, job_id: int, editorial: EditorialContent):
+    """Update only the editorial columns - for an editorial-only refresh"""
+    await conn.execute("""
+        UPDATE jobs SET
+            description_snippet = $1,
+            full_description = $2,
+            responsibilities = $3,
+            requirements = $4,
+            benefits = $5,
+            skills_required = $6,
+            about_company = $7,
+            updated_date = NOW()
+        WHERE id = $8
+    """,
+        editorial.summary,
+        editorial.opportunity_description,
+        editorial.responsibilities,
+        editorial.requirements,
+        editorial.benefits,
+        editorial.skills_required,
+        editorial.about_company,
+        job_id
+    )
+
+
+async def save_job(pool, job: dict, structured: JobClassification | StructuredJob):
+    """Job update, embedding and processed mark in one short transaction"""
+    vector = embed_job(job, structured) if job['job_id'] else None
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if job['job_id']:
+                if isinstance(structured, StructuredJob):
+                    await update_structured_job(conn, job['job_id'], structured)
+                else:
+                    await update_job_classification(conn, job['job_id'], structured)
+                await upsert_job_embedding(conn, job['job_id'], vector)
+                if MATCH_MATERIALIZE_ENABLED:
+                    await queue_job(conn, job['job_id'])
+                await stamp_versions(conn, job['job_id'], structured)
+            if job.get('signature') is not None:
+                await record_fingerprint(conn, job['raw_id'], job['signature'], {
+                    **structured.model_dump(mode='json'),
+                    'classifier_version': CLASSIFIER_VERSION,
+                    'editorial_version': EDITORIAL_VERSION if isinstance(structured, StructuredJob) else None,
+                })
+            await mark_raw_job_processed(conn, job['raw_id'], 'processed')
+
+
+async def stamp_versions(
+    conn,
+    job_id: int,
+    structured: JobClassification | StructuredJob,
+    editorial_version: Optional[str] = None
+):
+    """
+    Record which prompt versions produced a job's columns, with its tier-1
+    fields so an editorial-only refresh doesn't need to classify again.
+
+    editorial_version defaults to the current one for a StructuredJob and to
+    NULL (no editorial) otherwise; pass it to keep an existing editorial's stamp.
+    """
+    if editorial_version is None and isinstance(structured, StructuredJob):
+        editorial_version = EDITORIAL_VERSION
+    await conn.execute("""
+        INSERT INTO job_classification_versions
+            (job_id, classifier_version, editorial_version, classification, updated_at)
+        VALUES ($1, $2, $3, $4, NOW())
+        ON CONFLICT (job_id) DO UPDATE SET
+            classifier_version = EXCLUDED.classifier_version,
+            editorial_version = EXCLUDED.editorial_version,
+            classification = EXCLUDED.classification,
+            updated_at = NOW()
+    """, job_id, CLASSIFIER_VERSION, editorial_version, classification_fields(structured))
+
+
+def classification_fields(structured: JobClassification | StructuredJob) -> dict:
+    return structured.model_dump(mode='json', include=set(JobClassification.model_fields))
+
+
+async def save_duplicate(pool, job: dict, structured: JobClassification | StructuredJob, canonical, score: float):
+    """
+    Copy a canonical's output onto a near-duplicate's job row and link the two.
+
+    No embedding, match queue entry or ZEP sync - the canonical already
+    represents this role there, and candidates shouldn't see it twice.
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if job['job_id']:
+                if isinstance(structured, StructuredJob):
+                    await update_structured_job(conn, job['job_id'], structured)
+                else:
+                    await update_job_classification(conn, job['job_id'], structured)
+                await stamp_versions(conn, job['job_id'], structured)
+            await record_fingerprint(conn, job['raw_id'], job['signature'], canonical_raw_id=canonical, score=score)
+            await mark_raw_job_processed(conn, job['raw_id'], 'processed')
 
 
 async def sync_job_to_zep(job_id: str, structured: StructuredJob, title: str, company: str, location: str) -> bool:
@@ -391,83 +884,239 @@ async def sync_job_to_zep(job_id: str, structured: StructuredJob, title: str, co
             if response.status_code == 200:
                 return True
             else:
-                print(f"    ⚠ ZEP sync failed: {response.status_code}")
+                logger.warning("ZEP sync failed for job %s: %s", job_id, response.status_code)
                 return False
     except Exception as e:
-        print(f"    ⚠ ZEP sync error: {str(e)[:50]}")
+        logger.warning("ZEP sync error for job %s: %s", job_id, e)
         return False
 
 
-async def process_jobs(limit: int = 10, source: str = None):
-    """Main processing function"""
-    conn = get_db_connection()
+async def process_job(
+    pool,
+    job: dict,
+    editorial_all: bool,
+    metrics: PipelineMetrics,
+    label: str
+) -> dict:
+    """
+    Classify, save and sync one claimed job.
+
+    Logs one record per job (event classify.job) with the classification
+    as fields, so concurrent jobs don't interleave and sampling drops whole jobs.
+    """
+    title = job.get('title') or job.get('raw_data', {}).get('job_title', 'Unknown')
+    company = job.get('company_name') or job.get('raw_data', {}).get('company_name', 'Unknown')
+    fields = {'event': 'classify.job', 'raw_id': str(job['raw_id']), 'source': job['source']}
+    record = metrics.start_job(job['raw_id'])
+    outcome = {'status': 'error', 'editorial': False, 'stats': None}
 
     try:
-        jobs = fetch_pending_raw_jobs(conn, limit, source)
+        duplicate_of = job.get('duplicate_of')
+        if duplicate_of:
+            # Same posting from another source - reuse its canonical's output
+            canonical, score, structured = duplicate_of
+            fields.update(duplicate_of=str(canonical), similarity=round(score, 2))
+            with metrics.stage('db_update', record):
+                await save_duplicate(pool, job, structured, canonical, score)
+        else:
+            # Classify with Pydantic AI
+            structured = await classify_job(job, editorial_all, metrics, record)
+
+            # Update the structured jobs table and mark processed - committed
+            # before the ZEP sync, which reads the job back through the API
+            with metrics.stage('db_update', record):
+                await save_job(pool, job, structured)
+        has_editorial = isinstance(structured, StructuredJob)
+
+        if job['job_id'] and not duplicate_of:
+            with metrics.stage('zep_sync', record):
+                fields['zep_synced'] = await sync_job_to_zep(
+                    job['job_id'], structured, title, company,
+                    structured.city or job.get('location', 'UK')
+                )
+
+        fields.update(
+            employment_type=structured.employment_type,
+            is_fractional=structured.is_fractional,
+            city=structured.city,
+            country=structured.country,
+            is_remote=structured.is_remote,
+            vertical=structured.vertical,
+            seniority_level=structured.seniority_level,
+            editorial=has_editorial,
+        )
+        if structured.salary_min or structured.salary_max:
+            fields.update(
+                salary_currency=structured.salary_currency, salary_min=structured.salary_min,
+                salary_max=structured.salary_max, salary_type=structured.salary_type
+            )
+        if has_editorial:
+            fields['skills'] = len(structured.skills_required)
+        else:
+            fields['confidence'] = round(structured.confidence, 2)
+
+        stats = job.get('description_stats')
+        if stats:
+            fields.update(
+                raw_tokens=stats.raw_tokens, clean_tokens=stats.clean_tokens,
+                boilerplate_paragraphs=stats.boilerplate_paragraphs, truncated=stats.truncated
+            )
+
+        outcome = {'status': 'processed', 'editorial': has_editorial, 'stats': stats, 'duplicate': bool(duplicate_of)}
+        metrics.end_job(
+            record, 'processed',
+            editorial=has_editorial,
+            duplicate=bool(duplicate_of),
+            description_tokens=stats.clean_tokens if stats else None
+        )
+        logger.info("[%s] %s at %s: %s", label, title, company,
+                    'duplicate' if duplicate_of else 'classified', extra=fields)
+
+    except Exception as e:
+        with metrics.stage('db_update', record):
+            await mark_raw_job_processed(pool, job['raw_id'], 'error', str(e))
+        metrics.end_job(record, 'error', error=str(e)[:200])
+        logger.warning("[%s] %s at %s failed: %s", label, title, company, e, extra=fields)
+
+    return outcome
+
+
+async def process_jobs(
+    limit: int = 10,
+    source: str = None,
+    editorial_all: bool = False,
+    metrics_jsonl: str = None,
+    metrics_prom: str = None,
+    worker_id: str = None,
+    concurrency: int = CLASSIFY_CONCURRENCY,
+    pack: bool = False
+):
+    """Main processing function - safe to run as several workers at once"""
+    metrics = PipelineMetrics(jsonl_path=metrics_jsonl)
+    worker_id = worker_id or default_worker_id()
+    pool = await create_pool()
+
+    try:
+        with metrics.stage('db_reap'):
+            reaped = await reap_expired_leases(pool)
         print(f"\n{'='*60}")
         print(f"PYDANTIC AI JOB CLASSIFICATION")
         print(f"{'='*60}")
-        print(f"Found {len(jobs)} pending jobs to classify")
+        print(f"Worker: {worker_id}, Concurrency: {concurrency}{', packing small jobs' if pack else ''}")
+        if reaped:
+            print(f"Returned {reaped} expired leases to pending")
         print(f"{'='*60}\n")
 
         success_count = 0
         error_count = 0
-
-        for i, job in enumerate(jobs):
-            title = job.get('title') or job.get('raw_data', {}).get('job_title', 'Unknown')
-            company = job.get('company_name') or job.get('raw_data', {}).get('company_name', 'Unknown')
-
-            print(f"\n[{i+1}/{len(jobs)}] {title}")
-            print(f"    Company: {company}")
-            print(f"    Source: {job['source']}")
-
-            try:
-                # Classify with Pydantic AI
-                structured = await classify_job(job)
-
-                # Update the structured jobs table
-                if job['job_id']:
-                    update_structured_job(conn, job['job_id'], structured)
-
-                    # Sync to ZEP knowledge graph
-                    zep_synced = await sync_job_to_zep(
-                        job['job_id'], structured, title, company,
-                        structured.city or job.get('location', 'UK')
-                    )
-                    if zep_synced:
-                        print(f"    ✓ Synced to ZEP graph")
-
-                # Mark as processed
-                mark_raw_job_processed(conn, job['raw_id'], 'processed')
-                conn.commit()
-
-                # Print summary
-                print(f"    ✓ Type: {structured.employment_type} {'(Fractional)' if structured.is_fractional else ''}")
-                print(f"    ✓ Location: {structured.city or 'Unknown'}, {structured.country} {'🌐' if structured.is_remote else ''}")
-                print(f"    ✓ Vertical: {structured.vertical}")
-                print(f"    ✓ Level: {structured.seniority_level}")
-                if structured.salary_min or structured.salary_max:
-                    print(f"    ✓ Comp: {structured.salary_currency}{structured.salary_min or '?'}-{structured.salary_max or '?'} ({structured.salary_type})")
-                print(f"    ✓ Skills: {len(structured.skills_required)} extracted")
-                print(f"    ✓ Summary: {structured.summary[:80]}...")
-
+        editorial_count = 0
+        raw_tokens = 0
+        clean_tokens = 0
+        packed_count = 0
+        duplicate_count = 0
+
+        semaphore = asyncio.Semaphore(concurrency)
+        job_number = 0
+
+        async def run(job: dict, label: str) -> dict:
+            async with semaphore:
+                return await process_job(pool, job, editorial_all, metrics, label)
+
+        while job_number < limit:
+            with metrics.stage('db_claim'):
+                jobs = await claim_pending_raw_jobs(
+                    pool, min(max(CLAIM_BATCH_SIZE, concurrency), limit - job_number), source, worker_id
+                )
+            if not jobs:
+                break
+
+            labels = {job['raw_id']: f"{job_number + i + 1}/{limit}" for i, job in enumerate(jobs)}
+            job_number += len(jobs)
+            prepare_batch(jobs, metrics)
+
+            # Near-duplicates of an earlier batch job wait for it to be indexed
+            leaders, followers = jobs, []
+            if DEDUPE_ENABLED:
+                await attach_duplicates(pool, jobs, editorial_all, metrics)
+                _, follower_ids = split_batch({
+                    job['raw_id']: job['signature'] for job in jobs
+                    if job.get('signature') is not None and 'duplicate_of' not in job
+                })
+                leaders = [job for job in jobs if job['raw_id'] not in follower_ids]
+                followers = [job for job in jobs if job['raw_id'] in follower_ids]
+
+            if pack:
+                packed_count += await prefill_packed(
+                    [job for job in leaders if 'duplicate_of' not in job], editorial_all, metrics, semaphore
+                )
+
+            outcomes = await asyncio.gather(*(run(job, labels[job['raw_id']]) for job in leaders))
+            if followers:
+                await attach_duplicates(pool, followers, editorial_all, metrics)
+                outcomes += await asyncio.gather(*(run(job, labels[job['raw_id']]) for job in followers))
+
+            for outcome in outcomes:
+                if outcome['status'] != 'processed':
+                    error_count += 1
+                    continue
                 success_count += 1
-
-            except Exception as e:
-                print(f"    ✗ Error: {str(e)[:100]}")
-                mark_raw_job_processed(conn, job['raw_id'], 'error', str(e))
-                conn.commit()
-                error_count += 1
-                continue
+                editorial_count += outcome['editorial']
+                duplicate_count += outcome['duplicate']
+                if outcome['stats']:
+                    raw_tokens += outcome['stats'].raw_tokens
+                    clean_tokens += outcome['stats'].clean_tokens
 
         print(f"\n{'='*60}")
-        print(f"COMPLETE: {success_count} processed, {error_count} errors")
+        print(f"COMPLETE: {success_count} processed ({editorial_count} with editorial), {error_count} errors")
+        if duplicate_count:
+            print(f"Duplicates: {duplicate_count} jobs reused a near-identical posting's output")
+        if pack:
+            print(f"Packed: {packed_count} jobs classified in shared calls")
+        if raw_tokens:
+            print(f"Description tokens: ~{raw_tokens} raw → ~{clean_tokens} sent "
+                  f"({100 * (raw_tokens - clean_tokens) / raw_tokens:.0f}% saved)")
+        print(f"{'='*60}")
+        metrics.print_summary()
         print(f"{'='*60}\n")
 
+        # Fold the new jobs into every candidate's precomputed matches
+        if MATCH_MATERIALIZE_ENABLED and success_count:
+            try:
+                with metrics.stage('match_materialize'):
+                    stats = await asyncio.to_thread(run_materialize)
+                print(f"Matches: {stats['jobs']} jobs merged into {stats['candidates_merged']} candidates, "
+                      f"{stats['users']} users refreshed")
+            except Exception as e:
+                print(f"⚠ Match materialization failed: {str(e)[:100]}")
+
+    finally:
+        released = await release_leases(pool, worker_id)
+        if released:
+            print(f"Released {released} unfinished claims")
+        boilerplate_filter.save()
+        await pool.close()
+        metrics.close()
+        if metrics_prom:
+            metrics.write_prometheus(metrics_prom)
+
+
+def run_materialize() -> dict:
+    """The materializer is a sync psycopg2 batch job; run on its own connection"""
+    conn = get_db_connection()
+    try:
+        return materialize(conn)
     finally:
         conn.close()
 
 
+async def reap_only():
+    pool = await create_pool(max_size=1)
+    try:
+        print(f"Returned {await reap_expired_leases(pool)} expired leases to pending")
+    finally:
+        await pool.close()
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -475,12 +1124,70 @@ if __name__ == "__main__":
     parser.add_argument('--limit', type=int, default=10, help='Number of jobs to process')
     parser.add_argument('--source', type=str, help='Filter by source (e.g., linkedin, greenhouse)')
     parser.add_argument('--all', action='store_true', help='Process all pending jobs')
+    parser.add_argument('--editorial-all', action='store_true',
+                        help='Run the editorial rewrite for every job, not just fractional UK roles')
+    parser.add_argument('--metrics-jsonl', type=str, help='Append per-job and summary metrics as JSON lines')
+    parser.add_argument('--metrics-prom', type=str, help='Write a Prometheus textfile with the run metrics')
+    parser.add_argument('--worker-id', type=str, help='Lease owner id (default: host:pid)')
+    parser.add_argument('--reap', action='store_true', help='Only return expired leases to pending, then exit')
+    parser.add_argument('--concurrency', type=int, default=CLASSIFY_CONCURRENCY,
+                        help='Jobs classified at once (DB pool size is DB_POOL_SIZE)')
+    parser.add_argument('--batch', action='store_true',
+                        help='Run through an offline provider batch API instead of interactive calls (see batch_classify.py)')
+    parser.add_argument('--batch-provider', type=str, help='Batch provider: local or openai (default: BATCH_PROVIDER)')
+    parser.add_argument('--poll-interval', type=int, help='Seconds between batch status checks (default: BATCH_POLL_SECONDS)')
+    parser.add_argument('--batch-resume', type=str, metavar='RUN_DIR',
+                        help='Finish an interrupted --batch run from its run directory (implies --batch)')
+    parser.add_argument('--reclassify-stale', action='store_true',
+                        help='Refresh jobs stamped with an outdated prompt/schema version, busiest first (see reclassify_stale.py)')
+    parser.add_argument('--pack', action='store_true',
+                        help='Classify short postings several per call (PACK_TOKEN_BUDGET / PACK_MAX_JOBS)')
 
     args = parser.parse_args()
+    configure_logging('classify-jobs')
+
+    if args.reap:
+        asyncio.run(reap_only())
+        raise SystemExit(0)
 
     limit = 1000 if args.all else args.limit
 
     print(f"\nStarting Pydantic AI Job Classification...")
     print(f"Limit: {limit}, Source: {args.source or 'all'}")
 
-    asyncio.run(process_jobs(limit=limit, source=args.source))
+    if args.reclassify_stale:
+        from reclassify_stale import reclassify_stale
+        asyncio.run(reclassify_stale(
+            limit=limit,
+            editorial_all=args.editorial_all,
+            metrics_jsonl=args.metrics_jsonl,
+            metrics_prom=args.metrics_prom,
+            concurrency=args.concurrency,
+        ))
+        raise SystemExit(0)
+
+    if args.batch or args.batch_resume:
+        from batch_classify import BATCH_POLL_SECONDS, BATCH_PROVIDER, process_jobs_batch
+        asyncio.run(process_jobs_batch(
+            limit=limit,
+            source=args.source,
+            editorial_all=args.editorial_all,
+            metrics_jsonl=args.metrics_jsonl,
+            metrics_prom=args.metrics_prom,
+            worker_id=args.worker_id,
+            provider_name=args.batch_provider or BATCH_PROVIDER,
+            poll_seconds=args.poll_interval or BATCH_POLL_SECONDS,
+            resume_dir=args.batch_resume,
+        ))
+        raise SystemExit(0)
+
+    asyncio.run(process_jobs(
+        limit=limit,
+        source=args.source,
+        editorial_all=args.editorial_all,
+        metrics_jsonl=args.metrics_jsonl,
+        metrics_prom=args.metrics_prom,
+        worker_id=args.worker_id,
+        concurrency=args.concurrency,
+        pack=args.pack,
+    ))
@@ -0,0 +1,158 @@
+"""
+Near-duplicate posting detection for classify_jobs.py
+
+The same role arrives from LinkedIn, Ashby and Greenhouse with slightly
+different text. Each claimed job gets a MinHash signature over word
+shingles of its normalized title, company and cleaned description; LSH
+bands of the signature are indexed in job_fingerprint_bands so candidates
+are found with one indexed lookup. A candidate whose estimated Jaccard
+similarity reaches DEDUPE_THRESHOLD is the job's canonical posting, and its
+stored structured output is reused instead of classifying again.
+
+Only canonical postings are indexed - duplicates link to their canonical
+(job_fingerprints.canonical_raw_id), so chains never form.
+"""
+
+import os
+import re
+import zlib
+from typing import Optional
+
+import numpy as np
+
+DEDUPE_ENABLED = os.environ.get('DEDUPE_ENABLED', 'true').lower() == 'true'
+# Estimated Jaccard similarity of shingle sets needed to reuse a canonical's output
+DEDUPE_THRESHOLD = float(os.environ.get('DEDUPE_THRESHOLD', '0.85'))
+SHINGLE_WORDS = 3
+# 16 bands x 4 rows: pairs at 0.85 share a band with probability > 0.99
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+MINHASH_PERMUTATIONS = MINHASH_BANDS * MINHASH_ROWS
+
+MERSENNE_PRIME = (1 << 31) - 1
+# Fixed seed - signatures are compared across processes and runs
+_rng = np.random.default_rng(20261019)
+_A = _rng.integers(1, MERSENNE_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, MERSENNE_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+WORD = re.compile(r'[a-z0-9]+')
+
+
+def shingles(text: str) -> set[int]:
+    """crc32 of every SHINGLE_WORDS-word window - crc32 because hash() is salted per process"""
+    words = WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {zlib.crc32(' '.join(words).encode())} if words else set()
+    return {
+        zlib.crc32(' '.join(words[i:i + SHINGLE_WORDS]).encode())
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MINHASH_PERMUTATIONS uint32 minimums, or None for empty text"""
+    hashed = shingles(text)
+    if not hashed:
+        return None
+    x = np.fromiter(hashed, dtype=np.uint64, count=len(hashed)) % MERSENNE_PRIME
+    # (a*x + b) mod p stays below 2^63 because a, x < 2^31
+    permuted = (np.outer(_A, x) + _B[:, None]) % MERSENNE_PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def posting_text(raw_job: dict) -> str:
+    """Title, company and cleaned description - needs build_job_context to have run"""
+    raw_data = raw_job.get('raw_data') or {}
+    if not isinstance(raw_data, dict):
+        raw_data = {}
+    return ' '.join((
+        raw_job.get('title') or raw_data.get('job_title') or '',
+        raw_job.get('company_name') or raw_data.get('company_name') or '',
+        raw_job.get('clean_description') or '',
+    ))
+
+
+def band_keys(signature: np.ndarray) -> list[int]:
+    """One BIGINT per band: band number in the high bits, crc32 of its rows in the low"""
+    bands = signature.reshape(MINHASH_BANDS, MINHASH_ROWS)
+    return [(band << 32) | zlib.crc32(rows.tobytes()) for band, rows in enumerate(bands)]
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(a == b))
+
+
+def best_match(signature: np.ndarray, candidates, threshold: float = DEDUPE_THRESHOLD):
+    """(candidate, similarity) of the most similar (key, signature) pair at or above threshold"""
+    best, best_score = None, threshold
+    for key, other in candidates:
+        score = similarity(signature, other)
+        if score >= best_score:
+            best, best_score = key, score
+    return (best, best_score) if best is not None else (None, 0.0)
+
+
+async def find_canonicals(conn, signatures: dict, threshold: float = DEDUPE_THRESHOLD) -> dict:
+    """
+    raw_id -> (canonical_raw_id, similarity, structured) for every signature
+    with an indexed canonical at or above threshold.
+    """
+    keys = sorted({key for signature in signatures.values() for key in band_keys(signature)})
+    if not keys:
+        return {}
+    rows = await conn.fetch("""
+        SELECT DISTINCT f.raw_id, f.signature, f.structured
+        FROM job_fingerprint_bands b
+        JOIN job_fingerprints f ON f.raw_id = b.raw_id
+        WHERE b.band_key = ANY($1::bigint[])
+    """, keys)
+    candidates = [(row['raw_id'], np.frombuffer(row['signature'], dtype=np.uint32)) for row in rows]
+    structured = {row['raw_id']: row['structured'] for row in rows}
+
+    found = {}
+    for raw_id, signature in signatures.items():
+        canonical, score = best_match(signature, candidates, threshold)
+        if canonical is not None and canonical != raw_id:
+            found[raw_id] = (canonical, score, structured[canonical])
+    return found
+
+
+def split_batch(signatures: dict, threshold: float = DEDUPE_THRESHOLD) -> tuple[list, list]:
+    """
+    (leaders, followers) among one claimed batch: a follower is near-identical
+    to an earlier job in the batch, so it waits until that job is indexed.
+    """
+    leaders, followers = [], []
+    for raw_id, signature in signatures.items():
+        match, _ = best_match(signature, ((r, signatures[r]) for r in leaders), threshold)
+        (followers if match is not None else leaders).append(raw_id)
+    return leaders, followers
+
+
+async def record_fingerprint(
+    conn,
+    raw_id,
+    signature: np.ndarray,
+    structured: Optional[dict] = None,
+    canonical_raw_id=None,
+    score: Optional[float] = None
+):
+    """Store a job's signature on classify_jobs' connection; canonicals are also indexed by band"""
+    await conn.execute("""
+        INSERT INTO job_fingerprints (raw_id, signature, canonical_raw_id, similarity, structured)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (raw_id) DO UPDATE SET
+            signature = EXCLUDED.signature,
+            canonical_raw_id = EXCLUDED.canonical_raw_id,
+            similarity = EXCLUDED.similarity,
+            structured = EXCLUDED.structured,
+            created_at = NOW()
+    """, raw_id, signature.tobytes(), canonical_raw_id, score, structured)
+    await conn.execute("DELETE FROM job_fingerprint_bands WHERE raw_id = $1", raw_id)
+    if canonical_raw_id is None:
+        await conn.execute("""
+            INSERT INTO job_fingerprint_bands (band_key, raw_id)
+            SELECT unnest($1::bigint[]), $2
+            ON CONFLICT DO NOTHING
+        """, band_keys(signature), raw_id)
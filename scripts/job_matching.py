@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Embedding-based job/candidate matching
+
+- classify_jobs.py embeds every job it classifies (title, category, skills,
+  requirements, cleaned description) into job_embeddings
+- `build` snapshots the active jobs into a float32 matrix on disk - each
+  build in its own version directory, published by swapping the CURRENT
+  pointer file, so a reader always gets one build's matrix, ids and meta
+- MatchIndex memory-maps the matrix and scores a candidate's graph_nodes
+  against every job in one matrix-vector product + argpartition
+
+The default embedder is a local feature-hashing model: no network, no model
+download, stable across processes. Set MATCH_EMBEDDER=sentence-transformers:<name>
+to use a real model if sentence-transformers is installed; vectors from
+different embedders are never mixed (rows and index are tagged by model).
+
+Usage:
+    python scripts/job_matching.py build
+    python scripts/job_matching.py match --user-id <neon_auth_id> --k 10
+    python scripts/job_matching.py bench --jobs 50000
+"""
+
+import os
+import re
+import json
+import zlib
+import time
+import shutil
+from typing import Optional
+
+import numpy as np
+
+EMBEDDING_DIM = int(os.environ.get('MATCH_EMBEDDING_DIM', '256'))
+MATCH_EMBEDDER = os.environ.get('MATCH_EMBEDDER', 'hashing')
+MATCH_INDEX_DIR = os.environ.get(
+    'MATCH_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.match_index')
+)
+# Builds kept next to CURRENT - older ones may still be memory-mapped by a reader
+MATCH_INDEX_KEEP = 3
+# graph_nodes clusters that describe what a candidate can do / wants
+CANDIDATE_CLUSTERS = ('skills', 'experience', 'career_interests', 'preferences')
+# Only the top of a description goes in - the rest is mostly process and perks
+DESCRIPTION_CHARS = 2000
+
+TOKEN = re.compile(r'[a-z0-9][a-z0-9+#&]*')
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have in is it its of on or our the to we will with you your'.split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class HashingEmbedder:
+    """
+    Signed feature hashing over unigrams and bigrams.
+
+    crc32 rather than hash() - Python salts str hashes per process, and job
+    vectors are written by one process and read by another.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.model = f'hashing-v1-{dim}'
+
+    def _add(self, vector: np.ndarray, text: str, weight: float):
+        tokens = tokenize(text)
+        features = tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+        if not features:
+            return
+        # Each field contributes `weight` in total, however long it is
+        scale = weight / len(features) ** 0.5
+        for feature in features:
+            h = zlib.crc32(feature.encode())
+            vector[h % self.dim] += scale if h & 0x80000000 else -scale
+
+    def embed(self, weighted_texts: list[tuple[str, float]]) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for text, weight in weighted_texts:
+            if text:
+                self._add(vector, text, weight)
+        return normalize(vector)
+
+
+class SentenceTransformerEmbedder:
+    """Weighted mean of sentence-transformers embeddings (optional dependency)"""
+
+    def __init__(self, name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.encoder = SentenceTransformer(name)
+        self.dim = self.encoder.get_sentence_embedding_dimension()
+        self.model = f'st:{name}'
+
+    def embed(self, weighted_texts: list[tuple[str, float]]) -> np.ndarray:
+        weighted_texts = [(text, weight) for text, weight in weighted_texts if text]
+        if not weighted_texts:
+            return np.zeros(self.dim, dtype=np.float32)
+        vectors = self.encoder.encode([text for text, _ in weighted_texts], normalize_embeddings=True)
+        weights = np.array([weight for _, weight in weighted_texts], dtype=np.float32)
+        return normalize((vectors * weights[:, None]).sum(axis=0).astype(np.float32))
+
+
+_embedder = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        if MATCH_EMBEDDER.startswith('sentence-transformers:'):
+            _embedder = SentenceTransformerEmbedder(MATCH_EMBEDDER.split(':', 1)[1])
+        else:
+            _embedder = HashingEmbedder()
+    return _embedder
+
+
+def normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def job_texts(raw_job: dict, classification) -> list[tuple[str, float]]:
+    """Weighted fields for a job - skills and requirements dominate when we have them"""
+    raw_data = raw_job.get('raw_data')
+    title = raw_job.get('title') or (raw_data.get('job_title', '') if isinstance(raw_data, dict) else '')
+    texts = [
+        (title, 1.5),
+        (f"{classification.role_category} {classification.seniority_level} {classification.vertical}", 1.0),
+    ]
+    skills = getattr(classification, 'skills_required', None)
+    if skills:
+        texts.append((' '.join(skills), 2.0))
+    requirements = getattr(classification, 'requirements', None)
+    if requirements:
+        texts.append((' '.join(requirements), 1.0))
+    description = raw_job.get('clean_description')
+    if description:
+        # Lighter when the editorial pass already distilled skills out of it
+        texts.append((description[:DESCRIPTION_CHARS], 0.5 if skills else 1.0))
+    return texts
+
+
+def embed_job(raw_job: dict, classification) -> np.ndarray:
+    return get_embedder().embed(job_texts(raw_job, classification))
+
+
+def embed_candidate(nodes: list[dict]) -> np.ndarray:
+    """nodes: graph_nodes rows (cluster, value, confidence) - weighted by confidence"""
+    cluster_weight = {'skills': 2.0, 'experience': 1.5, 'career_interests': 1.0, 'preferences': 0.5}
+    return get_embedder().embed([
+        (node['value'], cluster_weight.get(node['cluster'], 0.5) * float(node.get('confidence') or 0.5))
+        for node in nodes
+    ])
+
+
+# ============================================================================
+# DATABASE
+# ============================================================================
+
+async def upsert_job_embedding(conn, job_id, vector: np.ndarray, model: Optional[str] = None):
+    """Store a job's vector on classify_jobs' asyncpg connection; caller owns the transaction"""
+    await conn.execute("""
+        INSERT INTO job_embeddings (job_id, model, dim, embedding, updated_at)
+        VALUES ($1, $2, $3, $4, NOW())
+        ON CONFLICT (job_id) DO UPDATE SET
+            model = EXCLUDED.model,
+            dim = EXCLUDED.dim,
+            embedding = EXCLUDED.embedding,
+            updated_at = NOW()
+    """, job_id, model or get_embedder().model, len(vector), vector.astype(np.float32).tobytes())
+
+
+def fetch_candidate_nodes(conn, user_id: str) -> list[dict]:
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT cluster, value, COALESCE((metadata->>'confidence')::float, 0.5) AS confidence
+            FROM graph_nodes
+            WHERE user_id = %s AND cluster = ANY(%s)
+        """, (user_id, list(CANDIDATE_CLUSTERS)))
+        return [{'cluster': c, 'value': v, 'confidence': conf} for c, v, conf in cur.fetchall()]
+
+
+# ============================================================================
+# INDEX
+# ============================================================================
+
+class MatchIndex:
+    """Normalized job vectors (n x dim float32) + their job ids; scores are cosine"""
+
+    def __init__(self, matrix: np.ndarray, job_ids: np.ndarray, model: str):
+        self.matrix = matrix
+        self.job_ids = job_ids
+        self.model = model
+
+    def __len__(self):
+        return len(self.job_ids)
+
+    @classmethod
+    def build(cls, conn, path: str = MATCH_INDEX_DIR, model: Optional[str] = None) -> 'MatchIndex':
+        """Snapshot active jobs' vectors to disk and return the loaded index"""
+        model = model or get_embedder().model
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT e.job_id, e.embedding
+                FROM job_embeddings e
+                JOIN jobs j ON j.id = e.job_id
+                WHERE j.is_active = true AND e.model = %s
+                ORDER BY e.job_id
+            """, (model,))
+            rows = cur.fetchall()
+
+        dim = get_embedder().dim
+        matrix = np.empty((len(rows), dim), dtype=np.float32)
+        for i, (_, embedding) in enumerate(rows):
+            matrix[i] = np.frombuffer(embedding, dtype=np.float32)
+        job_ids = np.array([job_id for job_id, _ in rows], dtype=np.int64)
+
+        # The whole build goes into a fresh directory; only the CURRENT swap
+        # publishes it, so a reader never mixes files from two builds
+        # Named so that sorting them sorts by age
+        version = f"{time.time_ns()}-{os.getpid()}"
+        version_dir = os.path.join(path, version)
+        os.makedirs(version_dir)
+        np.save(os.path.join(version_dir, 'matrix.npy'), matrix)
+        np.save(os.path.join(version_dir, 'job_ids.npy'), job_ids)
+        with open(os.path.join(version_dir, 'meta.json'), 'w') as f:
+            json.dump({'model': model, 'dim': dim, 'jobs': len(rows), 'built_at': time.time()}, f)
+
+        tmp = os.path.join(path, f'.CURRENT.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(path, 'CURRENT'))
+        cls.prune(path, version)
+
+        return cls.load(path)
+
+    @staticmethod
+    def prune(path: str, current: str, keep: int = MATCH_INDEX_KEEP):
+        """Remove all but the newest `keep` builds; the current one always stays"""
+        versions = sorted(
+            (name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name))),
+            reverse=True
+        )
+        for name in versions[keep:]:
+            if name != current:
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str = MATCH_INDEX_DIR) -> 'MatchIndex':
+        with open(os.path.join(path, 'CURRENT')) as f:
+            version_dir = os.path.join(path, f.read().strip())
+        with open(os.path.join(version_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['model'] != get_embedder().model:
+            raise ValueError(f"Index built with {meta['model']}, embedder is {get_embedder().model} - rebuild it")
+        return cls(
+            np.load(os.path.join(version_dir, 'matrix.npy'), mmap_mode='r'),
+            np.load(os.path.join(version_dir, 'job_ids.npy')),
+            meta['model']
+        )
+
+    def top_k(self, query: np.ndarray, k: int = 20) -> list[tuple[int, float]]:
+        """[(job_id, score)] best first"""
+        if not len(self) or not query.any():
+            return []
+        scores = self.matrix @ query
+        return self._select(scores, k)
+
+    def top_k_many(self, queries: np.ndarray, k: int = 20) -> list[list[tuple[int, float]]]:
+        """Batch variant - one matrix product for many candidates"""
+        if not len(self):
+            return [[] for _ in range(len(queries))]
+        scores = queries @ self.matrix.T
+        return [self._select(row, k) if queries[i].any() else [] for i, row in enumerate(scores)]
+
+    def _select(self, scores: np.ndarray, k: int) -> list[tuple[int, float]]:
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.job_ids[i]), float(scores[i])) for i in top]
+
+
+def bench(jobs: int, k: int, repeats: int = 200):
+    """Time top-k over a synthetic index the size of the real one"""
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((jobs, EMBEDDING_DIM), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    index = MatchIndex(matrix, np.arange(jobs, dtype=np.int64), 'bench')
+    query = normalize(rng.standard_normal(EMBEDDING_DIM, dtype=np.float32))
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        index.top_k(query, k)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{jobs:,} jobs x {EMBEDDING_DIM} dims, k={k}: "
+          f"p50 {timings[len(timings) // 2]:.2f} ms, p99 {timings[int(len(timings) * 0.99) - 1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Job matching index')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help='Snapshot active job embeddings to the index directory')
+    match_parser = sub.add_parser('match', help='Top jobs for one candidate')
+    match_parser.add_argument('--user-id', required=True)
+    match_parser.add_argument('--k', type=int, default=10)
+    bench_parser = sub.add_parser('bench', help='Time top-k on a synthetic index')
+    bench_parser.add_argument('--jobs', type=int, default=50_000)
+    bench_parser.add_argument('--k', type=int, default=20)
+
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        bench(args.jobs, args.k)
+    else:
+        import psycopg2
+        from dotenv import load_dotenv
+        load_dotenv()
+
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        try:
+            if args.command == 'build':
+                index = MatchIndex.build(conn)
+                print(f"Indexed {len(index)} active jobs ({index.model}) in {MATCH_INDEX_DIR}")
+            else:
+                index = MatchIndex.load()
+                nodes = fetch_candidate_nodes(conn, args.user_id)
+                start = time.perf_counter()
+                matches = index.top_k(embed_candidate(nodes), args.k)
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"{len(nodes)} graph_nodes, {len(index)} jobs, {elapsed:.2f} ms")
+                for job_id, score in matches:
+                    print(f"  {job_id:>8}  {score:.3f}")
+        finally:
+            conn.close()
@@ -0,0 +1,209 @@
+"""
+Job description preprocessing for classify_jobs.py
+
+Scraped descriptions arrive as HTML with pages of EEO statements, privacy
+notices and "about us" blocks that are identical across hundreds of
+postings. Before a description goes into a prompt it is:
+
+1. Stripped of HTML and collapsed to plain paragraphs
+2. Filtered for boilerplate - seed EEO patterns plus paragraph fingerprints
+   learned from seeing the same text across several companies
+3. Capped at a token budget on a paragraph boundary
+"""
+
+import os
+import re
+import json
+import fcntl
+import hashlib
+from html import unescape
+from dataclasses import dataclass
+from typing import Optional
+
+DESCRIPTION_TOKEN_BUDGET = int(os.environ.get('DESCRIPTION_TOKEN_BUDGET', '1500'))
+BOILERPLATE_FINGERPRINTS_PATH = os.environ.get(
+    'BOILERPLATE_FINGERPRINTS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.boilerplate_fingerprints.json')
+)
+# A paragraph seen at this many distinct companies is boilerplate
+BOILERPLATE_MIN_COMPANIES = int(os.environ.get('BOILERPLATE_MIN_COMPANIES', '3'))
+# Shorter paragraphs ("Responsibilities:", "Apply now") are too generic to fingerprint
+BOILERPLATE_MIN_CHARS = 80
+
+SEED_BOILERPLATE_PATTERNS = [
+    r'equal (employment )?opportunit',
+    r'without regard to (race|age|gender|sex)',
+    r'(race|religion|colou?r|national origin|sexual orientation|gender identity).{0,80}(disability|veteran)',
+    r'reasonable (adjustments|accommodations?)',
+    r'(privacy (notice|policy)|data protection).{0,60}(personal data|information)',
+    r'(recruitment agencies|unsolicited (cvs|resumes))',
+    r'e-?verify',
+]
+SEED_BOILERPLATE = re.compile('|'.join(SEED_BOILERPLATE_PATTERNS), re.IGNORECASE)
+
+BLOCK_TAGS = re.compile(r'<\s*(br|/p|/div|/li|/h[1-6]|/tr|/ul|/ol)\b[^>]*>', re.IGNORECASE)
+LIST_ITEM = re.compile(r'<\s*li\b[^>]*>', re.IGNORECASE)
+SCRIPT_STYLE = re.compile(r'<\s*(script|style)\b.*?<\s*/\s*\1\s*>', re.IGNORECASE | re.DOTALL)
+TAGS = re.compile(r'<[^>]+>')
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token)"""
+    return (len(text) + 3) // 4
+
+
+def html_to_paragraphs(text: str) -> list[str]:
+    """Strip HTML and return non-empty, whitespace-collapsed paragraphs"""
+    if '<' in text:
+        text = SCRIPT_STYLE.sub(' ', text)
+        text = LIST_ITEM.sub('\n- ', text)
+        text = BLOCK_TAGS.sub('\n\n', text)
+        text = TAGS.sub(' ', text)
+    text = unescape(text)
+
+    paragraphs = []
+    for block in re.split(r'\n\s*\n|\n(?=- )', text):
+        collapsed = ' '.join(block.split())
+        if collapsed:
+            paragraphs.append(collapsed)
+    return paragraphs
+
+
+def fingerprint(paragraph: str) -> str:
+    normalized = re.sub(r'[^a-z0-9]+', ' ', paragraph.lower()).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+class BoilerplateFilter:
+    """
+    Learned set of boilerplate paragraph fingerprints.
+
+    Every paragraph we see is counted against the companies it appeared at;
+    once it shows up at BOILERPLATE_MIN_COMPANIES different companies it is
+    treated as boilerplate from then on. The set is persisted between runs;
+    workers sharing the file merge into it under a lock rather than
+    overwrite each other's observations.
+    """
+
+    def __init__(self, path: Optional[str] = BOILERPLATE_FINGERPRINTS_PATH):
+        self.path = path
+        self.boilerplate: set[str] = set()
+        self.candidates: dict[str, set[str]] = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Optional[str] = BOILERPLATE_FINGERPRINTS_PATH) -> 'BoilerplateFilter':
+        instance = cls(path)
+        if path and os.path.exists(path):
+            with open(path) as f:
+                instance.merge(json.load(f))
+        return instance
+
+    def merge(self, data: dict):
+        """Fold in another worker's saved state - fingerprints and companies are unions"""
+        self.boilerplate.update(data.get('boilerplate', []))
+        for fp, companies in data.get('candidates', {}).items():
+            if fp in self.boilerplate:
+                continue
+            merged = self.candidates.setdefault(fp, set())
+            merged.update(companies)
+            if len(merged) >= BOILERPLATE_MIN_COMPANIES:
+                self.boilerplate.add(fp)
+        for fp in self.boilerplate.intersection(self.candidates):
+            del self.candidates[fp]
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        # Other workers may have saved since we loaded: re-read and merge under
+        # an exclusive lock, then swap the file in whole
+        with open(self.path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.path):
+                with open(self.path) as f:
+                    self.merge(json.load(f))
+            # Singletons dominate the candidate map; drop them to keep the file small
+            candidates = {fp: sorted(c) for fp, c in self.candidates.items() if len(c) > 1}
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'boilerplate': sorted(self.boilerplate), 'candidates': candidates}, f)
+            os.replace(tmp, self.path)
+        self.dirty = False
+
+    def is_boilerplate(self, paragraph: str, fp: str) -> bool:
+        return fp in self.boilerplate or bool(SEED_BOILERPLATE.search(paragraph))
+
+    def observe(self, fp: str, company: str):
+        if fp in self.boilerplate:
+            return
+        companies = self.candidates.setdefault(fp, set())
+        if company in companies:
+            return
+        companies.add(company)
+        self.dirty = True
+        if len(companies) >= BOILERPLATE_MIN_COMPANIES:
+            self.boilerplate.add(fp)
+            del self.candidates[fp]
+
+
+@dataclass
+class DescriptionStats:
+    """Per-job prompt input accounting"""
+    raw_tokens: int
+    clean_tokens: int
+    boilerplate_paragraphs: int
+    truncated: bool
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.raw_tokens - self.clean_tokens
+
+
+def prepare_description(
+    text: str,
+    company: str = '',
+    boilerplate: Optional[BoilerplateFilter] = None,
+    token_budget: int = DESCRIPTION_TOKEN_BUDGET
+) -> tuple[str, DescriptionStats]:
+    """Clean a raw description for the prompt and report what it saved"""
+    raw_tokens = estimate_tokens(text)
+    company = (company or '').strip().lower()
+
+    kept = []
+    dropped = 0
+    for paragraph in html_to_paragraphs(text):
+        if len(paragraph) >= BOILERPLATE_MIN_CHARS:
+            fp = fingerprint(paragraph)
+            if boilerplate is not None:
+                if boilerplate.is_boilerplate(paragraph, fp):
+                    dropped += 1
+                    continue
+                if company:
+                    boilerplate.observe(fp, company)
+            elif SEED_BOILERPLATE.search(paragraph):
+                dropped += 1
+                continue
+        kept.append(paragraph)
+
+    # Cap on a paragraph boundary - the top of a posting carries the signal
+    output = []
+    used = 0
+    truncated = False
+    for paragraph in kept:
+        cost = estimate_tokens(paragraph) + 1
+        if used + cost > token_budget:
+            truncated = True
+            remaining_chars = (token_budget - used) * 4
+            if remaining_chars > BOILERPLATE_MIN_CHARS:
+                output.append(paragraph[:remaining_chars].rsplit(' ', 1)[0] + '…')
+            break
+        output.append(paragraph)
+        used += cost
+
+    cleaned = '\n\n'.join(output)
+    return cleaned, DescriptionStats(
+        raw_tokens=raw_tokens,
+        clean_tokens=estimate_tokens(cleaned),
+        boilerplate_paragraphs=dropped,
+        truncated=truncated
+    )
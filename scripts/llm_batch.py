@@ -0,0 +1,270 @@
+"""
+Offline LLM batch providers
+
+Batch APIs take a file of requests, work through it within a completion
+window (usually hours) and hand back a file of results - at a lower price
+and against a separate rate limit from interactive calls. batch_classify.py
+drives them through this interface.
+
+Requests and results are provider-neutral JSON lines:
+    request: {"custom_id", "model", "system", "prompt", "output_name", "output_schema"}
+    result:  {"custom_id", "output": {...} | null, "error": str | null,
+              "usage": {"input_tokens", "output_tokens"}}
+
+Providers:
+- local: file-based stand-in. Results are written next to the request file,
+  either by a responder (pydantic-ai agents - TestModel with
+  LOCAL_BATCH_MODEL=test) or, with LOCAL_BATCH_MODEL=manual, by hand
+- openai: the OpenAI Batch API (models like openai:gpt-4o-mini)
+"""
+
+import os
+import json
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import httpx
+
+from pipeline_metrics import usage_tokens
+
+PENDING = 'pending'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+BATCH_DIR = Path(os.environ.get('BATCH_DIR', Path(__file__).parent / '.batches'))
+# Model used by the local provider's responder instead of each request's own
+# model - "test" for pydantic-ai's TestModel, "manual" for no responder
+LOCAL_BATCH_MODEL = os.environ.get('LOCAL_BATCH_MODEL')
+
+
+def read_jsonl(path: Path) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_jsonl(path: Path, rows) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'w') as f:
+        for row in rows:
+            f.write(json.dumps(row) + '\n')
+    os.replace(tmp, path)
+    return path
+
+
+class BatchProvider(ABC):
+    """Submit a request file, poll it, read back its results"""
+
+    name: str
+
+    @abstractmethod
+    async def submit(self, requests_path: Path) -> str:
+        """Submit a request JSONL file; returns the provider's batch id"""
+
+    @abstractmethod
+    async def status(self, batch_id: str) -> str:
+        """PENDING, COMPLETED or FAILED"""
+
+    @abstractmethod
+    def results(self, batch_id: str) -> AsyncIterator[dict]:
+        """Result rows of a completed batch - requests without one simply don't appear"""
+
+
+Responder = Callable[[dict], Awaitable[dict]]
+
+
+class LocalFileBatchProvider(BatchProvider):
+    """
+    Stand-in provider backed by a directory.
+
+    submit() copies the request file to <directory>/<batch_id>/input.jsonl;
+    the batch is complete once output.jsonl exists beside it. With a
+    responder, the first status() call answers every request and writes
+    output.jsonl; without one, the batch stays pending until something else
+    writes it.
+    """
+
+    name = 'local'
+
+    def __init__(self, directory: Path = BATCH_DIR / 'local', responder: Optional[Responder] = None):
+        self.directory = Path(directory)
+        self.responder = responder
+
+    def _paths(self, batch_id: str) -> tuple[Path, Path]:
+        return self.directory / batch_id / 'input.jsonl', self.directory / batch_id / 'output.jsonl'
+
+    async def submit(self, requests_path: Path) -> str:
+        batch_id = f"local-{uuid.uuid4().hex[:12]}"
+        input_path, _ = self._paths(batch_id)
+        input_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(requests_path, input_path)
+        return batch_id
+
+    async def status(self, batch_id: str) -> str:
+        input_path, output_path = self._paths(batch_id)
+        if output_path.exists():
+            return COMPLETED
+        if not input_path.exists():
+            return FAILED
+        if self.responder is None:
+            return PENDING
+
+        rows = []
+        for request in read_jsonl(input_path):
+            try:
+                rows.append(await self.responder(request))
+            except Exception as e:
+                rows.append({'custom_id': request['custom_id'], 'output': None, 'error': str(e)[:200]})
+        write_jsonl(output_path, rows)
+        return COMPLETED
+
+    async def results(self, batch_id: str) -> AsyncIterator[dict]:
+        _, output_path = self._paths(batch_id)
+        for row in read_jsonl(output_path):
+            yield row
+
+
+def agent_responder(output_types: dict, model: Optional[str] = LOCAL_BATCH_MODEL) -> Responder:
+    """Answer requests with pydantic-ai agents, one call each - output_types maps output_name to a model class"""
+    from pydantic_ai import Agent
+    from pydantic_ai.models.test import TestModel
+
+    agents = {}
+
+    async def respond(request: dict) -> dict:
+        key = (request['output_name'], request['system'])
+        if key not in agents:
+            agents[key] = Agent(output_type=output_types[request['output_name']], system_prompt=request['system'])
+        run_model = TestModel() if model == 'test' else (model or request['model'])
+        result = await agents[key].run(request['prompt'], model=run_model)
+        input_tokens, output_tokens = usage_tokens(result.usage())
+        return {
+            'custom_id': request['custom_id'],
+            'output': result.output.model_dump(mode='json'),
+            'error': None,
+            'usage': {'input_tokens': input_tokens, 'output_tokens': output_tokens},
+        }
+
+    return respond
+
+
+class OpenAIBatchProvider(BatchProvider):
+    """OpenAI Batch API against /v1/chat/completions with JSON-schema structured output"""
+
+    name = 'openai'
+    BASE_URL = 'https://api.openai.com/v1'
+
+    def __init__(self, api_key: Optional[str] = None, completion_window: str = '24h'):
+        self.api_key = api_key or os.environ.get('OPENAI_API_KEY')
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY environment variable not set")
+        self.completion_window = completion_window
+
+    def _client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.BASE_URL,
+            headers={'Authorization': f'Bearer {self.api_key}'},
+            timeout=120.0,
+        )
+
+    @staticmethod
+    def _model_name(model: str) -> str:
+        provider, _, name = model.partition(':')
+        if not name:
+            return provider
+        if provider != 'openai':
+            raise ValueError(f"OpenAI batches need openai: models, got {model}")
+        return name
+
+    def _to_openai(self, request: dict) -> dict:
+        return {
+            'custom_id': request['custom_id'],
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': {
+                'model': self._model_name(request['model']),
+                'messages': [
+                    {'role': 'system', 'content': request['system']},
+                    {'role': 'user', 'content': request['prompt']},
+                ],
+                'response_format': {
+                    'type': 'json_schema',
+                    'json_schema': {'name': request['output_name'], 'schema': request['output_schema']},
+                },
+            },
+        }
+
+    async def submit(self, requests_path: Path) -> str:
+        upload = '\n'.join(json.dumps(self._to_openai(r)) for r in read_jsonl(requests_path)) + '\n'
+        async with self._client() as client:
+            response = await client.post(
+                '/files',
+                data={'purpose': 'batch'},
+                files={'file': (requests_path.name, upload.encode(), 'application/jsonl')},
+            )
+            response.raise_for_status()
+            response = await client.post('/batches', json={
+                'input_file_id': response.json()['id'],
+                'endpoint': '/v1/chat/completions',
+                'completion_window': self.completion_window,
+            })
+            response.raise_for_status()
+            return response.json()['id']
+
+    async def _batch(self, batch_id: str) -> dict:
+        async with self._client() as client:
+            response = await client.get(f'/batches/{batch_id}')
+            response.raise_for_status()
+            return response.json()
+
+    async def status(self, batch_id: str) -> str:
+        state = (await self._batch(batch_id))['status']
+        # An expired batch still returns whatever it finished
+        if state in ('completed', 'expired'):
+            return COMPLETED
+        if state in ('failed', 'cancelled'):
+            return FAILED
+        return PENDING
+
+    async def results(self, batch_id: str) -> AsyncIterator[dict]:
+        batch = await self._batch(batch_id)
+        async with self._client() as client:
+            for file_id in (batch.get('output_file_id'), batch.get('error_file_id')):
+                if not file_id:
+                    continue
+                response = await client.get(f'/files/{file_id}/content')
+                response.raise_for_status()
+                for line in response.text.splitlines():
+                    if line.strip():
+                        yield self._from_openai(json.loads(line))
+
+    @staticmethod
+    def _from_openai(row: dict) -> dict:
+        result = {'custom_id': row['custom_id'], 'output': None, 'error': None}
+        response = row.get('response') or {}
+        body = response.get('body') or {}
+        if row.get('error') or response.get('status_code') != 200:
+            result['error'] = json.dumps(row.get('error') or body.get('error'))[:200]
+            return result
+        usage = body.get('usage') or {}
+        result['usage'] = {
+            'input_tokens': usage.get('prompt_tokens', 0),
+            'output_tokens': usage.get('completion_tokens', 0),
+        }
+        try:
+            result['output'] = json.loads(body['choices'][0]['message']['content'])
+        except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+            result['error'] = f"Unparseable output: {e}"
+        return result
+
+
+def get_provider(name: str, output_types: Optional[dict] = None) -> BatchProvider:
+    if name == 'local':
+        respond = output_types and LOCAL_BATCH_MODEL != 'manual'
+        return LocalFileBatchProvider(responder=agent_responder(output_types) if respond else None)
+    if name == 'openai':
+        return OpenAIBatchProvider()
+    raise ValueError(f"Unknown batch provider: {name}")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Candidate -> Job Match Materialization
+
+Keeps candidate_job_matches holding each candidate's top-N active jobs so
+recommendation reads are a single index lookup instead of a scoring pass.
+
+Work arrives on two queues (migrations/012_candidate_job_matches.sql):
+- match_job_queue: jobs classify_jobs.py just embedded. Scored against the
+  stored candidate vectors and merged into existing top-N lists - nobody is
+  re-embedded and no list is rebuilt
+- match_user_queue: users whose graph_nodes or candidate profile changed
+  (filled by triggers). Re-embedded and re-scored against the match index
+
+Each run first drops matches whose job has gone inactive (or been deleted)
+and queues those users, so their lists refill from the active jobs.
+
+classify_jobs.py runs this after each batch of new jobs; run it on a schedule
+too so graph changes are picked up between classification runs.
+
+Usage:
+    python scripts/materialize_matches.py            # drain both queues
+    python scripts/materialize_matches.py --full     # re-score every candidate
+"""
+
+import os
+import time
+
+import numpy as np
+import psycopg2
+
+from job_matching import (
+    CANDIDATE_CLUSTERS,
+    MATCH_INDEX_DIR,
+    MatchIndex,
+    embed_candidate,
+    get_embedder,
+)
+
+from dotenv import load_dotenv
+load_dotenv()
+
+MATCH_TOP_N = int(os.environ.get('MATCH_TOP_N', '50'))
+MATCH_QUEUE_BATCH = int(os.environ.get('MATCH_QUEUE_BATCH', '500'))
+MATCH_MATERIALIZE_ENABLED = os.environ.get('MATCH_MATERIALIZE_ENABLED', 'true').lower() == 'true'
+
+
+async def queue_job(conn, job_id):
+    """Queue a freshly embedded job on classify_jobs' asyncpg connection, in its transaction"""
+    await conn.execute("""
+        INSERT INTO match_job_queue (job_id) VALUES ($1)
+        ON CONFLICT (job_id) DO NOTHING
+    """, job_id)
+
+
+def drain_queue(conn, table: str, key: str, batch: int) -> list:
+    """Take a batch off a queue - only gone for good once the caller commits"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            DELETE FROM {table}
+            WHERE {key} IN (
+                SELECT {key} FROM {table}
+                ORDER BY queued_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {key}
+        """, (batch,))
+        return [row[0] for row in cur.fetchall()]
+
+
+def fetch_candidate_inputs(conn, user_ids: list[str]) -> dict[str, list[dict]]:
+    """graph_nodes plus profile fields, shaped as nodes for embed_candidate"""
+    inputs: dict[str, list[dict]] = {user_id: [] for user_id in user_ids}
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT user_id, cluster, value, COALESCE((metadata->>'confidence')::float, 0.5)
+            FROM graph_nodes
+            WHERE user_id = ANY(%s) AND cluster = ANY(%s)
+        """, (user_ids, list(CANDIDATE_CLUSTERS)))
+        for user_id, cluster, value, confidence in cur.fetchall():
+            inputs[user_id].append({'cluster': cluster, 'value': value, 'confidence': confidence})
+
+        cur.execute("""
+            SELECT user_id::text, headline, specialisms, role_categories, industries
+            FROM candidate_profiles
+            WHERE user_id::text = ANY(%s)
+        """, (user_ids,))
+        for user_id, headline, specialisms, role_categories, industries in cur.fetchall():
+            nodes = inputs[user_id]
+            if headline:
+                nodes.append({'cluster': 'experience', 'value': headline, 'confidence': 1.0})
+            for value in specialisms or []:
+                nodes.append({'cluster': 'skills', 'value': value, 'confidence': 1.0})
+            for value in (role_categories or []) + (industries or []):
+                nodes.append({'cluster': 'career_interests', 'value': value, 'confidence': 1.0})
+    return inputs
+
+
+def trim_to_top_n(cur, user_ids: list[str], top_n: int):
+    cur.execute("""
+        DELETE FROM candidate_job_matches m
+        USING (
+            SELECT user_id, job_id,
+                   row_number() OVER (PARTITION BY user_id ORDER BY score DESC) AS rank
+            FROM candidate_job_matches
+            WHERE user_id = ANY(%s)
+        ) ranked
+        WHERE m.user_id = ranked.user_id AND m.job_id = ranked.job_id AND ranked.rank > %s
+    """, (user_ids, top_n))
+
+
+def refresh_users(conn, index: MatchIndex, user_ids: list[str], top_n: int = MATCH_TOP_N) -> int:
+    """Re-embed users and replace their match lists; caller commits"""
+    inputs = fetch_candidate_inputs(conn, user_ids)
+    embedded = [user_id for user_id in user_ids if inputs[user_id]]
+    vectors = np.stack([embed_candidate(inputs[u]) for u in embedded]) if embedded else None
+    matches = index.top_k_many(vectors, top_n) if embedded else []
+
+    rows = [
+        (user_id, job_id, score)
+        for user_id, user_matches in zip(embedded, matches)
+        for job_id, score in user_matches
+        if score > 0
+    ]
+    model = get_embedder().model
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM candidate_job_matches WHERE user_id = ANY(%s)", (user_ids,))
+        cur.execute("DELETE FROM candidate_embeddings WHERE user_id = ANY(%s)", (user_ids,))
+        if rows:
+            cur.execute("""
+                INSERT INTO candidate_job_matches (user_id, job_id, score, computed_at)
+                SELECT user_id, job_id, score, NOW()
+                FROM unnest(%s::text[], %s::int[], %s::real[]) AS t(user_id, job_id, score)
+            """, [list(col) for col in zip(*rows)])
+        if embedded:
+            cur.execute("""
+                INSERT INTO candidate_embeddings (user_id, model, dim, embedding, updated_at)
+                SELECT user_id, %s, %s, embedding, NOW()
+                FROM unnest(%s::text[], %s::bytea[]) AS t(user_id, embedding)
+            """, (model, vectors.shape[1], embedded, [psycopg2.Binary(v.tobytes()) for v in vectors]))
+    return len(embedded)
+
+
+def merge_new_jobs(conn, job_ids: list[int], top_n: int = MATCH_TOP_N) -> int:
+    """Score new jobs against every stored candidate and merge into their top-N; caller commits"""
+    model = get_embedder().model
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT e.job_id, e.embedding
+            FROM job_embeddings e
+            JOIN jobs j ON j.id = e.job_id
+            WHERE e.job_id = ANY(%s) AND e.model = %s AND j.is_active = true
+        """, (job_ids, model))
+        jobs = cur.fetchall()
+        if not jobs:
+            return 0
+        cur.execute("SELECT user_id, embedding FROM candidate_embeddings WHERE model = %s", (model,))
+        candidates = cur.fetchall()
+        if not candidates:
+            return 0
+
+        job_matrix = np.stack([np.frombuffer(e, dtype=np.float32) for _, e in jobs])
+        candidate_matrix = np.stack([np.frombuffer(e, dtype=np.float32) for _, e in candidates])
+        scores = candidate_matrix @ job_matrix.T
+
+        # Each candidate's best new jobs only - at most top_n of them can survive the trim
+        k = min(top_n, len(jobs))
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < len(jobs) else \
+            np.tile(np.arange(len(jobs)), (len(candidates), 1))
+        rows = []
+        for c, job_indexes in enumerate(best):
+            for j in job_indexes:
+                if scores[c, j] > 0:
+                    rows.append((candidates[c][0], jobs[j][0], float(scores[c, j])))
+        if not rows:
+            return 0
+
+        cur.execute("""
+            INSERT INTO candidate_job_matches (user_id, job_id, score, computed_at)
+            SELECT user_id, job_id, score, NOW()
+            FROM unnest(%s::text[], %s::int[], %s::real[]) AS t(user_id, job_id, score)
+            ON CONFLICT (user_id, job_id) DO UPDATE SET score = EXCLUDED.score, computed_at = NOW()
+        """, [list(col) for col in zip(*rows)])
+        touched = sorted({user_id for user_id, _, _ in rows})
+        trim_to_top_n(cur, touched, top_n)
+    return len(touched)
+
+
+def prune_inactive_jobs(conn) -> int:
+    """Drop matches to jobs no longer active and queue their users for a refill; caller commits"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            WITH pruned AS (
+                DELETE FROM candidate_job_matches m
+                WHERE NOT EXISTS (SELECT 1 FROM jobs j WHERE j.id = m.job_id AND j.is_active = true)
+                RETURNING user_id
+            ), queued AS (
+                INSERT INTO match_user_queue (user_id)
+                SELECT DISTINCT user_id FROM pruned
+                ON CONFLICT (user_id) DO NOTHING
+            )
+            SELECT count(*) FROM pruned
+        """)
+        return cur.fetchone()[0]
+
+
+def load_index(conn) -> MatchIndex:
+    try:
+        return MatchIndex.load()
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Rebuilding match index: {e}")
+        return MatchIndex.build(conn)
+
+
+def materialize(conn, top_n: int = MATCH_TOP_N, full: bool = False, rebuild_index: bool = False) -> dict:
+    """Drain the job queue then the user queue; each batch commits on its own"""
+    started = time.monotonic()
+    stats = {'jobs': 0, 'candidates_merged': 0, 'users': 0}
+
+    stats['pruned'] = prune_inactive_jobs(conn)
+    conn.commit()
+
+    if full:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO match_user_queue (user_id)
+                SELECT DISTINCT user_id FROM graph_nodes WHERE cluster = ANY(%s)
+                UNION
+                SELECT user_id::text FROM candidate_profiles
+                ON CONFLICT (user_id) DO NOTHING
+            """, (list(CANDIDATE_CLUSTERS),))
+        conn.commit()
+
+    while True:
+        job_ids = drain_queue(conn, 'match_job_queue', 'job_id', MATCH_QUEUE_BATCH)
+        if not job_ids:
+            break
+        stats['candidates_merged'] += merge_new_jobs(conn, job_ids, top_n)
+        conn.commit()
+        stats['jobs'] += len(job_ids)
+
+    # New jobs must be in the snapshot before anyone is re-scored against it,
+    # and deactivated ones out of it
+    index = MatchIndex.build(conn) if stats['jobs'] or stats['pruned'] or rebuild_index or full else None
+    while True:
+        user_ids = drain_queue(conn, 'match_user_queue', 'user_id', MATCH_QUEUE_BATCH)
+        if not user_ids:
+            break
+        if index is None:
+            index = load_index(conn)
+        stats['users'] += refresh_users(conn, index, user_ids, top_n)
+        conn.commit()
+
+    conn.rollback()
+    stats['seconds'] = round(time.monotonic() - started, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Precompute top-N job matches per candidate')
+    parser.add_argument('--top-n', type=int, default=MATCH_TOP_N, help='Matches kept per candidate')
+    parser.add_argument('--full', action='store_true', help='Queue and re-score every candidate')
+    parser.add_argument('--rebuild-index', action='store_true', help=f'Rebuild {MATCH_INDEX_DIR} first')
+
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        stats = materialize(conn, args.top_n, args.full, args.rebuild_index)
+        print(f"Pruned {stats['pruned']} matches to inactive jobs, "
+              f"merged {stats['jobs']} new jobs into {stats['candidates_merged']} candidates, "
+              f"refreshed {stats['users']} users in {stats['seconds']}s")
+    finally:
+        conn.close()
@@ -0,0 +1,164 @@
+"""
+Per-stage timing and token accounting for classify_jobs.py
+
+Usage:
+    metrics = PipelineMetrics(jsonl_path='metrics.jsonl')
+    record = metrics.start_job(raw_id)
+    with metrics.stage('llm_classify', record):
+        result = await classifier_agent.run(prompt)
+    metrics.record_usage('classifier', result, record)
+    metrics.end_job(record, 'processed')
+    metrics.print_summary()
+    metrics.write_prometheus('/var/lib/node_exporter/classify_jobs.prom')
+"""
+
+import os
+import sys
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+# shared/ lives at the repo root, one level up
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from shared.llm_usage import usage_tokens
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class PipelineMetrics:
+    """Collects stage durations, token usage and per-job outcomes for one run"""
+
+    def __init__(self, jsonl_path: Optional[str] = None):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.tokens: dict[str, dict[str, int]] = defaultdict(lambda: {'input': 0, 'output': 0, 'requests': 0})
+        self.statuses: dict[str, int] = defaultdict(int)
+        self.started = time.monotonic()
+        self.jsonl = open(jsonl_path, 'a') if jsonl_path else None
+
+    @contextmanager
+    def stage(self, name: str, record: Optional[dict] = None):
+        """Time a block; adds to the run totals and the job record if given"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.samples[name].append(elapsed)
+            if record is not None:
+                record['stages'][name] = record['stages'].get(name, 0.0) + elapsed
+
+    def record_usage(self, agent_name: str, result, record: Optional[dict] = None):
+        """Add the token usage of a pydantic-ai run result"""
+        try:
+            input_tokens, output_tokens = usage_tokens(result.usage())
+        except Exception:
+            return
+        self.add_tokens(agent_name, input_tokens, output_tokens, record)
+
+    def add_tokens(self, agent_name: str, input_tokens: int, output_tokens: int, record: Optional[dict] = None):
+        """Add one request's token counts - for usage reported outside pydantic-ai (batch results)"""
+        totals = self.tokens[agent_name]
+        totals['input'] += input_tokens
+        totals['output'] += output_tokens
+        totals['requests'] += 1
+        if record is not None:
+            job_tokens = record['tokens'].setdefault(agent_name, {'input': 0, 'output': 0})
+            job_tokens['input'] += input_tokens
+            job_tokens['output'] += output_tokens
+
+    def start_job(self, raw_id) -> dict:
+        return {'raw_id': str(raw_id), 'stages': {}, 'tokens': {}, 'started': time.perf_counter()}
+
+    def end_job(self, record: dict, status: str, **extra):
+        total = time.perf_counter() - record.pop('started')
+        self.samples['job_total'].append(total)
+        self.statuses[status] += 1
+        if self.jsonl:
+            self.jsonl.write(json.dumps({
+                'event': 'job',
+                'ts': time.time(),
+                'status': status,
+                'total_seconds': round(total, 4),
+                **record,
+                **extra,
+            }, default=str) + '\n')
+
+    def summary(self) -> dict:
+        stages = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            stages[name] = {
+                'count': len(ordered),
+                'total': sum(ordered),
+                **{f'p{p}': percentile(ordered, p) for p in PERCENTILES},
+                'max': ordered[-1],
+            }
+        return {
+            'wall_seconds': time.monotonic() - self.started,
+            'stages': stages,
+            'tokens': dict(self.tokens),
+            'statuses': dict(self.statuses),
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        wall = summary['wall_seconds']
+        print(f"{'stage':<16}{'count':>7}{'total s':>10}{'share':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}")
+        for name, s in sorted(summary['stages'].items(), key=lambda item: -item[1]['total']):
+            share = 100 * s['total'] / wall if wall else 0
+            print(f"{name:<16}{s['count']:>7}{s['total']:>10.2f}{share:>7.0f}%"
+                  f"{s['p50'] * 1000:>9.0f}{s['p90'] * 1000:>9.0f}{s['p99'] * 1000:>9.0f}")
+        for agent_name, t in summary['tokens'].items():
+            print(f"tokens[{agent_name}]: {t['input']} in / {t['output']} out over {t['requests']} calls")
+
+    def close(self):
+        if self.jsonl:
+            self.jsonl.write(json.dumps({'event': 'summary', 'ts': time.time(), **self.summary()}) + '\n')
+            self.jsonl.close()
+            self.jsonl = None
+
+    def write_prometheus(self, path: str, prefix: str = 'classify_jobs'):
+        """Write a node_exporter textfile - renamed into place so scrapes never see half a file"""
+        summary = self.summary()
+        lines = [
+            f'# HELP {prefix}_stage_seconds Time spent per pipeline stage',
+            f'# TYPE {prefix}_stage_seconds summary',
+        ]
+        for name, s in summary['stages'].items():
+            for p in PERCENTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{p / 100}"}} {s[f"p{p}"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {s["total"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+
+        lines += [f'# HELP {prefix}_tokens_total LLM tokens used', f'# TYPE {prefix}_tokens_total counter']
+        for agent_name, t in summary['tokens'].items():
+            lines.append(f'{prefix}_tokens_total{{agent="{agent_name}",direction="input"}} {t["input"]}')
+            lines.append(f'{prefix}_tokens_total{{agent="{agent_name}",direction="output"}} {t["output"]}')
+
+        lines += [f'# HELP {prefix}_jobs_total Jobs by outcome', f'# TYPE {prefix}_jobs_total counter']
+        for status, count in summary['statuses'].items():
+            lines.append(f'{prefix}_jobs_total{{status="{status}"}} {count}')
+
+        lines += [
+            f'# HELP {prefix}_last_run_seconds Wall time of the last run',
+            f'# TYPE {prefix}_last_run_seconds gauge',
+            f'{prefix}_last_run_seconds {summary["wall_seconds"]:.3f}',
+            f'# TYPE {prefix}_last_run_timestamp_seconds gauge',
+            f'{prefix}_last_run_timestamp_seconds {time.time():.0f}',
+        ]
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
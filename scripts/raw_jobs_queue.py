@@ -0,0 +1,184 @@
+"""
+raw_jobs work queue for classify_jobs.py
+
+raw_jobs doubles as the classification queue. Workers claim pending rows
+with a lease (FOR UPDATE SKIP LOCKED, so concurrent workers never collide),
+mark them processed/error when done, and a reaper returns rows whose lease
+expired to 'pending'.
+"""
+
+import os
+import json
+import socket
+
+import asyncpg
+
+# Claims are taken in small batches so a lease only has to cover a few LLM calls
+CLAIM_BATCH_SIZE = int(os.environ.get('CLAIM_BATCH_SIZE', '10'))
+LEASE_SECONDS = int(os.environ.get('LEASE_SECONDS', '600'))
+# DB work is short next to the LLM calls, so a few connections serve many jobs in flight
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '4'))
+
+
+# The inner SELECT is served by the partial indexes from migration 009 -
+# idx_raw_jobs_pending_source_received / idx_raw_jobs_pending_received
+# Params: $1 lease seconds, $2 worker id, $3 limit[, $4 source]
+CLAIM_SQL = """
+    WITH claimed AS (
+        UPDATE raw_jobs SET
+            processing_status = 'in_progress',
+            lease_until = NOW() + $1::int * INTERVAL '1 second',
+            claimed_by = $2
+        WHERE id IN (
+            SELECT id FROM raw_jobs
+            WHERE processing_status = 'pending'
+            {source_filter}
+            ORDER BY received_at DESC
+            LIMIT $3
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, source, source_id, raw_data, job_id, received_at
+    )
+    SELECT c.id as raw_id, c.source, c.source_id, c.raw_data, c.job_id,
+           j.title, j.company_name, j.location, j.full_description,
+           j.employment_type, j.seniority_level, j.compensation
+    FROM claimed c
+    LEFT JOIN jobs j ON c.job_id = j.id
+    ORDER BY c.received_at DESC
+"""
+
+# A resumed batch run takes back the rows of its manifest - whether still
+# leased to the crashed worker or reaped to pending since, not once another
+# worker holds them. Params: $1 lease seconds, $2 worker id, $3 raw ids, $4 old worker id
+RECLAIM_SQL = """
+    WITH claimed AS (
+        UPDATE raw_jobs SET
+            processing_status = 'in_progress',
+            lease_until = NOW() + $1::int * INTERVAL '1 second',
+            claimed_by = $2
+        -- Cast on the column side so this works whatever raw_jobs.id's type is
+        WHERE id::text = ANY($3::text[])
+        AND (
+            processing_status = 'pending'
+            OR (processing_status = 'in_progress' AND claimed_by = $4)
+        )
+        RETURNING id, source, source_id, raw_data, job_id, received_at
+    )
+    SELECT c.id as raw_id, c.source, c.source_id, c.raw_data, c.job_id,
+           j.title, j.company_name, j.location, j.full_description,
+           j.employment_type, j.seniority_level, j.compensation
+    FROM claimed c
+    LEFT JOIN jobs j ON c.job_id = j.id
+    ORDER BY c.received_at DESC
+"""
+
+# Kept as two statements (rather than "source = $4 OR $4 IS NULL") so each
+# gets a plan that can use its partial index
+CLAIM_SQL_ANY_SOURCE = CLAIM_SQL.format(source_filter='')
+CLAIM_SQL_BY_SOURCE = CLAIM_SQL.format(source_filter='AND source = $4')
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def _init_connection(conn):
+    # raw_data comes back as a dict, as it did with psycopg2
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def create_pool(database_url: str = None, max_size: int = DB_POOL_SIZE) -> asyncpg.Pool:
+    database_url = database_url or os.environ.get('DATABASE_URL')
+    if not database_url:
+        raise ValueError("DATABASE_URL environment variable not set")
+    return await asyncpg.create_pool(database_url, min_size=1, max_size=max_size, init=_init_connection)
+
+
+def _rowcount(status: str) -> int:
+    """asyncpg returns the command tag ('UPDATE 3') instead of a rowcount"""
+    return int(status.split()[-1])
+
+
+async def claim_pending_raw_jobs(
+    pool,
+    limit: int = 10,
+    source: str = None,
+    worker_id: str = None,
+    lease_seconds: int = LEASE_SECONDS
+) -> list[dict]:
+    """
+    Claim raw jobs pending classification.
+
+    Rows are flipped to 'in_progress' with a lease in a single statement;
+    SKIP LOCKED means concurrent workers never claim the same row and never
+    wait on each other. The statement runs outside a transaction block, so
+    the claim is committed straight away and other workers see it.
+    """
+    args = [lease_seconds, worker_id or default_worker_id(), limit]
+    if source:
+        args.append(source)
+    rows = await pool.fetch(CLAIM_SQL_BY_SOURCE if source else CLAIM_SQL_ANY_SOURCE, *args)
+    return [dict(row) for row in rows]
+
+
+async def reclaim_raw_jobs(
+    pool,
+    raw_ids: list,
+    worker_id: str,
+    previous_worker_id: str,
+    lease_seconds: int = LEASE_SECONDS
+) -> list[dict]:
+    """Claim specific rows again for a resumed run; rows another worker holds are skipped"""
+    rows = await pool.fetch(RECLAIM_SQL, lease_seconds, worker_id, [str(i) for i in raw_ids], previous_worker_id)
+    return [dict(row) for row in rows]
+
+
+async def renew_leases(pool, worker_id: str, lease_seconds: int = LEASE_SECONDS) -> int:
+    """Push the lease out on everything this worker still holds"""
+    status = await pool.execute("""
+        UPDATE raw_jobs SET
+            lease_until = NOW() + $1::int * INTERVAL '1 second'
+        WHERE processing_status = 'in_progress'
+        AND claimed_by = $2
+    """, lease_seconds, worker_id)
+    return _rowcount(status)
+
+
+async def reap_expired_leases(pool) -> int:
+    """Return rows whose lease ran out (crashed or stuck worker) to the pending pool"""
+    status = await pool.execute("""
+        UPDATE raw_jobs SET
+            processing_status = 'pending',
+            lease_until = NULL,
+            claimed_by = NULL
+        WHERE processing_status = 'in_progress'
+        AND lease_until < NOW()
+    """)
+    return _rowcount(status)
+
+
+async def release_leases(pool, worker_id: str) -> int:
+    """Hand back anything this worker claimed but did not finish"""
+    status = await pool.execute("""
+        UPDATE raw_jobs SET
+            processing_status = 'pending',
+            lease_until = NULL,
+            claimed_by = NULL
+        WHERE processing_status = 'in_progress'
+        AND claimed_by = $1
+    """, worker_id)
+    return _rowcount(status)
+
+
+async def mark_raw_job_processed(conn, raw_id, status: str = 'processed', error: str = None):
+    """Update raw_jobs status after processing and drop the lease"""
+    await conn.execute("""
+        UPDATE raw_jobs SET
+            processing_status = $1,
+            processed_at = NOW(),
+            processing_error = $2,
+            lease_until = NULL,
+            claimed_by = NULL
+        WHERE id = $3
+    """, status, error, raw_id)
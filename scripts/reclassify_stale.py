@@ -0,0 +1,221 @@
+"""
+Selective re-classification for classify_jobs.py (--reclassify-stale)
+
+Every job classify_jobs.py writes is stamped in job_classification_versions
+with CLASSIFIER_VERSION / EDITORIAL_VERSION - hashes of each tier's system
+prompt and output schema. After a prompt or field-description change, this
+mode walks only the active jobs stamped with an old version (or never
+stamped), busiest first by job_view_counts, and re-runs only the stale tier:
+
+- classifier stale: classify again and update the classification columns;
+  the editorial is rewritten only if it is stale too or the job newly
+  qualifies for one
+- editorial stale only: rewrite the editorial from the stored tier-1 fields
+  and update just the editorial columns
+
+Jobs are re-read from their latest raw_jobs row (the original scraped
+description and fields - the jobs columns hold our own rewrite and earlier
+classifier output).
+
+Usage:
+    python scripts/classify_jobs.py --reclassify-stale --limit 500
+"""
+
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from classify_jobs import (
+    CLASSIFIER_VERSION,
+    CLASSIFY_CONCURRENCY,
+    EDITORIAL_VERSION,
+    JobClassificationFields,
+    StructuredJob,
+    boilerplate_filter,
+    build_job_context,
+    classify_fields,
+    embed_job,
+    needs_editorial,
+    stamp_versions,
+    sync_job_to_zep,
+    update_job_classification,
+    update_job_editorial,
+    update_structured_job,
+    upsert_job_embedding,
+    write_editorial,
+)
+from materialize_matches import MATCH_MATERIALIZE_ENABLED, queue_job
+from pipeline_metrics import PipelineMetrics
+from raw_jobs_queue import create_pool
+
+logger = logging.getLogger(__name__)
+
+# Pages are re-queried after each one is written - refreshed jobs are no
+# longer stale, so the same query yields the next page
+STALE_PAGE_SIZE = 50
+
+# employment_type / seniority_level / compensation come from the scrape only:
+# the jobs columns hold the previous classifier's answers, which would prime
+# the new run with the output it is meant to replace
+STALE_JOBS_SQL = """
+    SELECT j.id AS job_id, r.id AS raw_id, COALESCE(r.source, 'jobs') AS source,
+           COALESCE(r.raw_data, '{}'::jsonb) AS raw_data,
+           j.title, j.company_name, j.location,
+           COALESCE(r.raw_data->>'job_description', j.full_description) AS full_description,
+           r.raw_data->>'employment_type' AS employment_type,
+           r.raw_data->>'seniority_level' AS seniority_level,
+           r.raw_data->>'salary_range' AS compensation,
+           j.skills_required, j.requirements,
+           v.classifier_version, v.editorial_version, v.classification
+    FROM jobs j
+    LEFT JOIN job_classification_versions v ON v.job_id = j.id
+    LEFT JOIN job_view_counts c ON c.job_id = j.id
+    LEFT JOIN LATERAL (
+        SELECT id, source, raw_data FROM raw_jobs
+        WHERE job_id = j.id
+        ORDER BY received_at DESC
+        LIMIT 1
+    ) r ON true
+    WHERE j.is_active = true
+    AND (
+        v.job_id IS NULL
+        OR v.classifier_version <> $1
+        OR (v.editorial_version IS NOT NULL AND v.editorial_version <> $2)
+    )
+    AND j.id <> ALL($3::int[])
+    ORDER BY COALESCE(c.views_last_7_days, 0) DESC, COALESCE(c.total_views, 0) DESC, j.id DESC
+    LIMIT $4
+"""
+
+
+def embedding_source(job: dict, classification, editorial):
+    """The fields job_texts embeds: the tier-1 answer plus the editorial's skills, rewritten or as stored"""
+    if editorial is not None:
+        return StructuredJob(**classification.model_dump(exclude={'confidence'}), **editorial.model_dump())
+    return SimpleNamespace(
+        **classification.model_dump(),
+        skills_required=job.get('skills_required'),
+        requirements=job.get('requirements')
+    )
+
+
+async def refresh_job(pool, job: dict, editorial_all: bool, metrics: PipelineMetrics) -> str:
+    """Re-run the stale tier(s) of one job; returns what was refreshed"""
+    # A never-stamped job has no stored tier-1 fields, so it is classified again
+    record = metrics.start_job(job['raw_id'] or job['job_id'])
+    classifier_stale = job['classifier_version'] != CLASSIFIER_VERSION or job['classification'] is None
+    has_editorial = job['editorial_version'] is not None
+    editorial_stale = has_editorial and job['editorial_version'] != EDITORIAL_VERSION
+
+    with metrics.stage('prepare', record):
+        context = build_job_context(job)
+
+    if classifier_stale:
+        classification = await classify_fields(context, metrics, record)
+    else:
+        classification = JobClassificationFields.model_validate(job['classification'])
+
+    wants_editorial = editorial_all or needs_editorial(classification)
+    rewrite = wants_editorial and (editorial_stale or not has_editorial)
+    editorial = await write_editorial(context, classification, metrics, record) if rewrite else None
+    if not classifier_stale and editorial is None:
+        # A stale editorial the job no longer qualifies for - left as it is
+        metrics.end_job(record, 'skipped')
+        return 'skipped'
+
+    with metrics.stage('db_update', record):
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if editorial is not None and classifier_stale:
+                    structured = StructuredJob(
+                        **classification.model_dump(exclude={'confidence'}),
+                        **editorial.model_dump()
+                    )
+                    await update_structured_job(conn, job['job_id'], structured)
+                    await stamp_versions(conn, job['job_id'], classification, EDITORIAL_VERSION)
+                    refreshed = 'classification + editorial'
+                elif editorial is not None:
+                    await update_job_editorial(conn, job['job_id'], editorial)
+                    await stamp_versions(conn, job['job_id'], classification, EDITORIAL_VERSION)
+                    refreshed = 'editorial'
+                else:
+                    await update_job_classification(conn, job['job_id'], classification)
+                    # An existing editorial keeps its stamp - stale or not, it was left alone
+                    await stamp_versions(conn, job['job_id'], classification, job['editorial_version'])
+                    refreshed = 'classification'
+                # Whichever tier changed, the job now embeds differently and its matches are stale
+                await upsert_job_embedding(conn, job['job_id'], embed_job(job, embedding_source(job, classification, editorial)))
+                if MATCH_MATERIALIZE_ENABLED:
+                    await queue_job(conn, job['job_id'])
+
+    if editorial is not None:
+        with metrics.stage('zep_sync', record):
+            await sync_job_to_zep(
+                job['job_id'], classification, job.get('title') or 'Unknown', job.get('company_name') or 'Unknown',
+                classification.city or job.get('location') or 'UK'
+            )
+
+    metrics.end_job(record, 'processed', refreshed=refreshed, editorial=editorial is not None)
+    return refreshed
+
+
+async def reclassify_stale(
+    limit: int = 1000,
+    editorial_all: bool = False,
+    metrics_jsonl: str = None,
+    metrics_prom: str = None,
+    concurrency: int = CLASSIFY_CONCURRENCY
+):
+    """Refresh up to limit jobs stamped with an outdated prompt version, busiest first"""
+    metrics = PipelineMetrics(jsonl_path=metrics_jsonl)
+    pool = await create_pool()
+    semaphore = asyncio.Semaphore(concurrency)
+    # Every job tried this run - a job that stays stale (error, skipped) isn't fetched twice
+    attempted: list[int] = []
+    errors = 0
+    counts: dict[str, int] = {}
+
+    async def run(job: dict):
+        nonlocal errors
+        async with semaphore:
+            try:
+                refreshed = await refresh_job(pool, job, editorial_all, metrics)
+                counts[refreshed] = counts.get(refreshed, 0) + 1
+            except Exception as e:
+                errors += 1
+                logger.warning("Job %s failed: %s", job['job_id'], e, extra={'event': 'reclassify.job'})
+
+    print(f"\n{'='*60}")
+    print("RECLASSIFY STALE JOBS")
+    print(f"{'='*60}")
+    print(f"Classifier version: {CLASSIFIER_VERSION}, Editorial version: {EDITORIAL_VERSION}")
+    print(f"{'='*60}\n")
+
+    try:
+        done = 0
+        while done < limit:
+            with metrics.stage('db_fetch_stale'):
+                jobs = [dict(row) for row in await pool.fetch(
+                    STALE_JOBS_SQL, CLASSIFIER_VERSION, EDITORIAL_VERSION, attempted,
+                    min(STALE_PAGE_SIZE, limit - done)
+                )]
+            if not jobs:
+                break
+            attempted.extend(job['job_id'] for job in jobs)
+            await asyncio.gather(*(run(job) for job in jobs))
+            done += len(jobs)
+            print(f"  {done} jobs refreshed or attempted - " +
+                  ', '.join(f"{n} {what}" for what, n in sorted(counts.items())))
+
+        print(f"\n{'='*60}")
+        print(f"COMPLETE: {sum(n for what, n in counts.items() if what != 'skipped')} refreshed, {errors} errors")
+        print(f"{'='*60}")
+        metrics.print_summary()
+        print(f"{'='*60}\n")
+
+    finally:
+        boilerplate_filter.save()
+        await pool.close()
+        metrics.close()
+        if metrics_prom:
+            metrics.write_prometheus(metrics_prom)
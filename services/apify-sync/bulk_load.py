@@ -0,0 +1,163 @@
+"""
+COPY-based bulk load of normalized Apify pages into jobs / raw_jobs
+
+Per page, in one transaction:
+1. binary COPY of the page into the unlogged apify_staging table
+   (asyncpg copy_records_to_table), tagged with a fresh load_id
+2. one statement that upserts jobs by source_url and raw_jobs by
+   (source, source_id), returning inserted / updated counts for both
+3. the page's staging rows are deleted
+
+A raw job whose payload changed goes back to 'pending' so classify_jobs.py
+picks it up again; rows a classifier currently holds a lease on are left
+alone, and keys that drift on every scrape (relative post times, applicant
+counts) don't count as a change.
+
+Opt-in (APIFY_BULK_LOAD=true) - the default stays database.py's
+save_jobs_to_neon. Before turning it on:
+- apply migrations/015_apify_bulk_load.sql; its unique indexes on
+  jobs(source_url) and raw_jobs(source, source_id) don't build while
+  duplicates exist (the migration lists queries to find them)
+- check the jobs columns in MERGE_SQL against the live jobs table
+
+Needs asyncpg.
+"""
+import json
+import logging
+import os
+import uuid
+from datetime import timezone
+
+import asyncpg
+
+from items import NormalizedPage
+
+logger = logging.getLogger(__name__)
+
+APIFY_BULK_LOAD = os.getenv("APIFY_BULK_LOAD", "false").lower() == "true"
+
+# raw_data keys that change between scrapes of an unchanged posting
+VOLATILE_KEYS = ['posted_at', 'time_posted', 'num_applicants']
+
+STAGING_COLUMNS = (
+    'load_id', 'source', 'source_id', 'source_url', 'title', 'company_name',
+    'location', 'is_remote', 'compensation', 'posted_date', 'description', 'raw_data',
+)
+
+MERGE_SQL = """
+    WITH page AS (
+        SELECT * FROM apify_staging WHERE load_id = $1
+    ),
+    latest AS (
+        SELECT DISTINCT ON (source_url) *
+        FROM page
+        WHERE source_url <> ''
+        ORDER BY source_url, posted_date DESC NULLS LAST
+    ),
+    job_rows AS (
+        INSERT INTO jobs (
+            slug, title, company_name, location, is_remote, compensation,
+            posted_date, source_url, job_source, is_active, description_snippet,
+            full_description, created_at, updated_at
+        )
+        SELECT
+            left(trim(BOTH '-' FROM regexp_replace(lower(title || ' ' || company_name), '[^a-z0-9]+', '-', 'g')), 80)
+                || '-' || left(md5(source_url), 6),
+            title, company_name, location, is_remote, compensation,
+            COALESCE(posted_date, NOW()), source_url, source || ' (Apify)', true,
+            NULLIF(left(regexp_replace(description, '\\s+', ' ', 'g'), 200), ''),
+            NULLIF(description, ''), NOW(), NOW()
+        FROM latest
+        ON CONFLICT (source_url) WHERE source_url IS NOT NULL DO UPDATE SET
+            title = EXCLUDED.title,
+            company_name = EXCLUDED.company_name,
+            location = EXCLUDED.location,
+            is_remote = EXCLUDED.is_remote,
+            compensation = COALESCE(EXCLUDED.compensation, jobs.compensation),
+            posted_date = EXCLUDED.posted_date,
+            is_active = true,
+            updated_at = NOW()
+        RETURNING id, source_url, (xmax = 0) AS inserted
+    ),
+    raw_rows AS (
+        INSERT INTO raw_jobs (source, source_id, raw_data, job_id, processing_status, received_at)
+        SELECT p.source, p.source_id, p.raw_data, j.id, 'pending', NOW()
+        FROM page p
+        LEFT JOIN job_rows j ON j.source_url = p.source_url
+        ON CONFLICT (source, source_id) DO UPDATE SET
+            raw_data = EXCLUDED.raw_data,
+            job_id = COALESCE(EXCLUDED.job_id, raw_jobs.job_id),
+            processing_status = CASE
+                WHEN raw_jobs.raw_data - $2::text[] IS DISTINCT FROM EXCLUDED.raw_data - $2::text[]
+                     AND raw_jobs.processing_status <> 'in_progress' THEN 'pending'
+                ELSE raw_jobs.processing_status
+            END,
+            received_at = CASE
+                WHEN raw_jobs.raw_data - $2::text[] IS DISTINCT FROM EXCLUDED.raw_data - $2::text[] THEN NOW()
+                ELSE raw_jobs.received_at
+            END
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT
+        (SELECT count(*) FILTER (WHERE inserted) FROM job_rows) AS jobs_inserted,
+        (SELECT count(*) FILTER (WHERE NOT inserted) FROM job_rows) AS jobs_updated,
+        (SELECT count(*) FILTER (WHERE inserted) FROM raw_rows) AS raw_inserted,
+        (SELECT count(*) FILTER (WHERE NOT inserted) FROM raw_rows) AS raw_updated
+"""
+
+_pool: asyncpg.Pool | None = None
+
+
+async def get_pool() -> asyncpg.Pool:
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(os.environ["DATABASE_URL"], min_size=1, max_size=2)
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def staging_records(page: NormalizedPage, load_id: uuid.UUID):
+    """Page columns as COPY tuples; the last duplicate source_id in a page wins"""
+    posted = page.posted_at.astype('datetime64[us]').tolist()
+    rows = {}
+    for i in range(len(page)):
+        if not page.source_id[i]:
+            continue
+        rows[page.source_id[i]] = (
+            load_id,
+            page.source,
+            page.source_id[i],
+            page.url[i],
+            page.title[i],
+            page.company[i],
+            page.location[i],
+            bool(page.is_remote[i]),
+            page.salary_range[i] or None,
+            posted[i].replace(tzinfo=timezone.utc) if posted[i] is not None else None,
+            page.description[i],
+            # jsonb goes over binary COPY as its text form
+            json.dumps(page.raw_data(i)),
+        )
+    return list(rows.values())
+
+
+async def bulk_load_page(page: NormalizedPage) -> dict:
+    """COPY one normalized page into staging and merge it; returns the merge counts"""
+    pool = await get_pool()
+    load_id = uuid.uuid4()
+    records = staging_records(page, load_id)
+    if not records:
+        return {'jobs_inserted': 0, 'jobs_updated': 0, 'raw_inserted': 0, 'raw_updated': 0}
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.copy_records_to_table('apify_staging', records=records, columns=STAGING_COLUMNS)
+            counts = dict(await conn.fetchrow(MERGE_SQL, load_id, VOLATILE_KEYS))
+            await conn.execute("DELETE FROM apify_staging WHERE load_id = $1", load_id)
+    return counts
@@ -0,0 +1,386 @@
+"""
+Typed decoding and batch normalization of Apify dataset items
+
+Dataset pages are fetched as raw JSON bytes and decoded straight into
+per-actor msgspec Structs - slotted, untracked by the GC, and holding only
+the fields we use (everything else is skipped by the decoder, never
+materialized as a dict). Each page is then normalized column by column:
+dates, locations and salary strings are parsed once per distinct value and
+scattered back, so a page of 1,000 items from one search costs a few dozen
+parses, not thousands.
+
+The normalized payload keeps the raw_data keys scripts/classify_jobs.py reads
+(job_title, company_name, job_description, salary_range, ...), whatever the
+actor.
+
+Requires msgspec and numpy.
+"""
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+import msgspec
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Items per dataset page - one page is decoded and normalized at a time
+ITEM_PAGE_SIZE = 1000
+
+
+# ============================================================================
+# ITEM SCHEMAS
+# ============================================================================
+
+class LinkedInItem(msgspec.Struct, gc=False, kw_only=True):
+    """LinkedIn jobs scraper (actor 'linkedin')"""
+    job_id: Optional[str | int] = None
+    job_url: Optional[str] = None
+    job_title: str = ''
+    company_name: str = ''
+    location: Optional[str] = None
+    employment_type: Optional[str] = None
+    seniority_level: Optional[str] = None
+    salary_range: Optional[str] = None
+    job_function: Optional[str] = None
+    industries: Optional[str] = None
+    time_posted: Optional[str] = None
+    posted_date: Optional[str] = None
+    num_applicants: Optional[str | int] = None
+    easy_apply: Optional[bool] = None
+    job_description: Optional[str] = None
+
+
+class AshbyCompensation(msgspec.Struct, gc=False, kw_only=True, rename='camel'):
+    compensation_tier_summary: Optional[str] = None
+
+
+class AshbyItem(msgspec.Struct, gc=False, kw_only=True, rename='camel'):
+    """Ashby job board postings (actor 'ashby')"""
+    id: Optional[str] = None
+    job_url: Optional[str] = None
+    title: str = ''
+    company_name: Optional[str] = None
+    organization_name: Optional[str] = None
+    location: Optional[str] = None
+    is_remote: Optional[bool] = None
+    employment_type: Optional[str] = None
+    department: Optional[str] = None
+    published_at: Optional[str] = None
+    description_plain: Optional[str] = None
+    compensation: Optional[AshbyCompensation] = None
+
+
+class FantasticJobsItem(msgspec.Struct, gc=False, kw_only=True):
+    """Fantastic.jobs LinkedIn / career-site APIs (see lib/apify.ts ApifyJob)"""
+    id: Optional[str] = None
+    url: Optional[str] = None
+    title: str = ''
+    organization: str = ''
+    date_posted: Optional[str] = None
+    date_created: Optional[str] = None
+    salary_raw: Optional[str] = None
+    employment_type: Optional[list[str]] = None
+    locations_derived: Optional[list[str]] = None
+    cities_derived: Optional[list[str]] = None
+    remote_derived: Optional[bool] = None
+    source: Optional[str] = None
+    description_text: Optional[str] = None
+    ai_salary_value: Optional[float] = None
+    ai_salary_currency: Optional[str] = None
+    ai_salary_unittext: Optional[str] = None
+    ai_experience_level: Optional[str] = None
+    ai_work_arrangement: Optional[str] = None
+
+
+ITEM_TYPES: dict[str, type[msgspec.Struct]] = {
+    'linkedin': LinkedInItem,
+    'ashby': AshbyItem,
+    'fantastic-linkedin': FantasticJobsItem,
+    'career-site': FantasticJobsItem,
+}
+
+_decoders: dict[type, msgspec.json.Decoder] = {}
+
+
+def item_type(actor_name: str) -> type[msgspec.Struct]:
+    """Schema for an actor; unknown actors are assumed to be Fantastic.jobs-shaped"""
+    return ITEM_TYPES.get(actor_name, FantasticJobsItem)
+
+
+def decode_page(data: bytes, actor_name: str) -> list:
+    """
+    Decode a JSON array of items into Structs.
+
+    The whole page goes through one typed decode; if any item is malformed,
+    the page is split into raw items and only the bad ones are dropped.
+    """
+    cls = item_type(actor_name)
+    if cls not in _decoders:
+        _decoders[cls] = msgspec.json.Decoder(list[cls])
+    try:
+        return _decoders[cls].decode(data)
+    except msgspec.ValidationError:
+        items = []
+        for raw in msgspec.json.decode(data, type=list[msgspec.Raw]):
+            try:
+                items.append(msgspec.json.decode(raw, type=cls))
+            except msgspec.ValidationError as e:
+                logger.warning("Dropping malformed %s item: %s", actor_name, e)
+        return items
+
+
+def decode_items(data: bytes) -> list[dict]:
+    """A page as Apify's own item dicts - every field, actor key names"""
+    return msgspec.json.decode(data)
+
+
+def iter_dataset_bytes(dataset_client, page_size: int = ITEM_PAGE_SIZE) -> Iterator[bytes]:
+    """Yield an Apify dataset as raw JSON pages, one page in memory at a time"""
+    offset = 0
+    while True:
+        data = dataset_client.get_items_as_bytes(item_format='json', offset=offset, limit=page_size, clean=True)
+        if not data or data.strip() in (b'', b'[]'):
+            return
+        yield data
+        offset += page_size
+
+
+def iter_dataset_pages(dataset_client, actor_name: str, page_size: int = ITEM_PAGE_SIZE) -> Iterator[list]:
+    """Yield decoded pages of an Apify dataset, never holding more than one page of raw JSON"""
+    for data in iter_dataset_bytes(dataset_client, page_size):
+        yield decode_page(data, actor_name)
+
+
+# ============================================================================
+# COLUMNAR NORMALIZATION
+# ============================================================================
+
+UK_HINTS = ('united kingdom', 'uk', 'england', 'scotland', 'wales', 'northern ireland', 'great britain')
+CURRENCY_SYMBOLS = {'£': 'GBP', '$': 'USD', '€': 'EUR'}
+SALARY_AMOUNT = re.compile(r'(\d+(?:[.,]\d+)*)\s*([kK])?')
+SALARY_PERIODS = (
+    ('day', ('day', 'daily', '/d', 'p/d', 'pd')),
+    ('hour', ('hour', 'hourly', '/hr', 'ph')),
+    ('month', ('month', 'monthly', 'pcm')),
+    ('year', ('year', 'annum', 'annual', 'yearly', 'pa', 'p.a')),
+)
+RELATIVE_POSTED = re.compile(r'(\d+)\s*(minute|hour|day|week|month)s?\s+ago', re.I)
+RELATIVE_UNITS = {'minute': 60, 'hour': 3600, 'day': 86400, 'week': 7 * 86400, 'month': 30 * 86400}
+
+
+def _distinct(values: list) -> tuple[list, np.ndarray]:
+    """(distinct values, index of each input value into them)"""
+    index: dict = {}
+    inverse = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+    return list(index), inverse
+
+
+def map_distinct(values: list, parse, dtype=object) -> np.ndarray:
+    """Apply parse once per distinct value and scatter the results back over the column"""
+    distinct, inverse = _distinct(values)
+    parsed = np.empty(len(distinct), dtype=dtype)
+    for k, value in enumerate(distinct):
+        parsed[k] = parse(value)
+    return parsed[inverse]
+
+
+def parse_location(location: Optional[str]) -> tuple[str, str, bool]:
+    """(city, country, remote) from a free-text location"""
+    if not location:
+        return '', '', False
+    text = location.strip()
+    remote = 'remote' in text.lower()
+    parts = [p.strip() for p in text.split(',') if p.strip() and p.strip().lower() != 'remote']
+    if not parts:
+        return '', '', remote
+    country = parts[-1] if len(parts) > 1 else ''
+    if parts[-1].lower() in UK_HINTS:
+        country = 'United Kingdom'
+    city = parts[0] if len(parts) > 1 or not country else ''
+    return city, country, remote
+
+
+def parse_salary(text: Optional[str]) -> tuple[float, float, str, str]:
+    """(min, max, currency, period) from a salary string; NaN amounts when there are none"""
+    if not text:
+        return np.nan, np.nan, '', ''
+    lowered = text.lower()
+    currency = next((code for symbol, code in CURRENCY_SYMBOLS.items() if symbol in text), '')
+    if not currency:
+        currency = next((code for code in ('GBP', 'USD', 'EUR') if code.lower() in lowered), '')
+    amounts = []
+    for number, thousands in SALARY_AMOUNT.findall(text):
+        value = float(number.replace(',', ''))
+        amounts.append(value * 1000 if thousands else value)
+    amounts = [a for a in amounts if a >= 10] or [np.nan]
+    period = next((name for name, hints in SALARY_PERIODS if any(h in lowered for h in hints)), '')
+    return min(amounts), max(amounts), currency, period
+
+
+def parse_dates(values: list[Optional[str]], now: np.datetime64) -> np.ndarray:
+    """ISO timestamps or LinkedIn-style '3 days ago' to datetime64[s] (NaT when unknown)"""
+    def parse(value: Optional[str]):
+        if not value:
+            return np.datetime64('NaT')
+        match = RELATIVE_POSTED.search(value)
+        if match:
+            return now - np.timedelta64(int(match.group(1)) * RELATIVE_UNITS[match.group(2).lower()], 's')
+        try:
+            # Timestamps are UTC; numpy doesn't take the zone suffix
+            return np.datetime64(value[:19].rstrip('Z'), 's')
+        except ValueError:
+            return np.datetime64('NaT')
+
+    return map_distinct(values, parse, dtype='datetime64[s]')
+
+
+@dataclass(slots=True)
+class NormalizedPage:
+    """One page of items as columns - what the loaders consume"""
+    source: str
+    source_id: list[str]
+    url: list[str]
+    title: list[str]
+    company: list[str]
+    location: list[str]
+    city: np.ndarray
+    country: np.ndarray
+    is_remote: np.ndarray
+    employment_type: list[str]
+    seniority_level: list[str]
+    salary_range: list[str]
+    salary_min: np.ndarray
+    salary_max: np.ndarray
+    salary_currency: np.ndarray
+    salary_period: np.ndarray
+    posted_at: np.ndarray
+    description: list[str]
+    extra: list[dict]
+
+    def __len__(self) -> int:
+        return len(self.source_id)
+
+    def raw_data(self, i: int) -> dict:
+        """raw_jobs.raw_data for one item, in the keys classify_jobs.py reads"""
+        posted = self.posted_at[i]
+        return {
+            'job_title': self.title[i],
+            'company_name': self.company[i],
+            'location': self.location[i],
+            'employment_type': self.employment_type[i],
+            'seniority_level': self.seniority_level[i],
+            'salary_range': self.salary_range[i],
+            'job_description': self.description[i],
+            'job_url': self.url[i],
+            'posted_at': None if np.isnat(posted) else f"{posted}Z",
+            'city': self.city[i],
+            'country': self.country[i],
+            'is_remote': bool(self.is_remote[i]),
+            'salary_min': None if np.isnan(self.salary_min[i]) else float(self.salary_min[i]),
+            'salary_max': None if np.isnan(self.salary_max[i]) else float(self.salary_max[i]),
+            'salary_currency': self.salary_currency[i] or None,
+            'salary_period': self.salary_period[i] or None,
+            **self.extra[i],
+        }
+
+    def records(self) -> list[dict]:
+        """Row-wise dicts (source, source_id, raw_data) for callers that want items one by one"""
+        return [
+            {'source': self.source, 'source_id': self.source_id[i], **self.raw_data(i)}
+            for i in range(len(self))
+        ]
+
+
+def _columns(items: list, actor_name: str) -> dict[str, list]:
+    """Pull the common columns out of an actor's Structs"""
+    cls = item_type(actor_name)
+    if cls is LinkedInItem:
+        return {
+            'source_id': [str(i.job_id or i.job_url or '') for i in items],
+            'url': [i.job_url or '' for i in items],
+            'title': [i.job_title for i in items],
+            'company': [i.company_name for i in items],
+            'location': [i.location or '' for i in items],
+            'remote_flag': [False] * len(items),
+            'employment_type': [i.employment_type or '' for i in items],
+            'seniority_level': [i.seniority_level or '' for i in items],
+            'salary_range': [i.salary_range or '' for i in items],
+            'posted': [i.posted_date or i.time_posted for i in items],
+            'description': [i.job_description or '' for i in items],
+            'extra': [{
+                'job_function': i.job_function,
+                'industries': i.industries,
+                'time_posted': i.time_posted,
+                'num_applicants': i.num_applicants,
+                'easy_apply': i.easy_apply,
+            } for i in items],
+        }
+    if cls is AshbyItem:
+        return {
+            'source_id': [i.id or i.job_url or '' for i in items],
+            'url': [i.job_url or '' for i in items],
+            'title': [i.title for i in items],
+            'company': [i.company_name or i.organization_name or '' for i in items],
+            'location': [i.location or '' for i in items],
+            'remote_flag': [bool(i.is_remote) for i in items],
+            'employment_type': [i.employment_type or '' for i in items],
+            'seniority_level': ['' for _ in items],
+            'salary_range': [(i.compensation and i.compensation.compensation_tier_summary) or '' for i in items],
+            'posted': [i.published_at for i in items],
+            'description': [i.description_plain or '' for i in items],
+            'extra': [{'job_function': i.department} if i.department else {} for i in items],
+        }
+    return {
+        'source_id': [i.id or i.url or '' for i in items],
+        'url': [i.url or '' for i in items],
+        'title': [i.title for i in items],
+        'company': [i.organization for i in items],
+        'location': [(i.locations_derived or i.cities_derived or [''])[0] for i in items],
+        'remote_flag': [bool(i.remote_derived) or 'remote' in (i.ai_work_arrangement or '').lower() for i in items],
+        'employment_type': [', '.join(i.employment_type or []) for i in items],
+        'seniority_level': [i.ai_experience_level or '' for i in items],
+        'salary_range': [
+            i.salary_raw or (
+                f"{i.ai_salary_currency or ''} {i.ai_salary_value:g} per {i.ai_salary_unittext or ''}".strip()
+                if i.ai_salary_value else ''
+            )
+            for i in items
+        ],
+        'posted': [i.date_posted or i.date_created for i in items],
+        'description': [i.description_text or '' for i in items],
+        'extra': [{'job_source': i.source} if i.source else {} for i in items],
+    }
+
+
+def normalize_page(items: list, actor_name: str, now: Optional[datetime] = None) -> NormalizedPage:
+    """Normalize one decoded page column by column"""
+    columns = _columns(items, actor_name)
+    now64 = np.datetime64((now or datetime.now(timezone.utc)).replace(tzinfo=None), 's')
+
+    locations = map_distinct(columns['location'], parse_location)
+    salaries = map_distinct(columns['salary_range'], parse_salary)
+
+    return NormalizedPage(
+        source=actor_name,
+        source_id=columns['source_id'],
+        url=columns['url'],
+        title=columns['title'],
+        company=columns['company'],
+        location=columns['location'],
+        city=np.array([l[0] for l in locations], dtype=object),
+        country=np.array([l[1] for l in locations], dtype=object),
+        is_remote=np.array([l[2] for l in locations], dtype=bool) | np.array(columns['remote_flag'], dtype=bool),
+        employment_type=columns['employment_type'],
+        seniority_level=columns['seniority_level'],
+        salary_range=columns['salary_range'],
+        salary_min=np.array([s[0] for s in salaries], dtype=np.float64),
+        salary_max=np.array([s[1] for s in salaries], dtype=np.float64),
+        salary_currency=np.array([s[2] for s in salaries], dtype=object),
+        salary_period=np.array([s[3] for s in salaries], dtype=object),
+        posted_at=parse_dates(columns['posted'], now64),
+        description=columns['description'],
+        extra=columns['extra'],
+    )
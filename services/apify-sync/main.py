@@ -8,16 +8,23 @@ from contextlib import asynccontextmanager
 import logging
 from typing import Dict, Any
 import os
+import sys
+from pathlib import Path
 
 from apify_client import ApifyClient
 from database import save_jobs_to_neon, get_recent_jobs
 from classifiers import classify_and_sync_jobs
+from bulk_load import APIFY_BULK_LOAD, bulk_load_page, close_pool
+from items import decode_items, decode_page, iter_dataset_bytes, normalize_page
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# shared/ lives at the repo root, two levels up
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from shared.fast_json import FastJSONResponse, use_fast_json
+from shared.instrumentation import count_items, instrument_app, record_dataset, track_background
+from shared.structured_logging import configure_logging
+
+# JSON lines from a background writer; full webhook payloads are sampled
+configure_logging("apify-sync", sample={"webhook.payload": 0.1})
 logger = logging.getLogger(__name__)
 
 # Environment variables
@@ -35,9 +42,10 @@ apify_client = ApifyClient(APIFY_API_KEY) if APIFY_API_KEY else None
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     logger.info("Starting Apify Webhook Service")
-    logger.info(f"Database URL configured: {bool(DATABASE_URL)}")
-    logger.info(f"Apify API Key configured: {bool(APIFY_API_KEY)}")
+    logger.info("Database URL configured: %s", bool(DATABASE_URL))
+    logger.info("Apify API Key configured: %s", bool(APIFY_API_KEY))
     yield
+    await close_pool()
     logger.info("Shutting down Apify Webhook Service")
 
 
@@ -47,6 +55,8 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan
 )
+instrument_app(app, service="apify-sync")
+use_fast_json(app)
 
 # CORS middleware
 app.add_middleware(
@@ -95,15 +105,15 @@ async def handle_apify_webhook(
     - eventType: Type of event (e.g., "ACTOR.RUN.SUCCEEDED")
     - eventData: Additional event data
     """
-    logger.info(f"Received webhook for actor: {actor_name}")
-    logger.info(f"Payload: {payload}")
+    logger.info("Received webhook for actor: %s", actor_name, extra={"event": "webhook.received"})
+    logger.info("Payload: %s", payload, extra={"event": "webhook.payload"})
 
     event_type = payload.get("eventType")
     dataset_id = payload.get("resource", {}).get("defaultDatasetId")
     run_id = payload.get("resource", {}).get("id")
 
     if event_type != "ACTOR.RUN.SUCCEEDED":
-        logger.warning(f"Ignoring non-success event: {event_type}")
+        logger.warning("Ignoring non-success event: %s", event_type)
         return {"status": "ignored", "reason": f"Event type {event_type} not processed"}
 
     if not dataset_id:
@@ -136,34 +146,53 @@ async def process_apify_dataset(actor_name: str, dataset_id: str, run_id: str):
         run_id: Apify run ID
     """
     try:
-        logger.info(f"Processing dataset {dataset_id} from {actor_name}")
-
-        if not apify_client:
-            logger.error("Apify client not configured")
-            return
-
-        # 1. Fetch dataset from Apify
-        dataset = apify_client.dataset(dataset_id)
-        items = list(dataset.iterate_items())
-
-        logger.info(f"Fetched {len(items)} items from Apify dataset")
-
-        if not items:
-            logger.warning("No items in dataset")
-            return
-
-        # 2. Save to Neon database
-        logger.info("Saving jobs to Neon database...")
-        saved_count = await save_jobs_to_neon(items, actor_name)
-        logger.info(f"Saved {saved_count} jobs to Neon")
-
-        # 3. Classify and sync to ZEP (async)
-        logger.info("Starting classification and ZEP sync...")
-        await classify_and_sync_jobs(items, actor_name)
-        logger.info("Classification and sync complete")
+        async with track_background("process_apify_dataset"):
+            logger.info("Processing dataset %s from %s", dataset_id, actor_name)
+
+            if not apify_client:
+                logger.error("Apify client not configured")
+                return
+
+            # 1. Fetch the dataset a page at a time and decode it once, for the
+            # path that runs:
+            # - APIFY_BULK_LOAD=true (bulk_load.py): typed items normalized as columns (items.py),
+            #   COPY + one merge per page. New and changed raw_jobs land as
+            #   'pending', so classify_jobs.py workers classify and sync them
+            # - default: Apify's own item dicts, which database.py
+            #   and classifiers.py are written against
+            dataset = apify_client.dataset(dataset_id)
+            total = 0
+            for data in iter_dataset_bytes(dataset):
+                if APIFY_BULK_LOAD:
+                    page = normalize_page(decode_page(data, actor_name), actor_name)
+                    del data
+                    page_size = len(page)
+                    counts = await bulk_load_page(page)
+                    saved_count = counts['raw_inserted'] + counts['raw_updated']
+                    logger.info("Jobs: %d inserted, %d updated", counts['jobs_inserted'], counts['jobs_updated'],
+                                extra={"event": "dataset.page"})
+                else:
+                    items = decode_items(data)
+                    del data
+                    page_size = len(items)
+                    saved_count = await save_jobs_to_neon(items, actor_name)
+                total += page_size
+                count_items(actor_name, "saved", saved_count)
+                logger.info("Saved %d/%d jobs to Neon", saved_count, page_size, extra={"event": "dataset.page"})
+
+                if not APIFY_BULK_LOAD:
+                    # 2. Classify and sync to ZEP (async)
+                    await classify_and_sync_jobs(items, actor_name)
+                    count_items(actor_name, "classified", page_size)
+
+            record_dataset(actor_name, total)
+            if not total:
+                logger.warning("No items in dataset")
+                return
+            logger.info("Processed %d items from Apify dataset", total)
 
     except Exception as e:
-        logger.error(f"Error processing dataset {dataset_id}: {e}", exc_info=True)
+        logger.error("Error processing dataset %s: %s", dataset_id, e, exc_info=True)
 
 
 @app.get("/scraper/dashboard")
@@ -194,7 +223,7 @@ async def dashboard():
             "schedules": schedules_info
         }
     except Exception as e:
-        logger.error(f"Error fetching schedules: {e}")
+        logger.error("Error fetching schedules: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -205,7 +234,7 @@ async def manual_trigger(actor_id: str):
         raise HTTPException(status_code=503, detail="Apify client not configured")
 
     try:
-        logger.info(f"Manually triggering actor {actor_id}")
+        logger.info("Manually triggering actor %s", actor_id)
 
         run = apify_client.actor(actor_id).call()
 
@@ -216,7 +245,7 @@ async def manual_trigger(actor_id: str):
             "actor_id": actor_id
         }
     except Exception as e:
-        logger.error(f"Error triggering actor {actor_id}: {e}")
+        logger.error("Error triggering actor %s: %s", actor_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -225,12 +254,13 @@ async def recent_jobs(limit: int = 50):
     """Get recently scraped jobs from Neon"""
     try:
         jobs = await get_recent_jobs(limit)
-        return {
+        # Returned as a response so the job list skips jsonable_encoder
+        return FastJSONResponse({
             "count": len(jobs),
             "jobs": jobs
-        }
+        })
     except Exception as e:
-        logger.error(f"Error fetching recent jobs: {e}")
+        logger.error("Error fetching recent jobs: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -0,0 +1,222 @@
+"""
+Job View Rollup Worker
+Keeps job_view_counts current by folding only new job_views rows
+
+Each cycle, in one transaction:
+1. Take views past the high-water mark (job_views.id), in id order, and add
+   them to hourly buckets in job_view_buckets and to total_views
+2. Recompute the 7-day / 24-hour windows from buckets - only for jobs that
+   got new views or had a bucket age out since the last cycle
+3. Prune buckets older than 7 days and advance the high-water mark
+
+Cost follows new traffic, not history. Windows have hourly resolution.
+
+Run migrations/010_job_view_rollup.sql first. The first run bootstraps from
+a one-off full count; after that job_views is only read past the mark.
+
+Usage:
+    python worker.py                 # loop every ROLLUP_INTERVAL seconds
+    python worker.py --once          # single cycle (cron)
+"""
+import os
+import asyncio
+import logging
+
+import asyncpg
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("view-rollup")
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+ROLLUP_INTERVAL = int(os.getenv("ROLLUP_INTERVAL", "60"))
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "50000"))
+# Views this recent are left for the next cycle. ids are assigned at insert but
+# become visible at commit, so a lower id can still be in flight behind a
+# higher one we can already see.
+ROLLUP_SETTLE_SECONDS = int(os.getenv("ROLLUP_SETTLE_SECONDS", "30"))
+
+BOOTSTRAP_SQL = """
+    WITH mark AS (
+        SELECT COALESCE(MAX(id), 0) AS last_view_id FROM job_views
+    ), buckets AS (
+        INSERT INTO job_view_buckets (job_id, bucket, views)
+        SELECT job_id, date_trunc('hour', viewed_at), COUNT(*)
+        FROM job_views
+        WHERE viewed_at > NOW() - INTERVAL '7 days'
+        AND id <= (SELECT last_view_id FROM mark)
+        GROUP BY 1, 2
+        ON CONFLICT (job_id, bucket) DO UPDATE SET views = EXCLUDED.views
+    ), counts AS (
+        INSERT INTO job_view_counts (job_id, total_views, views_last_7_days, views_last_24_hours, last_updated)
+        SELECT
+            job_id,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE viewed_at > NOW() - INTERVAL '7 days'),
+            COUNT(*) FILTER (WHERE viewed_at > NOW() - INTERVAL '24 hours'),
+            NOW()
+        FROM job_views
+        WHERE id <= (SELECT last_view_id FROM mark)
+        GROUP BY job_id
+        ON CONFLICT (job_id) DO UPDATE SET
+            total_views = EXCLUDED.total_views,
+            views_last_7_days = EXCLUDED.views_last_7_days,
+            views_last_24_hours = EXCLUDED.views_last_24_hours,
+            last_updated = NOW()
+    )
+    INSERT INTO job_view_rollup_state (id, last_view_id, windows_as_of, updated_at)
+    SELECT true, last_view_id, NOW(), NOW() FROM mark
+    ON CONFLICT (id) DO NOTHING
+    RETURNING last_view_id
+"""
+
+# Hourly per-job deltas for the next batch past the mark, stopping at the
+# first view that hasn't settled yet
+NEW_VIEWS_SQL = """
+    WITH candidate AS (
+        SELECT id, job_id, viewed_at
+        FROM job_views
+        WHERE id > $1
+        ORDER BY id
+        LIMIT $2
+    ), settled AS (
+        SELECT * FROM candidate
+        WHERE id < COALESCE(
+            (SELECT MIN(id) FROM candidate WHERE viewed_at > NOW() - $3::int * INTERVAL '1 second'),
+            9223372036854775807
+        )
+    )
+    SELECT job_id, date_trunc('hour', viewed_at) AS bucket, COUNT(*)::int AS views, MAX(id) AS max_id
+    FROM settled
+    GROUP BY 1, 2
+"""
+
+UPSERT_BUCKETS_SQL = """
+    INSERT INTO job_view_buckets (job_id, bucket, views)
+    SELECT job_id, bucket, views
+    FROM unnest($1::int[], $2::timestamptz[], $3::int[]) AS t(job_id, bucket, views)
+    WHERE bucket > NOW() - INTERVAL '7 days'
+    ON CONFLICT (job_id, bucket) DO UPDATE SET views = job_view_buckets.views + EXCLUDED.views
+"""
+
+ADD_TOTALS_SQL = """
+    INSERT INTO job_view_counts (job_id, total_views, last_updated)
+    SELECT job_id, views, NOW()
+    FROM unnest($1::int[], $2::int[]) AS t(job_id, views)
+    ON CONFLICT (job_id) DO UPDATE SET
+        total_views = job_view_counts.total_views + EXCLUDED.total_views,
+        last_updated = NOW()
+"""
+
+# Jobs with new views, plus jobs with a bucket that crossed a window edge
+# since windows_as_of ($2) - everything else is unchanged
+REFRESH_WINDOWS_SQL = """
+    WITH affected AS (
+        SELECT unnest($1::int[]) AS job_id
+        UNION
+        SELECT job_id FROM job_view_buckets
+        WHERE bucket > $2::timestamptz - INTERVAL '7 days' AND bucket <= NOW() - INTERVAL '7 days'
+        UNION
+        SELECT job_id FROM job_view_buckets
+        WHERE bucket > $2::timestamptz - INTERVAL '24 hours' AND bucket <= NOW() - INTERVAL '24 hours'
+    ), windows AS (
+        SELECT
+            a.job_id,
+            COALESCE(SUM(b.views), 0) AS views_7d,
+            COALESCE(SUM(b.views) FILTER (WHERE b.bucket > NOW() - INTERVAL '24 hours'), 0) AS views_24h
+        FROM affected a
+        LEFT JOIN job_view_buckets b
+            ON b.job_id = a.job_id AND b.bucket > NOW() - INTERVAL '7 days'
+        GROUP BY a.job_id
+    )
+    UPDATE job_view_counts c SET
+        views_last_7_days = w.views_7d,
+        views_last_24_hours = w.views_24h,
+        last_updated = NOW()
+    FROM windows w
+    WHERE c.job_id = w.job_id
+"""
+
+
+async def bootstrap(conn) -> int:
+    """One-off full count, then the mark takes over"""
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE job_view_rollup_state IN EXCLUSIVE MODE")
+        mark = await conn.fetchval("SELECT last_view_id FROM job_view_rollup_state")
+        if mark is not None:
+            return mark
+        logger.info("No rollup state - bootstrapping from a full count of job_views")
+        return await conn.fetchval(BOOTSTRAP_SQL)
+
+
+async def run_cycle(conn, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """Fold one batch of new views and refresh affected windows; returns views folded"""
+    async with conn.transaction():
+        state = await conn.fetchrow(
+            "SELECT last_view_id, windows_as_of FROM job_view_rollup_state FOR UPDATE"
+        )
+        if state is None:
+            raise RuntimeError("job_view_rollup_state is empty - bootstrap first")
+
+        rows = await conn.fetch(NEW_VIEWS_SQL, state["last_view_id"], batch_size, ROLLUP_SETTLE_SECONDS)
+
+        totals: dict[int, int] = {}
+        for row in rows:
+            totals[row["job_id"]] = totals.get(row["job_id"], 0) + row["views"]
+
+        if rows:
+            await conn.execute(
+                UPSERT_BUCKETS_SQL,
+                [r["job_id"] for r in rows], [r["bucket"] for r in rows], [r["views"] for r in rows]
+            )
+            await conn.execute(ADD_TOTALS_SQL, list(totals), list(totals.values()))
+
+        await conn.execute(REFRESH_WINDOWS_SQL, list(totals), state["windows_as_of"])
+        await conn.execute("DELETE FROM job_view_buckets WHERE bucket <= NOW() - INTERVAL '7 days'")
+
+        last_view_id = max((r["max_id"] for r in rows), default=state["last_view_id"])
+        await conn.execute(
+            "UPDATE job_view_rollup_state SET last_view_id = $1, windows_as_of = NOW(), updated_at = NOW()",
+            last_view_id
+        )
+
+    return sum(totals.values())
+
+
+async def main(once: bool = False, interval: int = ROLLUP_INTERVAL, batch_size: int = ROLLUP_BATCH_SIZE):
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL environment variable not set")
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        mark = await bootstrap(conn)
+        logger.info(f"Rollup starting from job_views.id > {mark}")
+
+        while True:
+            # Drain the backlog in batches, then sleep
+            while True:
+                folded = await run_cycle(conn, batch_size)
+                if folded:
+                    logger.info(f"Folded {folded} views")
+                if folded < batch_size:
+                    break
+
+            if once:
+                return
+            await asyncio.sleep(interval)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Incrementally roll job_views up into job_view_counts')
+    parser.add_argument('--once', action='store_true', help='Run a single cycle and exit')
+    parser.add_argument('--interval', type=int, default=ROLLUP_INTERVAL, help='Seconds between cycles')
+    parser.add_argument('--batch-size', type=int, default=ROLLUP_BATCH_SIZE, help='Max views folded per transaction')
+
+    args = parser.parse_args()
+    asyncio.run(main(once=args.once, interval=args.interval, batch_size=args.batch_size))
@@ -0,0 +1 @@
+"""Code shared by the Python services (repo-agent, services/apify-sync) and scripts/"""
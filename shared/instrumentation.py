@@ -0,0 +1,160 @@
+"""
+Prometheus instrumentation for the FastAPI services
+
+Usage:
+    from shared.instrumentation import instrument_app, instrument_agent, track_background
+
+    app = FastAPI(...)
+    instrument_app(app, service='repo-agent')          # middleware + GET /metrics
+    instrument_agent(extraction_agent, 'extraction')   # times every Agent.run
+
+    async with track_background('process_dataset'):
+        ...
+
+Routes are labelled by their template (/webhook/apify/{actor_name}), never
+the raw path, so label cardinality stays bounded.
+"""
+
+import time
+import functools
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from shared.llm_usage import usage_tokens
+
+# Requests in the services are fast; LLM calls and dataset runs are not
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+TASK_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+SERVICE = 'unknown'
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template',
+    ['service', 'method', 'route', 'status'], buckets=REQUEST_BUCKETS
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'HTTP requests currently being served', ['service', 'method']
+)
+BACKGROUND_TASKS_IN_FLIGHT = Gauge(
+    'background_tasks_in_flight', 'Background tasks currently running', ['service', 'task']
+)
+BACKGROUND_TASK_SECONDS = Histogram(
+    'background_task_duration_seconds', 'Background task duration',
+    ['service', 'task', 'outcome'], buckets=TASK_BUCKETS
+)
+DATASET_ITEMS = Histogram(
+    'dataset_items', 'Items per fetched dataset', ['service', 'source'], buckets=SIZE_BUCKETS
+)
+ITEMS_TOTAL = Counter(
+    'items_processed_total', 'Items through each pipeline stage', ['service', 'source', 'stage']
+)
+LLM_CALL_SECONDS = Histogram(
+    'llm_call_duration_seconds', 'pydantic-ai Agent.run latency',
+    ['service', 'agent', 'outcome'], buckets=LLM_BUCKETS
+)
+LLM_TOKENS = Counter(
+    'llm_tokens_total', 'LLM tokens used', ['service', 'agent', 'direction']
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware - BaseHTTPMiddleware would buffer every response"""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status = {'code': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(self.service, method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            # FastAPI records the matched route in the scope; unmatched paths share one label
+            route = scope.get('route')
+            route_label = getattr(route, 'path', None) or 'unmatched'
+            if route_label != '/metrics':
+                REQUEST_SECONDS.labels(self.service, method, route_label, str(status['code'])).observe(
+                    time.perf_counter() - start
+                )
+
+
+def instrument_app(app: FastAPI, service: str):
+    """Add request timing middleware and a GET /metrics endpoint"""
+    global SERVICE
+    SERVICE = service
+    app.add_middleware(MetricsMiddleware, service=service)
+
+    @app.get('/metrics', include_in_schema=False)
+    async def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument_agent(agent, name: str):
+    """Time every run of a pydantic-ai Agent and count its tokens"""
+    run = agent.run
+
+    @functools.wraps(run)
+    async def timed_run(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await run(*args, **kwargs)
+            outcome = 'ok'
+        finally:
+            LLM_CALL_SECONDS.labels(SERVICE, name, outcome).observe(time.perf_counter() - start)
+
+        try:
+            input_tokens, output_tokens = usage_tokens(result.usage())
+        except Exception:
+            return result
+        LLM_TOKENS.labels(SERVICE, name, 'input').inc(input_tokens)
+        LLM_TOKENS.labels(SERVICE, name, 'output').inc(output_tokens)
+        return result
+
+    agent.run = timed_run
+    return agent
+
+
+@asynccontextmanager
+async def track_background(task: str):
+    """Count a background task as in flight and time it"""
+    in_flight = BACKGROUND_TASKS_IN_FLIGHT.labels(SERVICE, task)
+    in_flight.inc()
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        in_flight.dec()
+        BACKGROUND_TASK_SECONDS.labels(SERVICE, task, outcome).observe(time.perf_counter() - start)
+
+
+def record_dataset(source: str, size: int):
+    DATASET_ITEMS.labels(SERVICE, source).observe(size)
+
+
+def count_items(source: str, stage: str, count: int = 1):
+    """Counter for items saved/classified/synced per source"""
+    if count:
+        ITEMS_TOTAL.labels(SERVICE, source, stage).inc(count)
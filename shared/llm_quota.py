@@ -0,0 +1,269 @@
+"""
+Shared LLM rate limiter: one token bucket per API key, across processes
+
+Usage:
+    from shared.llm_quota import limit_agent
+
+    limit_agent(classifier_agent, 'batch')        # waits for capacity before every run
+    limit_agent(extraction_agent, 'interactive')  # never waits, only debits
+
+Everything that calls Gemini on the shared key draws from the same bucket
+(llm_quota_buckets, migrations/016_llm_quota.sql). Priority classes differ
+only in how low they may take the bucket:
+
+- interactive: down to -capacity. Never waits - the debit runs alongside
+  the call - so live traffic keeps its latency and pushes the bucket into
+  debt instead
+- batch: only while more than LLM_QUOTA_BATCH_RESERVE of capacity is left,
+  so backlog runs use the whole rate when the site is idle and stand back
+  as soon as voice traffic picks up
+
+A 429 empties the bucket for LLM_QUOTA_429_PENALTY seconds' worth of refill,
+so batch workers back off together instead of retrying into the limit.
+
+Backends (LLM_QUOTA_BACKEND): postgres (default when DATABASE_URL is set),
+socket - a local stand-in for development, `python -m shared.llm_quota serve`
+- or off.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+LLM_QUOTA_BACKEND = os.getenv('LLM_QUOTA_BACKEND', 'postgres' if os.getenv('DATABASE_URL') else 'off')
+LLM_QUOTA_BUCKET = os.getenv('LLM_QUOTA_BUCKET', 'gemini')
+LLM_QUOTA_SOCKET = os.getenv('LLM_QUOTA_SOCKET', '/tmp/llm-quota.sock')
+LLM_QUOTA_BATCH_RESERVE = float(os.getenv('LLM_QUOTA_BATCH_RESERVE', '0.3'))
+LLM_QUOTA_429_PENALTY = float(os.getenv('LLM_QUOTA_429_PENALTY', '10'))
+
+# Lowest bucket level a class may take, as a fraction of capacity
+PRIORITY_FLOORS = {
+    'interactive': -1.0,
+    'batch': LLM_QUOTA_BATCH_RESERVE,
+}
+
+# Longest single sleep before asking again - other workers' debits and
+# penalties change the answer
+MAX_WAIT_SLICE = 5.0
+
+
+class QuotaBackend(ABC):
+    """Atomic take / penalize on a named bucket"""
+
+    @abstractmethod
+    async def take(self, bucket: str, cost: float, floor: float) -> float:
+        """Debit cost if the bucket stays at or above floor; else seconds until it would"""
+
+    @abstractmethod
+    async def penalize(self, bucket: str, seconds: float):
+        """Drop the bucket to `seconds` of refill below empty"""
+
+
+class PostgresQuota(QuotaBackend):
+    """llm_quota_take / llm_quota_penalize from migrations/016_llm_quota.sql"""
+
+    def __init__(self, database_url: str = None):
+        self.database_url = database_url or os.environ['DATABASE_URL']
+        self.pool = None
+
+    async def get_pool(self):
+        if self.pool is None:
+            import asyncpg
+            self.pool = await asyncpg.create_pool(self.database_url, min_size=1, max_size=2)
+        return self.pool
+
+    async def take(self, bucket: str, cost: float, floor: float) -> float:
+        pool = await self.get_pool()
+        return await pool.fetchval("SELECT llm_quota_take($1, $2, $3)", bucket, cost, floor)
+
+    async def penalize(self, bucket: str, seconds: float):
+        pool = await self.get_pool()
+        await pool.execute("SELECT llm_quota_penalize($1, $2)", bucket, seconds)
+
+
+@dataclass
+class LocalBucket:
+    capacity: float
+    refill_per_second: float
+    tokens: float
+    updated_at: float
+
+    def level(self, now: float) -> float:
+        return min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+
+
+class LocalBuckets:
+    """In-memory version of the SQL functions, served over the stand-in socket"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.buckets: dict[str, LocalBucket] = {}
+
+    def bucket(self, name: str) -> LocalBucket:
+        if name not in self.buckets:
+            self.buckets[name] = LocalBucket(self.capacity, self.refill_per_second, self.capacity, time.monotonic())
+        return self.buckets[name]
+
+    def take(self, name: str, cost: float, floor: float) -> float:
+        b, now = self.bucket(name), time.monotonic()
+        level = b.level(now)
+        if level - cost < floor * b.capacity:
+            return (floor * b.capacity + cost - level) / b.refill_per_second
+        b.tokens, b.updated_at = level - cost, now
+        return 0.0
+
+    def penalize(self, name: str, seconds: float):
+        b, now = self.bucket(name), time.monotonic()
+        b.tokens, b.updated_at = min(b.level(now), -seconds * b.refill_per_second), now
+
+
+class SocketQuota(QuotaBackend):
+    """Client for `python -m shared.llm_quota serve` - one JSON line per request"""
+
+    def __init__(self, path: str = LLM_QUOTA_SOCKET):
+        self.path = path
+        self.streams = None
+        self.lock = asyncio.Lock()
+
+    async def call(self, request: dict) -> dict:
+        async with self.lock:
+            if self.streams is None:
+                self.streams = await asyncio.open_unix_connection(self.path)
+            reader, writer = self.streams
+            try:
+                writer.write(json.dumps(request).encode() + b'\n')
+                await writer.drain()
+                return json.loads(await reader.readline())
+            except Exception:
+                self.streams = None
+                raise
+
+    async def take(self, bucket: str, cost: float, floor: float) -> float:
+        return (await self.call({'op': 'take', 'bucket': bucket, 'cost': cost, 'floor': floor}))['wait']
+
+    async def penalize(self, bucket: str, seconds: float):
+        await self.call({'op': 'penalize', 'bucket': bucket, 'seconds': seconds})
+
+
+async def serve(path: str, capacity: float, refill_per_second: float):
+    """Quota stand-in for machines without the shared database"""
+    buckets = LocalBuckets(capacity, refill_per_second)
+
+    async def handle(reader, writer):
+        while line := await reader.readline():
+            request = json.loads(line)
+            if request['op'] == 'take':
+                reply = {'wait': buckets.take(request['bucket'], request['cost'], request['floor'])}
+            else:
+                buckets.penalize(request['bucket'], request['seconds'])
+                reply = {}
+            writer.write(json.dumps(reply).encode() + b'\n')
+            await writer.drain()
+        writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path)
+    logger.info("LLM quota stand-in on %s: capacity %s, %s/s", path, capacity, refill_per_second)
+    async with server:
+        await server.serve_forever()
+
+
+_backend: QuotaBackend | None = None
+# Background debits still in flight - held so they aren't garbage collected
+_debits: set[asyncio.Task] = set()
+
+
+def get_backend() -> QuotaBackend | None:
+    global _backend
+    if _backend is None and LLM_QUOTA_BACKEND != 'off':
+        _backend = SocketQuota() if LLM_QUOTA_BACKEND == 'socket' else PostgresQuota()
+    return _backend
+
+
+async def _debit(backend: QuotaBackend, bucket: str, cost: float, floor: float):
+    try:
+        await backend.take(bucket, cost, floor)
+    except Exception as e:
+        logger.warning("LLM quota debit failed: %s", e)
+
+
+async def acquire(priority: str = 'batch', cost: float = 1, bucket: str = LLM_QUOTA_BUCKET):
+    """Wait until `priority` may spend `cost` from the bucket, then spend it"""
+    backend = get_backend()
+    if backend is None:
+        return
+    floor = PRIORITY_FLOORS[priority]
+    if floor < 0:
+        # Interactive: debit in the background, never in front of the call
+        task = asyncio.ensure_future(_debit(backend, bucket, cost, floor))
+        _debits.add(task)
+        task.add_done_callback(_debits.discard)
+        return
+    while True:
+        try:
+            wait = await backend.take(bucket, cost, floor)
+        except Exception as e:
+            # An unreachable limiter mustn't stop the pipeline
+            logger.warning("LLM quota unavailable, not waiting: %s", e)
+            return
+        if wait <= 0:
+            return
+        # Jittered so workers released by the same refill don't all ask at once
+        await asyncio.sleep(min(wait, MAX_WAIT_SLICE) * random.uniform(1.0, 1.2))
+
+
+async def report_rate_limited(bucket: str = LLM_QUOTA_BUCKET):
+    """Call on a 429 from the provider"""
+    backend = get_backend()
+    if backend is None:
+        return
+    try:
+        await backend.penalize(bucket, LLM_QUOTA_429_PENALTY)
+    except Exception as e:
+        logger.warning("LLM quota penalty failed: %s", e)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, 'status_code', None) == 429
+
+
+def limit_agent(agent, priority: str, bucket: str = LLM_QUOTA_BUCKET):
+    """Acquire quota before every run of a pydantic-ai Agent"""
+    run = agent.run
+
+    @functools.wraps(run)
+    async def limited_run(*args, **kwargs):
+        await acquire(priority, bucket=bucket)
+        try:
+            return await run(*args, **kwargs)
+        except Exception as e:
+            if is_rate_limited(e):
+                await report_rate_limited(bucket)
+            raise
+
+    agent.run = limited_run
+    return agent
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Local LLM quota stand-in (LLM_QUOTA_BACKEND=socket)')
+    parser.add_argument('command', choices=['serve'])
+    parser.add_argument('--socket', default=LLM_QUOTA_SOCKET)
+    parser.add_argument('--capacity', type=float, default=100, help='Burst size, in requests')
+    parser.add_argument('--refill', type=float, default=16.0, help='Requests per second (~1000 RPM)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args.socket, args.capacity, args.refill))
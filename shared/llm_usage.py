@@ -0,0 +1,18 @@
+"""
+pydantic-ai usage accounting shared by shared/instrumentation.py and
+scripts/pipeline_metrics.py
+
+Dependency-free, so scripts can import it without the services' FastAPI and
+prometheus_client.
+"""
+
+
+def usage_tokens(usage) -> tuple[int, int]:
+    """(input, output) tokens from a pydantic-ai Usage across its field renames"""
+    input_tokens = getattr(usage, 'input_tokens', None)
+    if input_tokens is None:
+        input_tokens = getattr(usage, 'request_tokens', None)
+    output_tokens = getattr(usage, 'output_tokens', None)
+    if output_tokens is None:
+        output_tokens = getattr(usage, 'response_tokens', None)
+    return input_tokens or 0, output_tokens or 0
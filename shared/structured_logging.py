@@ -0,0 +1,178 @@
+"""
+Non-blocking, sampled JSON-lines logging for the services and scripts
+
+Usage:
+    from shared.structured_logging import configure_logging
+
+    configure_logging('apify-sync', sample={'webhook.payload': 0.1})
+    logger = logging.getLogger(__name__)
+
+    logger.info("Payload: %s", payload, extra={'event': 'webhook.payload'})
+
+Callers only enqueue the record: a QueueListener thread does the %-formatting,
+JSON encoding and the write to stdout. Arguments are cut down before they are
+queued (long strings sliced, containers reprlib-ed), so a large payload costs
+the same as a small one and can't be mutated before the writer gets to it.
+
+Sampling is per event - the record's `event` extra, or its format string when
+there is none - and never drops warnings or errors. LOG_SAMPLE_RATES
+(`webhook.payload=0.1,classify.job=0.25`) overrides the rates given in code,
+LOG_LEVEL sets the level and LOG_FORMAT=text gives plain lines for a terminal.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import reprlib
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+MAX_ARG_CHARS = 500
+QUEUE_SIZE = 10000
+
+# Attributes every LogRecord has - anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_repr = reprlib.Repr()
+_repr.maxstring = MAX_ARG_CHARS
+_repr.maxother = MAX_ARG_CHARS
+_repr.maxlevel = 3
+_repr.maxdict = _repr.maxlist = _repr.maxtuple = _repr.maxset = 20
+
+_listener: Optional[QueueListener] = None
+
+
+def truncate(value):
+    """A bounded-cost stand-in for a log argument"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= MAX_ARG_CHARS else f"{value[:MAX_ARG_CHARS]}…[{len(value)} chars]"
+    return _repr.repr(value)
+
+
+def parse_rates(spec: str) -> dict[str, float]:
+    """'event=0.1,other=0.5' -> {'event': 0.1, 'other': 0.5}"""
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        event, _, rate = part.partition('=')
+        rates[event.strip()] = float(rate)
+    return rates
+
+
+def event_name(record: logging.LogRecord) -> str:
+    return getattr(record, 'event', None) or str(record.msg)
+
+
+class SampleFilter(logging.Filter):
+    """Keeps a `rate` fraction of each sampled event; INFO and below only"""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(event_name(record))
+        if rate is None:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Enqueues records without formatting them; drops (and counts) when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.args, dict):
+            record.args = {k: truncate(v) for k, v in record.args.items()}
+        elif record.args:
+            record.args = tuple(truncate(arg) for arg in record.args)
+        if not isinstance(record.msg, str):
+            record.msg = truncate(record.msg)
+        if record.exc_info and not record.exc_text:
+            # Tracebacks hold frames that keep changing - render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.dropped:
+            record.dropped_before = self.dropped
+        try:
+            self.queue.put_nowait(record)
+            self.dropped = 0
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, service, logger, event, msg and any extras"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'service': self.service,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(
+    service: str,
+    level: Optional[str] = None,
+    sample: Optional[dict[str, float]] = None,
+    stream=None
+) -> QueueListener:
+    """Route the root logger through a background writer; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    rates = {**(sample or {}), **parse_rates(os.getenv('LOG_SAMPLE_RATES', ''))}
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    if os.getenv('LOG_FORMAT', 'json') == 'text':
+        writer.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    else:
+        writer.setFormatter(JsonFormatter(service))
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    handler = AsyncQueueHandler(log_queue)
+    handler.addFilter(SampleFilter(rates))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, writer, respect_handler_level=False)
+    _listener.start()
+    # Flush what is still queued on interpreter exit
+    atexit.register(_listener.stop)
+    return _listener
+